@@ -1,19 +1,41 @@
 """The Ultimate WhatsApp Home Assistant Bridge."""
+import asyncio
+import json
 import logging
 import aiohttp
-from datetime import timedelta
-from homeassistant.core import HomeAssistant, ServiceCall
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse, callback
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE, EVENT_HOMEASSISTANT_STOP
 from homeassistant.components.http import HomeAssistantView
-from homeassistant.components import frontend, panel_custom
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
-from homeassistant.helpers import config_validation as cv, device_registry as dr
-from .const import DOMAIN
+from homeassistant.components import frontend, panel_custom, websocket_api
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from .const import (
+    DOMAIN, CONF_POLL_FLOOR, CONF_POLL_CEILING, DEFAULT_POLL_FLOOR, DEFAULT_POLL_CEILING,
+    CONF_ATTRIBUTE_WRITE_INTERVAL, DEFAULT_ATTRIBUTE_WRITE_INTERVAL, ATTR_ENGINE, LEGACY_UNIQUE_ID,
+)
+from .coordinator import WhatsAppCoordinator
+from .engine_client import EngineClient, EngineUnavailable
+from .presence_store import PresenceStore, HOUR, DAY
 
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORMS = ["sensor", "binary_sensor"]
 
+SNAPSHOT_VERSION = 1
+
+SERVICES = ("send_message", "modify_chat", "set_presence", "create_group", "track_contact", "untrack_contact",
+            "presence_history")
+
+BUCKETS = {"hour": HOUR, "day": DAY}
+
+# The proxy view and websocket commands can't be unregistered, so they are
+# registered once and find engines per request
+DATA_PROXY_VIEW = f"{DOMAIN}_proxy_view"
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up WhatsApp Bridge from a config entry."""
     hass.data.setdefault(DOMAIN, {})
@@ -23,73 +45,166 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     api_key = entry.data.get("api_key", "")
     
     engine_url = f"http://{host}:{port}"
-    session = aiohttp.ClientSession()
+    engine_key = f"{host}:{port}"
+    client = EngineClient(engine_url, api_key)
+    try:
+        return await _async_setup_engine(hass, entry, client, engine_url, engine_key, api_key)
+    except Exception:
+        # Setup failed (or is retried later): nothing will unload this client
+        hass.data[DOMAIN].pop(entry.entry_id, None)
+        await client.close()
+        raise
 
-    async def async_update_data():
-        """Fetch data from Node Engine."""
-        headers = {"x-api-key": api_key}
-        try:
-            async with session.get(f"{engine_url}/api/instances", headers=headers, timeout=5) as response:
-                if response.status != 200:
-                    raise UpdateFailed(f"Error {response.status}")
-                return await response.json()
-        except Exception as err:
-            raise UpdateFailed(f"Error communicating with engine: {err}")
-
-    coordinator = DataUpdateCoordinator(
+async def _async_setup_engine(hass, entry, client, engine_url, engine_key, api_key):
+    """The part of the setup that runs once the engine client exists."""
+    async def async_close_client(event):
+        await client.close()
+
+    entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, async_close_client))
+
+    # Last good /api/instances response, so entities come up without waiting for the engine
+    snapshot_store = Store(hass, SNAPSHOT_VERSION, f"{DOMAIN}.{entry.entry_id}.instances")
+
+    coordinator = WhatsAppCoordinator(
         hass,
-        _LOGGER,
-        name="whatsapp_instances",
-        update_method=async_update_data,
-        update_interval=timedelta(seconds=10),
+        client,
+        snapshot_store,
+        engine_key,
+        legacy=entry.unique_id in (None, LEGACY_UNIQUE_ID),
+        floor=entry.options.get(CONF_POLL_FLOOR, DEFAULT_POLL_FLOOR),
+        ceiling=entry.options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING),
     )
+    coordinator.attribute_write_interval = entry.options.get(CONF_ATTRIBUTE_WRITE_INTERVAL, DEFAULT_ATTRIBUTE_WRITE_INTERVAL)
+    coordinator.presence = PresenceStore(Store(hass, 1, f"{DOMAIN}.{entry.entry_id}.presence"))
+    await coordinator.presence.async_load()
 
-    # Initial refresh
-    await coordinator.async_config_entry_first_refresh()
-    
+    async def async_close_presence(event):
+        # HA doesn't unload entries when it stops; close online intervals at shutdown too
+        await coordinator.presence.async_unload()
+
+    entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_presence))
+
+    # Restore the last snapshot and refresh in the background, so HA startup
+    # doesn't wait for (or fail on) an engine that is still booting
+    snapshot = await snapshot_store.async_load()
+    if snapshot:
+        _LOGGER.debug(f"Restored WhatsApp instances snapshot from {snapshot['saved_at']}")
+        coordinator.restore(snapshot["instances"])
+    else:
+        coordinator.restore([])
+    entry.async_create_background_task(hass, coordinator.async_refresh(), "whatsapp_hass first refresh")
+
+    async def async_options_updated(hass, entry):
+        coordinator.set_bounds(
+            entry.options.get(CONF_POLL_FLOOR, DEFAULT_POLL_FLOOR),
+            entry.options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING),
+        )
+        coordinator.attribute_write_interval = entry.options.get(CONF_ATTRIBUTE_WRITE_INTERVAL, DEFAULT_ATTRIBUTE_WRITE_INTERVAL)
+
+    entry.async_on_unload(entry.add_update_listener(async_options_updated))
+
+    first_engine = not hass.data[DOMAIN]
     hass.data[DOMAIN][entry.entry_id] = {
+        "entry_id": entry.entry_id,
         "engine_url": engine_url,
         "api_key": api_key,
-        "session": session,
-        "coordinator": coordinator
+        "client": client,
+        "coordinator": coordinator,
+        "stats": client.stats,
     }
 
-    # Register Panel
-    await panel_custom.async_register_panel(
-        hass,
-        webcomponent_name="whatsapp-panel",
-        sidebar_title="WhatsApp",
-        sidebar_icon="mdi:whatsapp",
-        frontend_url_path="whatsapp",
-        module_url="/api/whatsapp_proxy/index.html",
-        embed_iframe=True,
-        require_admin=False,
-    )
+    if first_engine:
+        # Panel and services are shared by all engines
+        await panel_custom.async_register_panel(
+            hass,
+            webcomponent_name="whatsapp-panel",
+            sidebar_title="WhatsApp",
+            sidebar_icon="mdi:whatsapp",
+            frontend_url_path="whatsapp",
+            module_url="/api/whatsapp_proxy/index.html",
+            embed_iframe=True,
+            require_admin=False,
+        )
+        _async_register_services(hass)
+
+    if not hass.data.get(DATA_PROXY_VIEW):
+        hass.http.register_view(WhatsAppProxyView(hass))
+        websocket_api.async_register_command(hass, websocket_presence_histogram)
+        hass.data[DATA_PROXY_VIEW] = True
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    return True
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Unload entry."""
+    unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    data = hass.data[DOMAIN].pop(entry.entry_id)
+    await data["coordinator"].presence.async_unload()
+    await data["client"].close()
+
+    if not hass.data[DOMAIN]:
+        # Last engine gone
+        frontend.async_remove_panel(hass, "whatsapp")
+        for service in SERVICES:
+            hass.services.async_remove(DOMAIN, service)
+
+    return unloaded
+
+
+def _engines(hass):
+    return list(hass.data.get(DOMAIN, {}).values())
+
 
-    # Register Proxy View
-    hass.http.register_view(WhatsAppProxyView(hass, engine_url, api_key))
+def _find_engine(hass, instance_id=None, engine=None):
+    """
+    Entry data of the engine a request is for: the one named by `engine`
+    ("host:port" or entry id), else the one that reports `instance_id`, else
+    the only engine there is.
+    """
+    engines = _engines(hass)
+    if engine:
+        for data in engines:
+            if engine in (data["coordinator"].engine_key, data["entry_id"]):
+                return data
+        raise HomeAssistantError(f"No WhatsApp engine {engine}")
+    if instance_id is not None:
+        owners = [data for data in engines if instance_id in data["coordinator"].instances]
+        if len(owners) == 1:
+            return owners[0]
+        if len(owners) > 1:
+            raise HomeAssistantError(f"Instance {instance_id} exists on several engines, set the engine field")
+    if len(engines) == 1:
+        # Instance list not known yet (engine still starting), or no id given
+        return engines[0]
+    raise HomeAssistantError(f"No WhatsApp engine reports instance {instance_id}")
 
-    # --- SERVICES ---
-    async def engine_api_call(method: str, path: str, data: dict = None):
+
+def _async_register_services(hass):
+    """Domain services, routed to the engine owning the instance."""
+
+    async def engine_api_call(call: ServiceCall, method: str, path: str, data: dict = None):
         """Helper to call Node.js Engine."""
-        url = f"{engine_url}{path}"
-        headers = {"x-api-key": api_key}
+        engine = _find_engine(hass, call.data.get("instance_id", 1), call.data.get(ATTR_ENGINE))
+        client = engine["client"]
         try:
-            async with session.request(method, url, json=data, headers=headers, timeout=10) as response:
-                if response.status >= 400:
-                    _LOGGER.error(f"Engine API Error {response.status} on {path}")
-                    return None
-                return await response.json()
+            status, result = await client.request(method, path, data)
+        except EngineUnavailable as e:
+            _LOGGER.warning(str(e))
+            return None
         except Exception as e:
-            _LOGGER.error(f"Failed to communicate with Node Engine at {url}: {e}")
+            _LOGGER.error(f"Failed to communicate with Node Engine at {client.engine_url}{path}: {e}")
+            return None
+        if status >= 400:
+            _LOGGER.error(f"Engine API Error {status} on {path}")
             return None
+        return result
 
     async def handle_send_message(call: ServiceCall):
         """Send a text message."""
         contact = call.data.get("contact")
         message = call.data.get("message")
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("POST", "/api/send_message", {
+        await engine_api_call(call, "POST", "/api/send_message", {
             "instanceId": instance_id,
             "contact": contact,
             "message": message
@@ -100,84 +215,215 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         jid = call.data.get("jid")
         action = call.data.get("action")
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("POST", f"/api/chats/{instance_id}/{jid}/modify", {"action": action})
+        await engine_api_call(call, "POST", f"/api/chats/{instance_id}/{jid}/modify", {"action": action})
 
     async def handle_set_presence(call: ServiceCall):
         """Set account presence."""
         presence = call.data.get("presence")
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("POST", f"/api/instances/{instance_id}/presence", {"presence": presence})
+        await engine_api_call(call, "POST", f"/api/instances/{instance_id}/presence", {"presence": presence})
 
     async def handle_create_group(call: ServiceCall):
         """Create a new group."""
         title = call.data.get("title")
         participants = call.data.get("participants", [])
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("POST", f"/api/groups/{instance_id}", {"title": title, "participants": participants})
+        await engine_api_call(call, "POST", f"/api/groups/{instance_id}", {"title": title, "participants": participants})
 
     async def handle_track_contact(call: ServiceCall):
         """Track a new contact for social presence."""
         jid = call.data.get("jid")
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("POST", "/api/social/tracked", {"instanceId": instance_id, "jid": jid})
+        await engine_api_call(call, "POST", "/api/social/tracked", {"instanceId": instance_id, "jid": jid})
 
     async def handle_untrack_contact(call: ServiceCall):
         """Stop tracking a contact."""
         jid = call.data.get("jid")
         instance_id = call.data.get("instance_id", 1)
-        await engine_api_call("DELETE", f"/api/social/tracked/{instance_id}/{jid}")
+        await engine_api_call(call, "DELETE", f"/api/social/tracked/{instance_id}/{jid}")
 
-    # Register Services
-    hass.services.async_register(DOMAIN, "send_message", handle_send_message)
-    hass.services.async_register(DOMAIN, "modify_chat", handle_modify_chat)
-    hass.services.async_register(DOMAIN, "set_presence", handle_set_presence)
-    hass.services.async_register(DOMAIN, "create_group", handle_create_group)
-    hass.services.async_register(DOMAIN, "track_contact", handle_track_contact)
-    hass.services.async_register(DOMAIN, "untrack_contact", handle_untrack_contact)
+    async def handle_presence_history(call: ServiceCall):
+        """Online milliseconds per bucket for tracked contacts."""
+        return presence_histograms(
+            hass,
+            call.data.get("instance_id"),
+            call.data.get(ATTR_ENGINE),
+            call.data.get("jid"),
+            call.data["start"],
+            call.data.get("end"),
+            call.data.get("bucket", "hour"),
+        )
 
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-    return True
+    # Register Services; ids from YAML or scripts may be strings, the engine's are ints
+    target = {
+        vol.Optional("instance_id", default=1): vol.Coerce(int),
+        vol.Optional(ATTR_ENGINE): cv.string,
+    }
+    hass.services.async_register(DOMAIN, "send_message", handle_send_message, schema=vol.Schema({
+        **target,
+        vol.Required("contact"): cv.string,
+        vol.Required("message"): cv.string,
+    }))
+    hass.services.async_register(DOMAIN, "modify_chat", handle_modify_chat, schema=vol.Schema({
+        **target,
+        vol.Required("jid"): cv.string,
+        vol.Required("action"): vol.In(("archive", "pin", "delete")),
+    }))
+    hass.services.async_register(DOMAIN, "set_presence", handle_set_presence, schema=vol.Schema({
+        **target,
+        vol.Required("presence"): vol.In(("available", "unavailable")),
+    }))
+    hass.services.async_register(DOMAIN, "create_group", handle_create_group, schema=vol.Schema({
+        **target,
+        vol.Required("title"): cv.string,
+        vol.Required("participants"): vol.All(cv.ensure_list, [cv.string]),
+    }))
+    hass.services.async_register(DOMAIN, "track_contact", handle_track_contact, schema=vol.Schema({
+        **target,
+        vol.Required("jid"): cv.string,
+    }))
+    hass.services.async_register(DOMAIN, "untrack_contact", handle_untrack_contact, schema=vol.Schema({
+        **target,
+        vol.Required("jid"): cv.string,
+    }))
+    hass.services.async_register(
+        DOMAIN,
+        "presence_history",
+        handle_presence_history,
+        schema=vol.Schema({
+            vol.Optional("instance_id"): vol.Coerce(int),
+            vol.Optional(ATTR_ENGINE): cv.string,
+            vol.Optional("jid"): cv.string,
+            vol.Required("start"): cv.datetime,
+            vol.Optional("end"): cv.datetime,
+            vol.Optional("bucket", default="hour"): vol.Any(vol.In(BUCKETS), vol.All(vol.Coerce(int), vol.Range(min=60))),
+        }),
+        supports_response=SupportsResponse.ONLY,
+    )
 
-async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
-    """Unload entry."""
-    data = hass.data[DOMAIN].pop(entry.entry_id)
-    await data["session"].close()
-    
-    frontend.async_remove_panel(hass, "whatsapp")
-    
-    return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+
+def presence_histograms(hass, instance_id, engine, jid, start, end, bucket):
+    """
+    {"start", "end", "bucket_seconds", "contacts": {"<instance id>/<jid>": [ms online per bucket]}}
+    for one contact, or every tracked contact of the instance (or of all instances).
+    """
+    coordinator = _find_engine(hass, instance_id, engine)["coordinator"]
+    bucket_seconds = BUCKETS.get(bucket, bucket)
+    start_ts = dt_util.as_timestamp(start)
+    end_ts = dt_util.as_timestamp(end) if end else dt_util.utcnow().timestamp()
+    if end_ts <= start_ts:
+        raise HomeAssistantError("end must be after start")
+    keys = [key for key in coordinator.presence.contacts(instance_id) if jid in (None, key[1])]
+    return {
+        "start": dt_util.utc_from_timestamp(start_ts).isoformat(),
+        "end": dt_util.utc_from_timestamp(end_ts).isoformat(),
+        "bucket_seconds": bucket_seconds,
+        "contacts": {
+            f"{key[0]}/{key[1]}": coordinator.presence.histogram(key, start_ts, end_ts, bucket_seconds)
+            for key in keys
+        },
+    }
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{DOMAIN}/presence_histogram",
+    vol.Optional("instance_id"): int,
+    vol.Optional(ATTR_ENGINE): str,
+    vol.Optional("jid"): str,
+    vol.Required("start"): str,
+    vol.Optional("end"): str,
+    vol.Optional("bucket", default="hour"): vol.Any(vol.In(BUCKETS), vol.All(int, vol.Range(min=60))),
+})
+@callback
+def websocket_presence_histogram(hass, connection, msg):
+    """Same as the presence_history service, for the panel."""
+    start = dt_util.parse_datetime(msg["start"])
+    end = dt_util.parse_datetime(msg["end"]) if msg.get("end") else None
+    if start is None or (msg.get("end") and end is None):
+        connection.send_error(msg["id"], "invalid_format", "start and end must be ISO datetimes")
+        return
+    # Without an offset the panel's and the server's time zones could disagree
+    if start.tzinfo is None or (end is not None and end.tzinfo is None):
+        connection.send_error(msg["id"], "invalid_format", "start and end need a UTC offset (e.g. 2024-01-31T18:00:00Z)")
+        return
+    try:
+        result = presence_histograms(hass, msg.get("instance_id"), msg.get(ATTR_ENGINE), msg.get("jid"),
+                                     start, end, msg["bucket"])
+    except HomeAssistantError as e:
+        connection.send_error(msg["id"], "not_found", str(e))
+        return
+    connection.send_result(msg["id"], result)
+
+
+def _path_instance_id(path, data):
+    """Instance id a panel request is about: the first numeric path segment or the body's instanceId."""
+    for segment in path.split("/"):
+        if segment.isdigit():
+            return int(segment)
+    if isinstance(data, dict) and "instanceId" in data:
+        return data["instanceId"]
+    return None
 
 
 class WhatsAppProxyView(HomeAssistantView):
-    """Proxy view for WhatsApp Engine."""
+    """
+    Proxy view for the WhatsApp engines. GET api/instances is merged from all
+    engines, each instance tagged with its "engine". Other requests go to the
+    engine in the `engine` query parameter, else the engine owning the
+    instance id in the path or body, else the first engine.
+    """
     url = "/api/whatsapp_proxy/{path:.*}"
     name = "api:whatsapp_proxy"
     requires_auth = True # HA Auth required!
 
-    def __init__(self, hass, engine_url, api_key):
+    def __init__(self, hass):
         self.hass = hass
-        self.engine_url = engine_url
-        self.api_key = api_key
-        self.session = aiohttp.ClientSession()
+
+    async def _merged_instances(self):
+        engines = _engines(self.hass)
+        results = await asyncio.gather(
+            *(data["client"].request("GET", "/api/instances") for data in engines),
+            return_exceptions=True,
+        )
+        merged = []
+        for data, result in zip(engines, results):
+            coordinator = data["coordinator"]
+            if isinstance(result, Exception) or result[0] != 200:
+                # Unreachable engine: show its last known instances instead of nothing
+                instances = coordinator.data or []
+            else:
+                instances = result[1] or []
+            merged.extend(dict(instance, engine=coordinator.engine_key) for instance in instances)
+        return aiohttp.web.Response(text=json.dumps(merged), content_type="application/json")
 
     async def _handle(self, request, path):
-        # Forward request to Node Engine
-        # We forward to the root, so /api/whatsapp_proxy/api/stats -> engine_url/api/stats
-        target_url = f"{self.engine_url}/{path}"
-        
+        if not _engines(self.hass):
+            return aiohttp.web.Response(text="No WhatsApp engine configured", status=503)
+
         method = request.method
+        if method == "GET" and path.strip("/") == "api/instances" and "engine" not in request.query:
+            return await self._merged_instances()
+
         data = None
         if method in ['POST', 'PUT']:
             data = await request.json()
 
-        headers = {"x-api-key": self.api_key}
-        
-        async with self.session.request(method, target_url, json=data, headers=headers) as resp:
-            # Forward response back to UI
-            text = await resp.text()
-            return aiohttp.web.Response(text=text, status=resp.status, content_type=resp.content_type)
+        # Forward request to Node Engine
+        # We forward to the root, so /api/whatsapp_proxy/api/stats -> engine_url/api/stats
+        try:
+            engine = _find_engine(self.hass, _path_instance_id(path, data), request.query.get("engine"))
+        except HomeAssistantError:
+            engine = _engines(self.hass)[0]
+        try:
+            status, body, content_type = await engine["client"].raw_request(method, f"/{path}", data)
+        except EngineUnavailable as e:
+            return aiohttp.web.Response(text=str(e), status=503)
+        except Exception as e:
+            return aiohttp.web.Response(text=f"Engine request failed: {e}", status=502)
+        # Forward response back to UI
+        return aiohttp.web.Response(body=body, status=status, content_type=content_type)
 
     async def get(self, request, path): return await self._handle(request, path)
     async def post(self, request, path): return await self._handle(request, path)
     async def delete(self, request, path): return await self._handle(request, path)
-    async def put(self, request, path): return await self._handle(request, path)
\ No newline at end of file
+    async def put(self, request, path): return await self._handle(request, path)
@@ -1,8 +1,9 @@
 """Binary sensor platform for WhatsApp Pro."""
 import logging
 from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorDeviceClass
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import HomeAssistant
 from .const import DOMAIN
+from .entity import ThrottledWriteMixin, async_track_membership
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -11,40 +12,18 @@ async def async_setup_entry(hass: HomeAssistant, entry, async_add_entities):
     data = hass.data[DOMAIN][entry.entry_id]
     coordinator = data["coordinator"]
 
-    added_jids = set()
-
-    @callback
-    def async_discover_sensors():
-        """Discover new tracked contacts."""
-        new_entities = []
-        for instance in coordinator.data:
-            instance_id = instance["id"]
-            instance_name = instance["name"]
-            tracked_contacts = instance.get("tracked", [])
-            
+    def build_entities(key):
+        instance = coordinator.instances[key[1]]
+        if key[0] == "instance":
             # Also keep the main instance connectivity sensor
-            instance_key = f"instance_{instance_id}"
-            if instance_key not in added_jids:
-                new_entities.append(WhatsAppInstanceBinarySensor(coordinator, instance_id, instance_name))
-                added_jids.add(instance_key)
-
-            for contact in tracked_contacts:
-                jid = contact["jid"]
-                unique_key = f"{instance_id}_{jid}"
-                if unique_key not in added_jids:
-                    new_entities.append(WhatsAppContactBinarySensor(coordinator, instance_id, instance_name, contact))
-                    added_jids.add(unique_key)
-        
-        if new_entities:
-            async_add_entities(new_entities)
+            return [WhatsAppInstanceBinarySensor(coordinator, instance["id"], instance["name"])]
+        contact = coordinator.contacts[key[1:]]
+        return [WhatsAppContactBinarySensor(coordinator, instance["id"], instance["name"], contact)]
 
-    # Register listener for dynamic discovery
-    entry.async_on_unload(coordinator.async_add_listener(async_discover_sensors))
-    
-    # Initial discovery
-    async_discover_sensors()
+    # Adds and removes entities as instances and tracked contacts come and go
+    async_track_membership(hass, entry, coordinator, async_add_entities, build_entities)
 
-class WhatsAppInstanceBinarySensor(BinarySensorEntity):
+class WhatsAppInstanceBinarySensor(ThrottledWriteMixin, BinarySensorEntity):
     """Representation of a WhatsApp Instance Connectivity sensor."""
 
     def __init__(self, coordinator, instance_id, instance_name):
@@ -52,28 +31,28 @@ class WhatsAppInstanceBinarySensor(BinarySensorEntity):
         self.instance_id = instance_id
         self._instance_name = instance_name
         self._attr_name = f"WhatsApp {instance_name} Connectivity"
-        self._attr_unique_id = f"whatsapp_{instance_id}_connectivity"
+        self._attr_unique_id = f"{coordinator.id_prefix}_{instance_id}_connectivity"
         self._attr_device_class = BinarySensorDeviceClass.CONNECTIVITY
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {coordinator.device_identifier(instance_id)},
             "name": f"WhatsApp {instance_name}",
             "manufacturer": "Gemini Ecosystem",
         }
 
     @property
     def is_on(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                return inst["status"] == "connected"
-        return False
-
-    async def async_added_to_hass(self):
-        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
+        inst = self.coordinator.instances.get(self.instance_id)
+        return inst is not None and inst["status"] == "connected"
 
 
-class WhatsAppContactBinarySensor(BinarySensorEntity):
+class WhatsAppContactBinarySensor(ThrottledWriteMixin, BinarySensorEntity):
     """Representation of a Tracked Contact Online Status."""
 
+    # Grows every second a contact is online; only written with other changes or
+    # after the write interval, and kept out of the recorder entirely
+    _volatile_attributes = frozenset({"today_duration_seconds"})
+    _unrecorded_attributes = frozenset({"today_duration_seconds"})
+
     def __init__(self, coordinator, instance_id, instance_name, contact_data):
         self.coordinator = coordinator
         self.instance_id = instance_id
@@ -83,35 +62,26 @@ class WhatsAppContactBinarySensor(BinarySensorEntity):
         
         self._attr_name = self._contact_name
         self.entity_id = f"binary_sensor.wa_social_{jid_prefix}"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_online"
+        self._attr_unique_id = f"{coordinator.id_prefix}_{instance_id}_{self.jid}_online"
         self._attr_device_class = BinarySensorDeviceClass.CONNECTIVITY
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {coordinator.device_identifier(instance_id)},
         }
 
     @property
     def is_on(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return contact.get("presence") == "available"
-        return False
+        contact = self.coordinator.contacts.get((self.instance_id, self.jid))
+        return contact is not None and contact.get("presence") == "available"
 
     @property
     def extra_state_attributes(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return {
-                            "contact_name": self._contact_name,
-                            "status_since": contact.get("status_since"),
-                            "last_seen": contact.get("last_online"),
-                            "today_duration_seconds": contact.get("today_duration"),
-                            "jid": self.jid
-                        }
-        return {}
-
-    async def async_added_to_hass(self):
-        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
\ No newline at end of file
+        contact = self.coordinator.contacts.get((self.instance_id, self.jid))
+        if contact is None:
+            return {}
+        return {
+            "contact_name": self._contact_name,
+            "status_since": contact.get("status_since"),
+            "last_seen": contact.get("last_online"),
+            "today_duration_seconds": contact.get("today_duration"),
+            "jid": self.jid
+        }
@@ -1,6 +1,11 @@
 import voluptuous as vol
 from homeassistant import config_entries, core
-from .const import DOMAIN, CONF_ENGINE_HOST, CONF_ENGINE_PORT, CONF_API_KEY, DEFAULT_ENGINE_PORT, DEFAULT_ENGINE_HOST
+from homeassistant.core import callback
+from .const import (
+    DOMAIN, CONF_ENGINE_HOST, CONF_ENGINE_PORT, CONF_API_KEY, DEFAULT_ENGINE_PORT, DEFAULT_ENGINE_HOST,
+    CONF_POLL_FLOOR, CONF_POLL_CEILING, DEFAULT_POLL_FLOOR, DEFAULT_POLL_CEILING,
+    CONF_ATTRIBUTE_WRITE_INTERVAL, DEFAULT_ATTRIBUTE_WRITE_INTERVAL,
+)
 import logging
 import os
 
@@ -16,6 +21,11 @@ class WhatsAppConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self.qr_base64 = None
         self.monitor_only = False
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return WhatsAppOptionsFlow(config_entry)
+
     async def async_step_user(self, user_input=None):
         """Handle a flow initiated by the user."""
         if user_input is None:
@@ -28,11 +38,18 @@ class WhatsAppConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 }),
             )
 
-        await self.async_set_unique_id("whatsapp_engine")
+        # One entry per engine, so instances can be spread over several hosts
+        engine_key = f"{user_input[CONF_ENGINE_HOST]}:{user_input[CONF_ENGINE_PORT]}"
+        await self.async_set_unique_id(engine_key)
         self._abort_if_unique_id_configured()
+        # The entry from before multi-engine support has a fixed unique id
+        self._async_abort_entries_match({
+            CONF_ENGINE_HOST: user_input[CONF_ENGINE_HOST],
+            CONF_ENGINE_PORT: user_input[CONF_ENGINE_PORT],
+        })
 
         return self.async_create_entry(
-            title="WhatsApp Engine", 
+            title=f"WhatsApp Engine ({engine_key})", 
             data={
                 CONF_ENGINE_HOST: user_input[CONF_ENGINE_HOST],
                 CONF_ENGINE_PORT: user_input[CONF_ENGINE_PORT],
@@ -45,3 +62,33 @@ class WhatsAppConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         # This will be called if the session becomes invalid.
         # We can implement this later.
         pass
+
+
+class WhatsAppOptionsFlow(config_entries.OptionsFlow):
+    """Polling bounds of the engine coordinator and entity write throttling."""
+
+    def __init__(self, config_entry):
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            if user_input[CONF_POLL_CEILING] < user_input[CONF_POLL_FLOOR]:
+                errors["base"] = "invalid_poll_bounds"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self._entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                vol.Required(CONF_POLL_FLOOR, default=options.get(CONF_POLL_FLOOR, DEFAULT_POLL_FLOOR)):
+                    vol.All(int, vol.Range(min=1, max=3600)),
+                vol.Required(CONF_POLL_CEILING, default=options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING)):
+                    vol.All(int, vol.Range(min=1, max=3600)),
+                vol.Required(CONF_ATTRIBUTE_WRITE_INTERVAL,
+                             default=options.get(CONF_ATTRIBUTE_WRITE_INTERVAL, DEFAULT_ATTRIBUTE_WRITE_INTERVAL)):
+                    vol.All(int, vol.Range(min=0, max=86400)),
+            }),
+            errors=errors,
+        )
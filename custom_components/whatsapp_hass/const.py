@@ -4,8 +4,21 @@ DOMAIN = "whatsapp_hass"
 CONF_ENGINE_HOST = "engine_host"
 CONF_ENGINE_PORT = "engine_port"
 CONF_API_KEY = "api_key"
+CONF_POLL_FLOOR = "poll_floor"
+CONF_POLL_CEILING = "poll_ceiling"
+CONF_ATTRIBUTE_WRITE_INTERVAL = "attribute_write_interval"
+# Optional service field selecting an engine ("host:port") when instance ids overlap
+ATTR_ENGINE = "engine"
+
+# Unique id of the entry created before multiple engines were supported
+LEGACY_UNIQUE_ID = "whatsapp_engine"
 
 DEFAULT_ENGINE_HOST = "whatsapp-node"
 DEFAULT_ENGINE_PORT = 5002
+# Bounds of the adaptive polling interval, in seconds
+DEFAULT_POLL_FLOOR = 5
+DEFAULT_POLL_CEILING = 120
+# Minimum seconds between state writes caused only by counters like today_duration_seconds
+DEFAULT_ATTRIBUTE_WRITE_INTERVAL = 300
 
 PLATFORMS = ["sensor", "binary_sensor"]
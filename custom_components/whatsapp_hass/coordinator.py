@@ -0,0 +1,161 @@
+"""Coordinator polling the WhatsApp engine at an activity-driven interval."""
+import collections
+import logging
+import time
+from datetime import timedelta
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN, DEFAULT_POLL_FLOOR, DEFAULT_POLL_CEILING, DEFAULT_ATTRIBUTE_WRITE_INTERVAL
+
+_LOGGER = logging.getLogger(__name__)
+
+# Refreshes come every few seconds; the snapshot only needs to be roughly current
+SNAPSHOT_SAVE_DELAY = 60
+# Growth of the interval per poll that saw no change
+BACKOFF_FACTOR = 1.5
+
+
+def presence_signature(instances):
+    """The parts of /api/instances whose changes should speed up polling."""
+    signature = {}
+    for instance in instances or []:
+        signature[("instance", instance["id"])] = (instance.get("status"), instance.get("presence"))
+        for contact in instance.get("tracked", []):
+            signature[(instance["id"], contact["jid"])] = contact.get("presence")
+    return signature
+
+
+class WhatsAppCoordinator(DataUpdateCoordinator):
+    """
+    Polls /api/instances. Any change in instance status or tracked contact
+    presence drops the interval to the floor; every poll without changes grows
+    it by BACKOFF_FACTOR up to the ceiling. When no instance is connected, or
+    the engine can't be reached, it goes straight to the ceiling, and back to
+    the floor once the engine answers again.
+    """
+
+    def __init__(self, hass, client, snapshot_store, engine_key, legacy=True,
+                 floor=DEFAULT_POLL_FLOOR, ceiling=DEFAULT_POLL_CEILING):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"whatsapp_instances_{engine_key}",
+            update_interval=timedelta(seconds=floor),
+        )
+        self.client = client
+        # "host:port" of the engine, used to route services and panel requests
+        self.engine_key = engine_key
+        # Instance ids are only unique per engine. The first (legacy) engine keeps
+        # the original unique ids and devices; others get theirs prefixed.
+        self.legacy = legacy
+        self.snapshot_store = snapshot_store
+        self.floor = floor
+        self.ceiling = ceiling
+        self.changes_detected = 0
+        # Minimum seconds between writes caused only by volatile attributes
+        self.attribute_write_interval = DEFAULT_ATTRIBUTE_WRITE_INTERVAL
+        # State writes done and skipped by throttled entities
+        self.state_writes = collections.Counter()
+        self._poll_times = collections.deque()
+        self._signature = None
+        # Lookups for entities, rebuilt with every response
+        self.instances = {}
+        self.contacts = {}
+        # ("instance", id) and ("contact", id, jid) keys; the version only
+        # changes when this set does, so platforms can skip reconciling
+        self.members = frozenset()
+        self.membership_version = 0
+        # PresenceStore of the tracked contacts, set up by the entry
+        self.presence = None
+
+    @property
+    def id_prefix(self):
+        """Prefix of entity unique ids."""
+        if self.legacy:
+            return "whatsapp"
+        return f"whatsapp_{self.engine_key.replace(':', '_')}"
+
+    def device_identifier(self, instance_id):
+        if self.legacy:
+            return (DOMAIN, f"instance_{instance_id}")
+        return (DOMAIN, f"{self.engine_key}_instance_{instance_id}")
+
+    def restore(self, instances):
+        """Use instances from the snapshot until the first refresh."""
+        self._index(instances)
+        self.data = instances
+
+    def _index(self, instances):
+        self.instances = {instance["id"]: instance for instance in instances}
+        self.contacts = {
+            (instance["id"], contact["jid"]): contact
+            for instance in instances
+            for contact in instance.get("tracked", [])
+        }
+        members = frozenset(
+            [("instance", instance_id) for instance_id in self.instances]
+            + [("contact", instance_id, jid) for instance_id, jid in self.contacts]
+        )
+        if members != self.members:
+            self.members = members
+            self.membership_version += 1
+            # The engine reports no instances while it starts; never treat that as untracking
+            if self.presence is not None and self.instances:
+                self.presence.retain(self.contacts)
+
+    def set_bounds(self, floor, ceiling):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self._set_interval(self.update_interval.total_seconds())
+
+    def _set_interval(self, seconds):
+        self.update_interval = timedelta(seconds=min(self.ceiling, max(self.floor, seconds)))
+
+    @property
+    def polls_per_hour(self):
+        cutoff = time.monotonic() - 3600
+        while self._poll_times and self._poll_times[0] < cutoff:
+            self._poll_times.popleft()
+        return len(self._poll_times)
+
+    async def _async_update_data(self):
+        """Fetch data from Node Engine."""
+        self._poll_times.append(time.monotonic())
+        with self.client.stats.time_refresh():
+            try:
+                status, instances = await self.client.request("GET", "/api/instances")
+            except Exception as err:
+                self._set_interval(self.ceiling)
+                raise UpdateFailed(f"Error communicating with engine: {err}")
+            if status != 200:
+                self._set_interval(self.ceiling)
+                raise UpdateFailed(f"Error {status}")
+
+        self._adapt_interval(instances)
+        self._index(instances)
+        if self.presence is not None:
+            self.presence.record(self.contacts)
+        if instances != self.data:
+            self.snapshot_store.async_delay_save(
+                lambda: {"saved_at": dt_util.utcnow().isoformat(), "instances": instances},
+                SNAPSHOT_SAVE_DELAY,
+            )
+        return instances
+
+    def _adapt_interval(self, instances):
+        signature = presence_signature(instances)
+        previous, self._signature = self._signature, signature
+        current = self.update_interval.total_seconds()
+        if previous is not None:
+            changed = sum(1 for key in signature.keys() | previous.keys() if signature.get(key) != previous.get(key))
+            self.changes_detected += changed
+        else:
+            changed = 0
+
+        if not any(instance.get("status") == "connected" for instance in instances or []):
+            self._set_interval(self.ceiling)
+        elif changed or not self.last_update_success:
+            # Catch up quickly after changes and after the engine comes back
+            self._set_interval(self.floor)
+        else:
+            self._set_interval(current * BACKOFF_FACTOR)
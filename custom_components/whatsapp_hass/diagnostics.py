@@ -0,0 +1,32 @@
+"""Diagnostics support for WhatsApp Pro."""
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN, CONF_API_KEY
+
+TO_REDACT = {CONF_API_KEY}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry):
+    """Return engine call statistics and coordinator state for a config entry."""
+    data = hass.data[DOMAIN][entry.entry_id]
+    coordinator = data["coordinator"]
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "engine_url": data["engine_url"],
+        "engine_key": coordinator.engine_key,
+        "legacy_unique_ids": coordinator.legacy,
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "update_interval_seconds": coordinator.update_interval.total_seconds() if coordinator.update_interval else None,
+            "instances": len(coordinator.data or []),
+            "poll_floor_seconds": coordinator.floor,
+            "poll_ceiling_seconds": coordinator.ceiling,
+            "polls_per_hour": coordinator.polls_per_hour,
+            "changes_detected": coordinator.changes_detected,
+            "attribute_write_interval_seconds": coordinator.attribute_write_interval,
+            "state_writes": dict(coordinator.state_writes),
+        },
+        "engine_calls": data["stats"].as_dict(),
+        "circuit_breaker": data["client"].breaker.as_dict(),
+    }
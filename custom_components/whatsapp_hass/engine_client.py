@@ -0,0 +1,172 @@
+"""HTTP client for the WhatsApp engine, with a bounded pool and a circuit breaker."""
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from .engine_stats import EngineStats, endpoint_key
+
+_LOGGER = logging.getLogger(__name__)
+
+# Total timeout per endpoint in seconds; the rest use DEFAULT_TIMEOUT
+ENDPOINT_TIMEOUTS = {
+    "GET /api/instances": 5,
+    "POST /api/send_message": 15,
+}
+DEFAULT_TIMEOUT = 10
+# A down engine refuses or drops the connection quickly; don't wait the full timeout for it
+CONNECT_TIMEOUT = 3
+
+
+class EngineUnavailable(Exception):
+    """Raised without contacting the engine while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: requests pass, consecutive failures are counted.
+    Open: after `failure_threshold` failures every request fails immediately
+    until `reset_timeout` has passed.
+    Half-open: one probe request is let through; success closes the breaker,
+    failure opens it again for twice as long (up to `max_reset_timeout`).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=5, max_reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self):
+        """Whether a request may go out now. Moves an expired open breaker to half-open."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            _LOGGER.info("WhatsApp engine reachable again, closing circuit breaker")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self._probing = False
+
+    def abandon(self):
+        """A request was cancelled before it told us anything; let another probe through."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            _LOGGER.warning(f"WhatsApp engine failed {self.failures} times, opening circuit breaker")
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probing = False
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "reset_timeout": self.reset_timeout,
+            "rejected": self.rejected,
+        }
+
+
+class EngineClient:
+    """
+    One per config entry. All engine traffic (coordinator, services, panel proxy)
+    shares its keep-alive connection pool, which is capped so an outage can't
+    pile up sockets, and goes through one circuit breaker.
+    """
+
+    def __init__(self, engine_url, api_key, pool_size=8):
+        self.engine_url = engine_url
+        self.api_key = api_key
+        self.stats = EngineStats()
+        self.breaker = CircuitBreaker()
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=pool_size,
+                limit_per_host=pool_size,
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+        )
+
+    async def close(self):
+        await self._session.close()
+
+    def _timeout(self, method, path):
+        total = ENDPOINT_TIMEOUTS.get(endpoint_key(method, path), DEFAULT_TIMEOUT)
+        return aiohttp.ClientTimeout(total=total, connect=min(CONNECT_TIMEOUT, total))
+
+    async def raw_request(self, method, path, data=None):
+        """
+        Calls the engine and returns (status, body bytes, content type).
+        Raises EngineUnavailable while the breaker is open, and the aiohttp or
+        timeout error of a failed request otherwise.
+        """
+        if not self.breaker.allow():
+            raise EngineUnavailable(f"WhatsApp engine unavailable, not calling {path}")
+
+        endpoint = self.stats.endpoint(method, path)
+        headers = {"x-api-key": self.api_key}
+        body = json.dumps(data).encode() if data is not None else None
+        if body:
+            headers["Content-Type"] = "application/json"
+            endpoint.request_bytes += len(body)
+        started = time.monotonic()
+        try:
+            async with self._session.request(method, f"{self.engine_url}{path}", data=body, headers=headers,
+                                             timeout=self._timeout(method, path)) as response:
+                raw = await response.read()
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except asyncio.TimeoutError:
+            endpoint.timeouts += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            endpoint.errors += 1
+            self.breaker.record_failure()
+            raise
+
+        endpoint.latency.observe(time.monotonic() - started)
+        endpoint.response_bytes += len(raw)
+        endpoint.last_response_bytes = len(raw)
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status >= 400:
+            endpoint.errors += 1
+        return response.status, raw, response.content_type
+
+    async def request(self, method, path, data=None):
+        """Like raw_request, but returns (status, decoded JSON or None)."""
+        status, raw, _ = await self.raw_request(method, path, data)
+        if status >= 400 or not raw:
+            return status, None
+        return status, json.loads(raw)
@@ -0,0 +1,120 @@
+"""Timing and error statistics of calls from HA to the WhatsApp engine."""
+import re
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, cumulative like Prometheus histograms
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Path segments that are ids (instance numbers, JIDs) are folded into one endpoint
+_ID_SEGMENT = re.compile(r"^(\d+|.*@.*)$")
+
+
+def endpoint_key(method, path):
+    """'POST /api/chats/1/123@s.whatsapp.net/modify' -> 'POST /api/chats/:id/:id/modify'."""
+    segments = [":id" if _ID_SEGMENT.match(s) else s for s in path.split("?")[0].split("/")]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else 0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg": round(self.avg, 4),
+            "max": round(self.max, 4),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.latency = _Histogram()
+        self.errors = 0
+        self.timeouts = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.last_response_bytes = 0
+
+    def as_dict(self):
+        return {
+            "latency": self.latency.as_dict(),
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "last_response_bytes": self.last_response_bytes,
+        }
+
+
+class EngineStats:
+    """
+    Collected per config entry. Everything runs on the event loop, so no locking.
+    Latency is measured around the whole HTTP exchange, coordinator refreshes
+    around fetch plus JSON decoding, which tells the network and engine time
+    apart from the time HA spends on the result.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.refresh = _Histogram()
+        self.last_refresh_seconds = None
+        self.failed_refreshes = 0
+
+    def endpoint(self, method, path):
+        key = endpoint_key(method, path)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = _EndpointStats()
+        return stats
+
+    @contextmanager
+    def time_refresh(self):
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.failed_refreshes += 1
+            raise
+        finally:
+            self.last_refresh_seconds = time.monotonic() - started
+            self.refresh.observe(self.last_refresh_seconds)
+
+    @property
+    def total_errors(self):
+        return sum(stats.errors for stats in self.endpoints.values())
+
+    @property
+    def total_timeouts(self):
+        return sum(stats.timeouts for stats in self.endpoints.values())
+
+    @property
+    def average_latency(self):
+        count = sum(stats.latency.count for stats in self.endpoints.values())
+        total = sum(stats.latency.sum for stats in self.endpoints.values())
+        return total / count if count else None
+
+    def as_dict(self):
+        return {
+            "refresh": dict(self.refresh.as_dict(), failed=self.failed_refreshes,
+                            last_seconds=self.last_refresh_seconds),
+            "endpoints": {key: stats.as_dict() for key, stats in sorted(self.endpoints.items())},
+        }
@@ -0,0 +1,122 @@
+"""Shared entity behaviour for WhatsApp Pro."""
+import logging
+import time
+from homeassistant.core import callback
+from homeassistant.helpers import device_registry as dr, entity_platform, entity_registry as er
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@callback
+def async_track_membership(hass, entry, coordinator, async_add_entities, build_entities, keep=()):
+    """
+    Keeps a platform's entities in line with the coordinator's members.
+    `build_entities(key)` returns the entities of one ("instance", id) or
+    ("contact", id, jid) key. Reconciling is a set difference and only runs
+    when the membership version moved, so ordinary refreshes cost nothing.
+    Registry entries of this entry and platform left over from earlier runs
+    (members that went away while HA was down) are removed on the first
+    reconcile, except the unique ids in `keep` (entities added outside
+    membership). Must be called from the platform's async_setup_entry.
+    """
+    entities = {}
+    seen_version = None
+    platform_domain = entity_platform.async_get_current_platform().domain
+    registry_pending = True
+
+    @callback
+    def async_remove_orphans():
+        """Removes registry entries that no current member builds."""
+        entity_registry = er.async_get(hass)
+        current = {entity.unique_id for built in entities.values() for entity in built} | set(keep)
+        for registry_entry in er.async_entries_for_config_entry(entity_registry, entry.entry_id):
+            if registry_entry.domain != platform_domain or registry_entry.unique_id in current:
+                continue
+            _LOGGER.debug(f"Removing {registry_entry.entity_id}, not reported by the engine since the last run")
+            entity_registry.async_remove(registry_entry.entity_id)
+
+        # Instance devices that lost their last entity with that
+        device_registry = dr.async_get(hass)
+        instances = {coordinator.device_identifier(key[1]) for key in entities if key[0] == "instance"}
+        for device in dr.async_entries_for_config_entry(device_registry, entry.entry_id):
+            if device.identifiers & instances or er.async_entries_for_device(entity_registry, device.id):
+                continue
+            device_registry.async_update_device(device.id, remove_config_entry_id=entry.entry_id)
+
+    @callback
+    def async_reconcile():
+        nonlocal seen_version, registry_pending
+        if coordinator.membership_version == seen_version:
+            return
+        seen_version = coordinator.membership_version
+        members = coordinator.members
+
+        new_entities = []
+        for key in members - entities.keys():
+            entities[key] = build_entities(key)
+            new_entities.extend(entities[key])
+
+        # The engine reports no instances while it starts; never treat that as removal
+        removed = entities.keys() - members if members else ()
+        if removed:
+            entity_registry = er.async_get(hass)
+            device_registry = dr.async_get(hass)
+            for key in removed:
+                for entity in entities.pop(key):
+                    _LOGGER.debug(f"Removing {entity.entity_id}, no longer reported by the engine")
+                    if entity.registry_entry:
+                        entity_registry.async_remove(entity.entity_id)
+                    else:
+                        hass.async_create_task(entity.async_remove())
+                if key[0] == "instance":
+                    device = device_registry.async_get_device(identifiers={coordinator.device_identifier(key[1])})
+                    if device:
+                        device_registry.async_update_device(device.id, remove_config_entry_id=entry.entry_id)
+
+        # Only once the engine reported members, for the same reason
+        if registry_pending and members:
+            registry_pending = False
+            async_remove_orphans()
+
+        if new_entities:
+            async_add_entities(new_entities)
+
+    entry.async_on_unload(coordinator.async_add_listener(async_reconcile))
+    async_reconcile()
+
+
+class ThrottledWriteMixin:
+    """
+    Writes state only when it changed. Attributes listed in `_volatile_attributes`
+    (counters that move on nearly every refresh) don't cause a write on their own
+    more often than the coordinator's `attribute_write_interval`, so the recorder
+    doesn't store a new row per refresh for them. Requires `self.coordinator`.
+    """
+
+    _volatile_attributes = frozenset()
+    _written = None
+    _written_volatile = None
+    _written_at = 0.0
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self.coordinator.async_add_listener(self._async_write_if_changed))
+
+    @callback
+    def _async_write_if_changed(self):
+        attributes = self.extra_state_attributes or {}
+        current = (self.state, {k: v for k, v in attributes.items() if k not in self._volatile_attributes})
+        volatile = {k: v for k, v in attributes.items() if k in self._volatile_attributes}
+        now = time.monotonic()
+
+        if current == self._written and (
+            volatile == self._written_volatile
+            or now - self._written_at < self.coordinator.attribute_write_interval
+        ):
+            self.coordinator.state_writes["skipped"] += 1
+            return
+
+        self._written = current
+        self._written_volatile = volatile
+        self._written_at = now
+        self.coordinator.state_writes["written"] += 1
+        self.async_write_ha_state()
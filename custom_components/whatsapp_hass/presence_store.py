@@ -0,0 +1,207 @@
+"""Presence history of tracked contacts: raw transitions plus hourly and daily online rollups."""
+import base64
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+HOUR = 3600
+DAY = 86400
+# Raw transitions are exact but grow with activity; older ranges are answered from rollups
+RAW_RETENTION = 14 * DAY
+HOURLY_RETENTION = 180 * DAY
+
+# Column name -> array typecode
+_COLUMNS = {
+    "times": "d",        # transition times (epoch seconds)
+    "states": "b",       # 1 online, 0 offline, per transition
+    "hour_starts": "q",  # UTC hour of each hourly rollup
+    "hour_online": "d",  # seconds online in that hour
+    "day_starts": "q",   # UTC day of each daily rollup
+    "day_online": "d",
+}
+
+
+class _Series:
+    """Column arrays of one contact. Rows are appended in time order, so lookups bisect."""
+
+    def __init__(self):
+        for name, typecode in _COLUMNS.items():
+            setattr(self, name, array(typecode))
+
+    @property
+    def online_since(self):
+        if self.states and self.states[-1] == 1:
+            return self.times[-1]
+        return None
+
+    def go_offline(self, at):
+        """Closes the open online interval, if any, at `at`. Returns True if there was one."""
+        if self.online_since is None:
+            return False
+        self.add_online(self.online_since, at)
+        self.times.append(at)
+        self.states.append(0)
+        return True
+
+    def add_online(self, start, end):
+        """Adds a finished online interval to the hourly and daily rollups."""
+        for width, starts, online in ((HOUR, self.hour_starts, self.hour_online),
+                                      (DAY, self.day_starts, self.day_online)):
+            position = start
+            while position < end:
+                bucket = int(position // width) * width
+                edge = min(end, bucket + width)
+                if starts and starts[-1] == bucket:
+                    online[-1] += edge - position
+                else:
+                    starts.append(bucket)
+                    online.append(edge - position)
+                position = edge
+
+    def prune(self, now):
+        """
+        Drops raw transitions and hourly rollups past their retention. Cutoffs are
+        day-aligned and the state at the raw cutoff is kept as a transition at the
+        cutoff, so raw data, hourly and daily rollups cover adjacent ranges.
+        """
+        cutoff = int((now - RAW_RETENTION) // DAY) * DAY
+        cut = bisect_right(self.times, cutoff)
+        # Only while a real transition follows, so the current state stays exact
+        if 0 < cut < len(self.times) and self.times[0] < cutoff:
+            state = self.states[cut - 1]
+            del self.times[:cut]
+            del self.states[:cut]
+            self.times.insert(0, cutoff)
+            self.states.insert(0, state)
+        cutoff = int((now - HOURLY_RETENTION) // DAY) * DAY
+        cut = bisect_left(self.hour_starts, cutoff)
+        if cut > 0:
+            del self.hour_starts[:cut]
+            del self.hour_online[:cut]
+
+    def to_dict(self):
+        return {name: base64.b64encode(getattr(self, name).tobytes()).decode() for name in _COLUMNS}
+
+    @classmethod
+    def from_dict(cls, data):
+        series = cls()
+        for name in _COLUMNS:
+            getattr(series, name).frombytes(base64.b64decode(data.get(name, "")))
+        return series
+
+
+class PresenceStore:
+    """
+    Presence transitions per (instance id, jid), kept as parallel typed arrays
+    (8 bytes time + 1 byte state per transition). Online time is rolled up per
+    UTC hour and day when a contact goes offline, so histograms over ranges
+    older than the raw retention come from a few rollup rows. Unloading closes
+    every open interval, and one still open at load (HA didn't shut down
+    cleanly) is closed where it started, so downtime never counts as online.
+    """
+
+    def __init__(self, store, save_delay=300):
+        self._store = store
+        self._save_delay = save_delay
+        self._series = {}
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        for key, columns in data.items():
+            instance_id, jid = key.split("|", 1)
+            series = _Series.from_dict(columns)
+            series.go_offline(series.online_since)
+            self._series[(int(instance_id) if instance_id.isdigit() else instance_id, jid)] = series
+
+    async def async_unload(self, now=None):
+        """Closes open online intervals and saves right away."""
+        now = now or time.time()
+        for series in self._series.values():
+            series.go_offline(now)
+        await self._store.async_save(self._serialize())
+
+    def _serialize(self):
+        now = time.time()
+        for series in self._series.values():
+            series.prune(now)
+        return {f"{instance_id}|{jid}": series.to_dict() for (instance_id, jid), series in self._series.items()}
+
+    def record(self, contacts, now=None):
+        """Records the presence of every contact in `contacts` ({(instance id, jid): contact})."""
+        now = now or time.time()
+        changed = False
+        for key, contact in contacts.items():
+            state = 1 if contact.get("presence") == "available" else 0
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            elif series.states and series.states[-1] == state:
+                continue
+            if not (state == 0 and series.go_offline(now)):
+                series.times.append(now)
+                series.states.append(state)
+            changed = True
+        if changed:
+            self._store.async_delay_save(self._serialize, self._save_delay)
+
+    def retain(self, keys):
+        """Drops the history of every contact not in `keys` (no longer tracked)."""
+        removed = self._series.keys() - set(keys)
+        for key in removed:
+            del self._series[key]
+        if removed:
+            self._store.async_delay_save(self._serialize, self._save_delay)
+
+    def contacts(self, instance_id=None):
+        return [key for key in self._series if instance_id is None or key[0] == instance_id]
+
+    def histogram(self, key, start, end, bucket_seconds, now=None):
+        """
+        Milliseconds online per bucket of `bucket_seconds` from `start` to `end`
+        (epoch seconds). Exact within the raw retention; older time comes from
+        the hourly, then the daily rollups and counts toward the bucket holding
+        the rollup's start.
+        """
+        now = now or time.time()
+        end = min(end, now)
+        count = max(0, math.ceil((end - start) / bucket_seconds))
+        buckets = [0.0] * count
+        series = self._series.get(key)
+        if series is None or not count:
+            return [0] * count
+
+        def add_interval(a, b):
+            a, b = max(a, start), min(b, end)
+            while a < b:
+                index = int((a - start) // bucket_seconds)
+                edge = min(b, start + (index + 1) * bucket_seconds)
+                buckets[index] += edge - a
+                a = edge
+
+        def add_rollup(at, seconds):
+            if start <= at < end:
+                buckets[int((at - start) // bucket_seconds)] += seconds
+
+        times, states = series.times, series.states
+        raw_from = times[0] if times else now
+        first = max(0, bisect_right(times, start) - 1)
+        last = bisect_left(times, end)
+        for i in range(first, min(last + 1, len(times))):
+            if states[i] == 1:
+                add_interval(times[i], times[i + 1] if i + 1 < len(times) else now)
+
+        hourly_from = series.hour_starts[0] if series.hour_starts else raw_from
+        for i in range(bisect_left(series.hour_starts, start - HOUR), len(series.hour_starts)):
+            hour = series.hour_starts[i]
+            if hour + HOUR > raw_from or hour >= end:
+                break
+            add_rollup(hour, series.hour_online[i])
+
+        for i in range(bisect_left(series.day_starts, start - DAY), len(series.day_starts)):
+            day = series.day_starts[i]
+            if day + DAY > hourly_from or day >= end:
+                break
+            add_rollup(day, series.day_online[i])
+
+        return [round(seconds * 1000) for seconds in buckets]
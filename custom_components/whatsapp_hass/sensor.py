@@ -1,97 +1,96 @@
 """Sensor platform for WhatsApp Pro."""
 import logging
-from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime, UnitOfInformation
+from homeassistant.core import HomeAssistant
 from .const import DOMAIN
+from .entity import async_track_membership
 
 _LOGGER = logging.getLogger(__name__)
 
+# (key, name, unit, device class, state class, value from the coordinator)
+ENGINE_DIAGNOSTICS = (
+    ("refresh_duration", "Engine Refresh Duration", UnitOfTime.SECONDS, SensorDeviceClass.DURATION,
+     SensorStateClass.MEASUREMENT, lambda coordinator: _rounded(coordinator.client.stats.last_refresh_seconds)),
+    ("average_latency", "Engine Average Latency", UnitOfTime.SECONDS, SensorDeviceClass.DURATION,
+     SensorStateClass.MEASUREMENT, lambda coordinator: _rounded(coordinator.client.stats.average_latency)),
+    ("errors", "Engine Call Errors", None, None, SensorStateClass.TOTAL_INCREASING,
+     lambda coordinator: coordinator.client.stats.total_errors),
+    ("timeouts", "Engine Call Timeouts", None, None, SensorStateClass.TOTAL_INCREASING,
+     lambda coordinator: coordinator.client.stats.total_timeouts),
+    ("instances_payload", "Engine Instances Payload", UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE,
+     SensorStateClass.MEASUREMENT, lambda coordinator: coordinator.client.stats.endpoint("GET", "/api/instances").last_response_bytes),
+    ("poll_interval", "Engine Poll Interval", UnitOfTime.SECONDS, SensorDeviceClass.DURATION,
+     SensorStateClass.MEASUREMENT, lambda coordinator: coordinator.update_interval.total_seconds()),
+    ("polls_per_hour", "Engine Polls Per Hour", None, None, SensorStateClass.MEASUREMENT,
+     lambda coordinator: coordinator.polls_per_hour),
+    ("changes_detected", "Engine Changes Detected", None, None, SensorStateClass.TOTAL_INCREASING,
+     lambda coordinator: coordinator.changes_detected),
+)
+
+def _rounded(seconds):
+    return round(seconds, 3) if seconds is not None else None
+
 async def async_setup_entry(hass: HomeAssistant, entry, async_add_entities):
     """Set up the sensor platform."""
     data = hass.data[DOMAIN][entry.entry_id]
     coordinator = data["coordinator"]
 
-    added_jids = set()
-
-    @callback
-    def async_discover_sensors():
-        """Discover new tracked contacts."""
-        new_entities = []
-        for instance in coordinator.data:
-            instance_id = instance["id"]
-            instance_name = instance["name"]
-            tracked_contacts = instance.get("tracked", [])
-            
-            # Instance Status Sensor
-            instance_key = f"instance_status_{instance_id}"
-            if instance_key not in added_jids:
-                new_entities.append(WhatsAppInstanceSensor(coordinator, instance_id, instance_name))
-                added_jids.add(instance_key)
-
-            # Contact Last Messaged Sensors
-            for contact in tracked_contacts:
-                jid = contact["jid"]
-                
-                # Sent
-                sent_key = f"{instance_id}_{jid}_last_sent"
-                if sent_key not in added_jids:
-                    new_entities.append(WhatsAppLastMessageSentSensor(coordinator, instance_id, instance_name, contact))
-                    added_jids.add(sent_key)
-                
-                # Received
-                received_key = f"{instance_id}_{jid}_last_received"
-                if received_key not in added_jids:
-                    new_entities.append(WhatsAppLastMessageReceivedSensor(coordinator, instance_id, instance_name, contact))
-                    added_jids.add(received_key)
-        
-        if new_entities:
-            async_add_entities(new_entities)
-
-    # Register listener
-    entry.async_on_unload(coordinator.async_add_listener(async_discover_sensors))
-    
-    # Initial discovery
-    async_discover_sensors()
+    # Engine call diagnostics, disabled until the user enables them
+    diagnostics = [
+        WhatsAppEngineDiagnosticSensor(coordinator, entry.entry_id, *description)
+        for description in ENGINE_DIAGNOSTICS
+    ]
+    async_add_entities(diagnostics)
+
+    def build_entities(key):
+        instance = coordinator.instances[key[1]]
+        if key[0] == "instance":
+            return [WhatsAppInstanceSensor(coordinator, instance["id"], instance["name"])]
+        contact = coordinator.contacts[key[1:]]
+        return [
+            WhatsAppLastMessageSentSensor(coordinator, instance["id"], instance["name"], contact),
+            WhatsAppLastMessageReceivedSensor(coordinator, instance["id"], instance["name"], contact),
+        ]
+
+    # Adds and removes entities as instances and tracked contacts come and go
+    async_track_membership(hass, entry, coordinator, async_add_entities, build_entities,
+                           keep=[sensor.unique_id for sensor in diagnostics])
 
 class WhatsAppInstanceSensor(SensorEntity):
->>>>>>> REPLACE
-<<<<<<< SEARCH
-class WhatsAppLastMessagedSensor(SensorEntity):
-    """Representation of Last Outbound Message timestamp."""
+    """Representation of a WhatsApp Instance Status sensor."""
 
-    def __init__(self, coordinator, instance_id, instance_name, contact_data):
+    def __init__(self, coordinator, instance_id, instance_name):
         self.coordinator = coordinator
         self.instance_id = instance_id
-        self.jid = contact_data["jid"]
-        self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
-        
-        self._attr_name = f"Last Messaged {self._contact_name}"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_messaged"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_icon = "mdi:history"
+        self._instance_name = instance_name
+        self._attr_name = f"WhatsApp {instance_name} Status"
+        self._attr_unique_id = f"{coordinator.id_prefix}_{instance_id}_status"
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {coordinator.device_identifier(instance_id)},
+            "name": f"WhatsApp {instance_name}",
+            "manufacturer": "Gemini Ecosystem",
         }
 
     @property
     def state(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return contact.get("last_outbound_timestamp")
-        return None
+        inst = self.coordinator.instances.get(self.instance_id)
+        return inst["status"] if inst else "unknown"
 
     @property
     def extra_state_attributes(self):
+        inst = self.coordinator.instances.get(self.instance_id)
+        if inst is None:
+            return {}
         return {
-            "jid": self.jid,
-            "friendly_name": f"Last Messaged {self._contact_name}"
+            "presence": inst.get("presence", "unknown"),
+            "instance_id": self.instance_id
         }
 
     async def async_added_to_hass(self):
         self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
-=======
+
+
 class WhatsAppLastMessageSentSensor(SensorEntity):
     """Representation of Last Outbound Message timestamp."""
 
@@ -101,65 +100,20 @@ class WhatsAppLastMessageSentSensor(SensorEntity):
         self.jid = contact_data["jid"]
         self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
         jid_prefix = self.jid.split("@")[0]
-        
+
         self._attr_name = f"{self._contact_name} Last Message Sent"
         self.entity_id = f"sensor.wa_last_message_sent_{jid_prefix}"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_sent"
+        self._attr_unique_id = f"{coordinator.id_prefix}_{instance_id}_{self.jid}_last_sent"
         self._attr_device_class = SensorDeviceClass.TIMESTAMP
         self._attr_icon = "mdi:message-arrow-right"
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
-        }
-
-    @property
->>>>>>> REPLACE
-<<<<<<< SEARCH
-class WhatsAppLastMessageReceivedSensor(SensorEntity):
-    """Representation of Last Inbound Message timestamp."""
-
-    def __init__(self, coordinator, instance_id, instance_name, contact_data):
-        self.coordinator = coordinator
-        self.instance_id = instance_id
-        self.jid = contact_data["jid"]
-        self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
-        
-        self._attr_name = f"{self._contact_name} Last Message Received"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_received"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_icon = "mdi:message-arrow-left"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
-        }
-
-    @property
-=======
-class WhatsAppLastMessageReceivedSensor(SensorEntity):
-    """Representation of Last Inbound Message timestamp."""
-
-    def __init__(self, coordinator, instance_id, instance_name, contact_data):
-        self.coordinator = coordinator
-        self.instance_id = instance_id
-        self.jid = contact_data["jid"]
-        self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
-        jid_prefix = self.jid.split("@")[0]
-        
-        self._attr_name = f"{self._contact_name} Last Message Received"
-        self.entity_id = f"sensor.wa_last_message_received_{jid_prefix}"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_received"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_icon = "mdi:message-arrow-left"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {coordinator.device_identifier(instance_id)},
         }
 
     @property
     def native_value(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return contact.get("last_outbound_timestamp")
-        return None
+        contact = self.coordinator.contacts.get((self.instance_id, self.jid))
+        return contact.get("last_outbound_timestamp") if contact else None
 
     @property
     def extra_state_attributes(self):
@@ -171,6 +125,7 @@ class WhatsAppLastMessageReceivedSensor(SensorEntity):
     async def async_added_to_hass(self):
         self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
 
+
 class WhatsAppLastMessageReceivedSensor(SensorEntity):
     """Representation of Last Inbound Message timestamp."""
 
@@ -179,23 +134,21 @@ class WhatsAppLastMessageReceivedSensor(SensorEntity):
         self.instance_id = instance_id
         self.jid = contact_data["jid"]
         self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
-        
+        jid_prefix = self.jid.split("@")[0]
+
         self._attr_name = f"{self._contact_name} Last Message Received"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_received"
+        self.entity_id = f"sensor.wa_last_message_received_{jid_prefix}"
+        self._attr_unique_id = f"{coordinator.id_prefix}_{instance_id}_{self.jid}_last_received"
         self._attr_device_class = SensorDeviceClass.TIMESTAMP
         self._attr_icon = "mdi:message-arrow-left"
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {coordinator.device_identifier(instance_id)},
         }
 
     @property
     def native_value(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return contact.get("last_inbound_timestamp")
-        return None
+        contact = self.coordinator.contacts.get((self.instance_id, self.jid))
+        return contact.get("last_inbound_timestamp") if contact else None
 
     @property
     def extra_state_attributes(self):
@@ -206,73 +159,31 @@ class WhatsAppLastMessageReceivedSensor(SensorEntity):
 
     async def async_added_to_hass(self):
         self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
-    """Representation of a WhatsApp Instance Status sensor."""
 
-    def __init__(self, coordinator, instance_id, instance_name):
-        self.coordinator = coordinator
-        self.instance_id = instance_id
-        self._instance_name = instance_name
-        self._attr_name = f"WhatsApp {instance_name} Status"
-        self._attr_unique_id = f"whatsapp_{instance_id}_status"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
-            "name": f"WhatsApp {instance_name}",
-            "manufacturer": "Gemini Ecosystem",
-        }
 
-    @property
-    def state(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                return inst["status"]
-        return "unknown"
+class WhatsAppEngineDiagnosticSensor(SensorEntity):
+    """Timing or error statistic of the calls to the WhatsApp engine."""
 
-    @property
-    def extra_state_attributes(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                return {
-                    "presence": inst.get("presence", "unknown"),
-                    "instance_id": self.instance_id
-                }
-        return {}
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
 
-    async def async_added_to_hass(self):
-        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
-
-
-class WhatsAppLastMessagedSensor(SensorEntity):
-    """Representation of Last Outbound Message timestamp."""
-
-    def __init__(self, coordinator, instance_id, instance_name, contact_data):
+    def __init__(self, coordinator, entry_id, key, name, unit, device_class, state_class, value_fn):
         self.coordinator = coordinator
-        self.instance_id = instance_id
-        self.jid = contact_data["jid"]
-        self._contact_name = contact_data.get("name") or self.jid.split("@")[0]
-        
-        self._attr_name = f"Last Messaged {self._contact_name}"
-        self._attr_unique_id = f"whatsapp_{instance_id}_{self.jid}_last_messaged"
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._attr_icon = "mdi:history"
+        self._value_fn = value_fn
+        self._attr_name = f"WhatsApp {name}"
+        self._attr_unique_id = f"whatsapp_engine_{entry_id}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
         self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"instance_{instance_id}")},
+            "identifiers": {(DOMAIN, f"engine_{entry_id}")},
+            "name": f"WhatsApp Engine {coordinator.engine_key}",
+            "manufacturer": "Gemini Ecosystem",
         }
 
     @property
-    def state(self):
-        for inst in self.coordinator.data:
-            if inst["id"] == self.instance_id:
-                for contact in inst.get("tracked", []):
-                    if contact["jid"] == self.jid:
-                        return contact.get("last_outbound_timestamp")
-        return None
-
-    @property
-    def extra_state_attributes(self):
-        return {
-            "jid": self.jid,
-            "friendly_name": f"Last Messaged {self._contact_name}"
-        }
+    def native_value(self):
+        return self._value_fn(self.coordinator)
 
     async def async_added_to_hass(self):
-        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
\ No newline at end of file
+        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
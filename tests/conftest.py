@@ -0,0 +1,34 @@
+"""Makes the gateway modules and the integration's standalone modules importable."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Gateway modules import each other as top-level modules (python app.py)
+sys.path.insert(0, os.path.join(ROOT, "whatsapp_ui"))
+# Only modules without relative imports or Home Assistant dependencies are tested
+# from here; appended, so the gateway's whatsapp_web_client wins the name clash
+sys.path.append(os.path.join(ROOT, "custom_components", "whatsapp_hass"))
+# The rest of the integration, as custom_components.whatsapp_hass.*
+sys.path.append(ROOT)
+
+
+@pytest.fixture
+def messages_db(tmp_path):
+    """A database with the gateway's messages table, as app.init_db creates it."""
+    db_file = str(tmp_path / "whatsapp.db")
+    conn = sqlite3.connect(db_file)
+    conn.execute('''CREATE TABLE messages
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     account TEXT,
+                     chat_name TEXT,
+                     sender TEXT,
+                     text TEXT,
+                     timestamp TEXT,
+                     UNIQUE(account, chat_name, timestamp, text))''')
+    conn.commit()
+    conn.close()
+    return db_file
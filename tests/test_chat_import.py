@@ -0,0 +1,89 @@
+import sqlite3
+import zipfile
+
+import pytest
+
+from chat_import import (chat_name_from_path, detect_date_order, import_exports, normalise_date, normalise_time,
+                         parse_lines, plan_tasks)
+
+ANDROID = [
+    "31/12/20, 21:41 - Messages and calls are end-to-end encrypted.",
+    "31/12/20, 21:41 - Alice: Happy new year",
+    "almost",
+    "01/01/21, 00:02 - Bob: You too!",
+]
+IOS = [
+    "[12/31/20, 9:41:05 PM] Alice: Happy new year",
+    "[1/1/21, 12:02:00 AM] Bob: You too!",
+]
+
+
+@pytest.mark.parametrize("lines, order", [
+    (ANDROID, "dmy"),
+    (IOS, "mdy"),
+    (["2020-12-31, 21:41 - Alice: Hi"], "ymd"),
+    # Nothing above 12: 24-hour clocks are taken as day-first, AM/PM as US
+    (["01/02/21, 10:00 - Alice: Hi"], "dmy"),
+    (["01/02/21, 10:00 AM - Alice: Hi"], "mdy"),
+])
+def test_detect_date_order(lines, order):
+    assert detect_date_order(lines) == order
+
+
+def test_normalise_date_and_time():
+    assert normalise_date("31", "12", "20", "dmy") == "2020-12-31"
+    assert normalise_date("12", "31", "2020", "mdy") == "2020-12-31"
+    # A line that contradicts the guessed order is swapped back
+    assert normalise_date("12", "31", "20", "dmy") == "2020-12-31"
+    assert normalise_time("9", "41", None, "PM") == "21:41:00"
+    assert normalise_time("12", "02", "00", "a.m.") == "00:02:00"
+
+
+def test_parse_lines_joins_continuations_and_skips_system_lines():
+    rows, system = parse_lines(ANDROID, "dmy")
+    assert rows == [
+        ("Alice", "Happy new year\nalmost", "2020-12-31 21:41:00"),
+        ("Bob", "You too!", "2021-01-01 00:02:00"),
+    ]
+    assert system == 1
+
+
+def test_chat_name_from_path():
+    assert chat_name_from_path("exports/WhatsApp Chat with Alice.txt") == "Alice"
+    assert chat_name_from_path("WhatsApp-Chat mit Bob.zip") == "Bob"
+    assert chat_name_from_path("notes.txt") == "notes"
+
+
+def test_plan_tasks_splits_plain_files_into_ranges(tmp_path):
+    export = tmp_path / "WhatsApp Chat with Alice.txt"
+    export.write_text("\n".join(ANDROID * 10) + "\n", encoding="utf-8")
+
+    tasks = plan_tasks([str(tmp_path)], chunk_size=100)
+    assert {task["chat_name"] for task in tasks} == {"Alice"}
+    assert {task["order"] for task in tasks} == {"dmy"}
+    assert tasks[0]["start"] == 0 and tasks[-1]["end"] == export.stat().st_size
+    assert all(a["end"] == b["start"] for a, b in zip(tasks, tasks[1:]))
+
+
+def test_import_exports_is_idempotent(tmp_path, messages_db):
+    text = tmp_path / "WhatsApp Chat with Alice.txt"
+    text.write_text("\n".join(ANDROID) + "\n", encoding="utf-8")
+    with zipfile.ZipFile(tmp_path / "WhatsApp Chat with Bob.zip", "w") as archive:
+        archive.writestr("WhatsApp Chat with Bob.txt", "\n".join(IOS) + "\n")
+
+    # Small chunks, so messages cross range boundaries
+    stats = import_exports([str(tmp_path)], "Gateway", messages_db, workers=2, chunk_size=40)
+    assert (stats["files"], stats["messages"], stats["inserted"], stats["system"]) == (2, 4, 4, 1)
+
+    conn = sqlite3.connect(messages_db)
+    rows = conn.execute("SELECT chat_name, sender, text, timestamp FROM messages ORDER BY chat_name, timestamp").fetchall()
+    conn.close()
+    assert rows == [
+        ("Alice", "Alice", "Happy new year\nalmost", "2020-12-31 21:41:00"),
+        ("Alice", "Bob", "You too!", "2021-01-01 00:02:00"),
+        ("Bob", "Alice", "Happy new year", "2020-12-31 21:41:05"),
+        ("Bob", "Bob", "You too!", "2021-01-01 00:02:00"),
+    ]
+
+    again = import_exports([str(tmp_path)], "Gateway", messages_db, workers=1)
+    assert (again["messages"], again["inserted"]) == (4, 0)
@@ -0,0 +1,65 @@
+import pytest
+
+# engine_client is part of the integration package, which needs Home Assistant
+pytest.importorskip("homeassistant")
+pytest.importorskip("aiohttp")
+
+from custom_components.whatsapp_hass import engine_client  # noqa: E402
+from custom_components.whatsapp_hass.engine_client import CircuitBreaker  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(engine_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_the_failure_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=5)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+    breaker.record_failure()
+    clock[0] += 5
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_the_timeout_up_to_the_maximum(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, max_reset_timeout=15)
+    breaker.record_failure()
+    for expected in (10, 15, 15):
+        clock[0] += breaker.reset_timeout
+        assert breaker.allow()
+        breaker.record_failure()
+        assert (breaker.state, breaker.reset_timeout) == (CircuitBreaker.OPEN, expected)
+
+    clock[0] += 15
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.reset_timeout == 5
+
+
+def test_abandoned_probe_lets_another_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+    breaker.record_failure()
+    clock[0] += 5
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
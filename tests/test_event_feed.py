@@ -0,0 +1,62 @@
+from event_feed import EventFeed
+
+
+def frames(stream, count):
+    return [next(stream) for _ in range(count)]
+
+
+def test_since_returns_only_newer_events():
+    feed = EventFeed()
+    for n in range(3):
+        feed.publish("message", {"n": n})
+
+    assert [event[0] for event in feed.since(1)] == [2, 3]
+    assert feed.since(3) == []
+
+
+def test_since_cannot_resume_dropped_or_future_ids():
+    feed = EventFeed(maxlen=2)
+    for n in range(4):
+        feed.publish("message", {"n": n})
+
+    # Events 1 and 2 were dropped, so a client at 1 missed one it can't get back
+    assert feed.since(1) is None
+    assert [event[0] for event in feed.since(2)] == [3, 4]
+    # An id this feed never handed out (from before a restart)
+    assert feed.since(10) is None
+
+
+def test_sse_ids_carry_the_boot_id():
+    feed, other = EventFeed(), EventFeed()
+    assert feed.parse_sse_id(feed.sse_id(7)) == 7
+    assert feed.parse_sse_id(other.sse_id(7)) is None
+    assert feed.parse_sse_id("7") is None
+    assert feed.parse_sse_id(None) is None
+
+
+def test_stream_replays_missed_events_for_a_known_id():
+    feed = EventFeed()
+    feed.publish("message", {"n": 1})
+    feed.publish("message", {"n": 2})
+
+    retry, frame = frames(feed.stream(feed.sse_id(1), keepalive=0), 2)
+    assert retry == "retry: 3000\n\n"
+    assert frame == f'id: {feed.sse_id(2)}\nevent: message\ndata: {{"n": 2}}\n\n'
+
+
+def test_stream_resets_clients_of_another_process():
+    feed = EventFeed()
+    feed.publish("message", {"n": 1})
+
+    _, reset = frames(feed.stream(EventFeed().sse_id(1), keepalive=0), 2)
+    assert reset == f"id: {feed.sse_id(1)}\nevent: reset\ndata: {{}}\n\n"
+
+
+def test_stream_skips_events_not_accepted():
+    feed = EventFeed()
+    stream = feed.stream(0, keepalive=0, accept=lambda event_type, data: event_type != "qr")
+    feed.publish("qr", {"image": "..."})
+    feed.publish("status", {"account": "a"})
+
+    _, frame = frames(stream, 2)
+    assert frame.startswith(f"id: {feed.sse_id(2)}\nevent: status\n")
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+from message_export import CSVEncoder, NDJSONEncoder, build_query, iter_batches, stream_export
+
+MESSAGES = [
+    ("Gateway", "Alice", "Alice", "Hi", "2024-01-30 09:00:00"),
+    ("Gateway", "Alice", "Me", 'Hello, "Alice"\nhow are you?', "2024-01-31 18:00:00"),
+    ("Gateway", "Bob", "Bob", "Yo", "2024-02-01 07:30:00"),
+    ("Work", "Alice", "Alice", "Meeting", "2024-02-02 10:00:00"),
+]
+
+
+@pytest.fixture
+def filled_db(messages_db):
+    conn = sqlite3.connect(messages_db)
+    conn.executemany("INSERT INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)", MESSAGES)
+    conn.commit()
+    conn.close()
+    return messages_db
+
+
+def test_build_query_skips_empty_filters():
+    query, params = build_query(account="Gateway", chat_name="", since="2024-01-31", until=None)
+    assert query.endswith("FROM messages WHERE account = ? AND timestamp >= ? ORDER BY id")
+    assert params == ["Gateway", "2024-01-31"]
+    assert "WHERE" not in build_query()[0]
+
+
+@pytest.mark.parametrize("filters, ids", [
+    ({}, [1, 2, 3, 4]),
+    ({"account": "Gateway"}, [1, 2, 3]),
+    ({"chat_name": "Alice"}, [1, 2, 4]),
+    # `until` is exclusive, and dates without a time compare as the start of that day
+    ({"since": "2024-01-31", "until": "2024-02-02"}, [2, 3]),
+    ({"after_id": 2}, [3, 4]),
+])
+def test_filters(filled_db, filters, ids):
+    rows = [row for batch in iter_batches(filled_db, **filters) for row in batch]
+    assert [row[0] for row in rows] == ids
+
+
+def test_iter_batches_reads_through_run(filled_db):
+    calls = []
+
+    def run(fn, *args):
+        calls.append(fn.__name__)
+        return fn(*args)
+
+    batches = list(iter_batches(filled_db, batch_size=3, run=run))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert calls == ["execute", "fetchmany", "fetchmany", "fetchmany"]
+
+
+def test_ndjson_export(filled_db):
+    body = b"".join(stream_export(filled_db, NDJSONEncoder(), batch_size=2, account="Gateway"))
+    lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert [line["id"] for line in lines] == [1, 2, 3]
+    assert lines[1] == {"id": 2, "account": "Gateway", "chat_name": "Alice", "sender": "Me",
+                        "text": 'Hello, "Alice"\nhow are you?', "timestamp": "2024-01-31 18:00:00"}
+
+
+def test_csv_export_quotes_and_keeps_one_header(filled_db):
+    body = b"".join(stream_export(filled_db, CSVEncoder(), batch_size=1, chat_name="Alice"))
+    rows = list(csv.reader(io.StringIO(body.decode("utf-8"), newline="")))
+    assert rows[0] == ["id", "account", "chat_name", "sender", "text", "timestamp"]
+    assert [row[0] for row in rows[1:]] == ["1", "2", "4"]
+    assert rows[2][4] == 'Hello, "Alice"\nhow are you?'
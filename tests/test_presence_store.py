@@ -0,0 +1,99 @@
+import asyncio
+
+from presence_store import DAY, HOUR, RAW_RETENTION, PresenceStore, _Series
+
+
+class MemoryStore:
+    """Stand-in for homeassistant.helpers.storage.Store."""
+
+    def __init__(self, data=None):
+        self.data = data
+
+    async def async_load(self):
+        return self.data
+
+    async def async_save(self, data):
+        self.data = data
+
+    def async_delay_save(self, build, delay):
+        # HA builds the data when the delay runs out, not here
+        self.pending = build
+
+
+KEY = (1, "alice@s.whatsapp.net")
+# Some UTC midnight, so hour boundaries are easy to read
+MIDNIGHT = 1_700_000_000 // DAY * DAY
+
+
+def presence(state):
+    return {KEY: {"presence": "available" if state else "unavailable"}}
+
+
+def test_add_online_splits_intervals_at_hour_and_day_boundaries():
+    series = _Series()
+    series.add_online(MIDNIGHT - 20 * 60, MIDNIGHT + 2 * HOUR + 40 * 60)
+
+    assert list(series.hour_starts) == [MIDNIGHT - HOUR, MIDNIGHT, MIDNIGHT + HOUR, MIDNIGHT + 2 * HOUR]
+    assert list(series.hour_online) == [20 * 60, HOUR, HOUR, 40 * 60]
+    assert list(series.day_starts) == [MIDNIGHT - DAY, MIDNIGHT]
+    assert list(series.day_online) == [20 * 60, 2 * HOUR + 40 * 60]
+
+
+def test_histogram_of_raw_range_starting_partway_through_an_hour():
+    store = PresenceStore(MemoryStore())
+    store.record(presence(True), now=MIDNIGHT + 20 * 60)
+    store.record(presence(False), now=MIDNIGHT + 2 * HOUR + 40 * 60)
+
+    start = MIDNIGHT + 30 * 60
+    buckets = store.histogram(KEY, start, start + 3 * HOUR, HOUR, now=MIDNIGHT + DAY)
+
+    assert buckets == [HOUR * 1000, HOUR * 1000, 10 * 60 * 1000]
+
+
+def test_histogram_of_rolled_up_range_starting_partway_through_an_hour():
+    store = PresenceStore(MemoryStore())
+    store.record(presence(True), now=MIDNIGHT + 20 * 60)
+    store.record(presence(False), now=MIDNIGHT + 2 * HOUR + 40 * 60)
+    # Much later: the raw transitions are pruned and only rollups are left
+    now = MIDNIGHT + RAW_RETENTION + 2 * DAY
+    store.record(presence(True), now=now - HOUR)
+    store._series[KEY].prune(now)
+    assert store._series[KEY].times[0] > MIDNIGHT + DAY
+
+    start = MIDNIGHT + 30 * 60
+    buckets = store.histogram(KEY, start, start + 3 * HOUR, HOUR, now=now)
+
+    # Rollups count toward the bucket holding their start; the hour that began
+    # before the range is left out rather than attributed to it
+    assert buckets == [HOUR * 1000, 40 * 60 * 1000, 0]
+    whole_hours = store.histogram(KEY, MIDNIGHT, MIDNIGHT + 3 * HOUR, HOUR, now=now)
+    assert whole_hours == [40 * 60 * 1000, HOUR * 1000, 40 * 60 * 1000]
+
+
+def test_open_interval_is_closed_at_unload_and_discarded_at_load():
+    asyncio.run(_unload_and_reload())
+
+
+async def _unload_and_reload():
+    backing = MemoryStore()
+    store = PresenceStore(backing)
+    store.record(presence(True), now=MIDNIGHT)
+    await store.async_unload(now=MIDNIGHT + HOUR)
+
+    reloaded = PresenceStore(backing)
+    await reloaded.async_load()
+    assert reloaded.histogram(KEY, MIDNIGHT, MIDNIGHT + 2 * HOUR, HOUR, now=MIDNIGHT + 5 * HOUR) == [HOUR * 1000, 0]
+
+    # Saved while online (HA didn't shut down cleanly): downtime isn't online time
+    crashed = PresenceStore(MemoryStore())
+    crashed.record(presence(True), now=MIDNIGHT)
+    restarted = PresenceStore(MemoryStore(crashed._serialize()))
+    await restarted.async_load()
+    assert restarted.histogram(KEY, MIDNIGHT, MIDNIGHT + 2 * HOUR, HOUR, now=MIDNIGHT + 5 * HOUR) == [0, 0]
+
+
+def test_retain_drops_untracked_contacts():
+    store = PresenceStore(MemoryStore())
+    store.record({KEY: {"presence": "available"}, (2, "bob"): {"presence": "available"}}, now=MIDNIGHT)
+    store.retain({KEY: {}})
+    assert store.contacts() == [KEY]
@@ -0,0 +1,63 @@
+import sqlite3
+
+from response_cache import ResponseCache
+
+
+def test_current_etag_gets_a_304_without_building():
+    cache = ResponseCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return [{"id": 1}]
+
+    status, etag, body = cache.lookup("messages", None, build)
+    assert (status, body) == (200, b'[{"id": 1}]')
+
+    assert cache.lookup("messages", etag, build) == (304, etag, b"")
+    assert cache.lookup("messages", None, build) == (200, etag, body)
+    assert len(builds) == 1
+
+
+def test_bump_changes_the_etag_and_drops_entries():
+    cache = ResponseCache()
+    _, etag, _ = cache.lookup("messages", None, lambda: [1])
+    cache.bump()
+
+    status, new_etag, body = cache.lookup("messages", etag, lambda: [2])
+    assert new_etag != etag
+    assert (status, body) == (200, b"[2]")
+
+
+def test_etags_differ_between_processes():
+    assert ResponseCache().etag != ResponseCache().etag
+
+
+def test_write_during_build_is_not_cached():
+    cache = ResponseCache()
+
+    def build():
+        cache.bump()
+        return ["stale"]
+
+    cache.lookup("messages", None, build)
+    assert cache.lookup("messages", None, lambda: ["fresh"])[2] == b'["fresh"]'
+
+
+def test_commit_from_another_connection_bumps(messages_db):
+    external = []
+    cache = ResponseCache(messages_db, on_external_write=lambda: external.append(1))
+    cache.bump()
+    _, etag, _ = cache.lookup("messages", None, lambda: [])
+
+    conn = sqlite3.connect(messages_db)
+    conn.execute("INSERT INTO messages (account, chat_name, sender, text, timestamp) VALUES ('a', 'c', 's', 't', '2024-01-01 00:00:00')")
+    conn.commit()
+    conn.close()
+
+    status, new_etag, _ = cache.lookup("messages", etag, lambda: [1])
+    assert status == 200 and new_etag != etag
+    assert external == [1]
+    # Seen once; the next lookup is a plain hit
+    assert cache.lookup("messages", new_etag, lambda: [1])[0] == 304
+    assert external == [1]
@@ -0,0 +1,57 @@
+import pytest
+
+import suggestion_batcher
+from suggestion_batcher import TokenBucket, build_prompt, parse_response
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(suggestion_batcher.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def test_token_bucket_spends_the_burst_then_waits_for_the_rate(clock):
+    bucket = TokenBucket(rate=0.5, burst=2)
+    for _ in range(2):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(2.0)
+
+    clock.now += 1.5
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.wait_time() == 0
+
+
+def test_token_bucket_saves_up_at_most_the_burst(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    clock.now += 60
+    for _ in range(2):
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(1.0)
+
+
+def test_build_prompt_numbers_conversations():
+    prompt = build_prompt(["Alice: hi\n", "Bob: yo"])
+    assert "### Conversation 1\nAlice: hi\n" in prompt
+    assert "### Conversation 2\nBob: yo\n" in prompt
+
+
+def test_parse_response_maps_answers_to_conversations():
+    answer = '```json\n{"1": ["Hi!", " Hello "], "3": "Sure"}\n```'
+    assert parse_response(answer, 3) == [["Hi!", "Hello"], None, ["Sure"]]
+
+
+def test_parse_response_accepts_pipes_for_one_conversation():
+    assert parse_response("Hi! | Hello | Hey", 1) == [["Hi!", "Hello", "Hey"]]
+    with pytest.raises(ValueError):
+        parse_response("Hi! | Hello", 2)
@@ -0,0 +1,248 @@
+"""One isolated browser worker process per WhatsApp account."""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from proc_stats import descendants, process_tree_usage
+
+_LOGGER = logging.getLogger(__name__)
+
+RESTART_POLICIES = ("always", "on-failure", "never")
+# Seconds a worker must stay up before its restart count is reset
+STABLE_AFTER = 600
+
+# Context used to create worker processes; see use_start_method()
+_mp_context = multiprocessing.get_context()
+
+# Client methods a worker will run on request
+_ALLOWED_CALLS = ("get_qr_code_or_login", "login_snapshot", "is_logged_in", "send_message", "scrape_all_data", "close")
+
+
+def use_start_method(method):
+    """
+    Selects how worker processes are created ("fork", "spawn", ...). The async
+    server uses "spawn" so workers start from a clean, unpatched interpreter.
+    """
+    global _mp_context
+    _mp_context = multiprocessing.get_context(method)
+
+
+def _worker_main(conn, account, user_data_dir, client_options, autostart):
+    """Entry point of the worker process: owns the browser and serves calls from the pipe."""
+    from whatsapp_web_client import WhatsAppWebClient
+
+    logging.basicConfig(level=logging.INFO)
+    client = WhatsAppWebClient(user_data_dir=user_data_dir, **client_options)
+    if autostart:
+        # Restarted after a crash or memory cap: reopen the stored session
+        try:
+            client.get_qr_code_or_login()
+        except Exception as e:
+            _LOGGER.error(f"[{account}] Failed to reopen session: {e}")
+
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except EOFError:
+            break
+        try:
+            if method not in _ALLOWED_CALLS:
+                raise ValueError(f"Unsupported call: {method}")
+            if method == "scrape_all_data":
+                if kwargs.pop("on_chat", False):
+                    # Stream each chat back as soon as it is scraped
+                    kwargs["on_chat"] = lambda chat, messages: conn.send(("chat", chat, messages))
+                data = client.scrape_all_data(*args, **kwargs)
+                result = (data, client.last_crawl_stats)
+            else:
+                result = getattr(client, method)(*args, **kwargs)
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", str(e)))
+        if method == "close":
+            break
+    client.close()
+
+
+class AccountWorker:
+    """
+    Runs a WhatsAppWebClient for one account in a separate process, with its own
+    profile directory, and mirrors the client's methods by forwarding them over a pipe.
+    """
+
+    def __init__(self, account, user_data_dir, memory_cap_mb=None, restart_policy="on-failure", max_restarts=5,
+                 browser_profile="default", debug=False):
+        if restart_policy not in RESTART_POLICIES:
+            raise ValueError(f"Unknown restart policy: {restart_policy}")
+        self.account = account
+        self.user_data_dir = user_data_dir
+        self.memory_cap_mb = memory_cap_mb
+        self.restart_policy = restart_policy
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.browser_profile = browser_profile
+        self._client_options = {"profile": browser_profile, "debug": debug}
+        self.last_crawl_stats = {}
+        self.last_usage = None
+        self.peak_usage = {"rss_bytes": 0, "cpu_seconds": 0.0}
+        self._process = None
+        self._conn = None
+        self._spawned_at = 0
+        # Monotonic time of the pending restart after a crash, if one is scheduled
+        self._next_restart_at = None
+        self._started = False
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def is_alive(self):
+        return bool(self._process and self._process.is_alive())
+
+    def busy(self):
+        return self._lock.locked()
+
+    def _spawn(self, autostart=False):
+        os.makedirs(self.user_data_dir, exist_ok=True)
+        parent_conn, child_conn = _mp_context.Pipe()
+        self._process = _mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, self.account, self.user_data_dir, self._client_options, autostart),
+            name=f"whatsapp-worker-{self.account}",
+            daemon=True,
+        )
+        self._process.start()
+        self._conn = parent_conn
+        self._spawned_at = time.monotonic()
+        _LOGGER.info(f"[{self.account}] Started browser worker (pid {self._process.pid})")
+
+    def _call(self, method, *args, on_chat=None, **kwargs):
+        with self._lock:
+            if not self.is_alive():
+                self._spawn(autostart=self._started)
+            if on_chat:
+                kwargs["on_chat"] = True
+            self._conn.send((method, args, kwargs))
+            while True:
+                # Poll so a worker that dies mid-call is noticed instead of blocking forever
+                if not self._conn.poll(1):
+                    if not self.is_alive():
+                        raise Exception(f"Browser worker for {self.account} exited")
+                    continue
+                try:
+                    reply = self._conn.recv()
+                except EOFError:
+                    raise Exception(f"Browser worker for {self.account} exited")
+                if reply[0] == "chat":
+                    on_chat(reply[1], reply[2])
+                    continue
+                if reply[0] == "error":
+                    raise Exception(reply[1])
+                return reply[1]
+
+    def get_qr_code_or_login(self):
+        self._started = True
+        return self._call("get_qr_code_or_login")
+
+    def login_snapshot(self):
+        if not self.is_alive():
+            return "not_started", None
+        return tuple(self._call("login_snapshot"))
+
+    def is_logged_in(self):
+        if not self.is_alive():
+            return False
+        return self._call("is_logged_in")
+
+    def send_message(self, contact_name, message):
+        return self._call("send_message", contact_name, message)
+
+    def scrape_all_data(self, state=None, max_chats=10, resume=False, on_chat=None):
+        data, self.last_crawl_stats = self._call("scrape_all_data", state, max_chats=max_chats,
+                                                 resume=resume, on_chat=on_chat)
+        return data
+
+    def _kill_tree(self):
+        # Chromium is a grandchild of the worker, so take the whole tree down with it
+        for pid in descendants(self._process.pid):
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+        self._process.kill()
+        self._process.join(5)
+
+    def close(self):
+        """
+        Stops the worker for good; the supervisor will not restart it. An idle
+        worker closes its browser itself, a busy one (a long scrape holds the
+        pipe) is killed rather than waited for; its caller then gets an error.
+        """
+        self._stopping = True
+        self._started = False
+        self._next_restart_at = None
+        if self.is_alive():
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._conn.send(("close", (), {}))
+                    self._process.join(10)
+                except Exception:
+                    pass
+                finally:
+                    self._lock.release()
+            if self._process.is_alive():
+                self._kill_tree()
+        self._stopping = False
+
+    def supervise(self):
+        """Enforces the memory cap and restart policy. Called periodically by the supervisor."""
+        if self._stopping or not self._started:
+            return
+
+        if self.is_alive():
+            self._next_restart_at = None
+            if self.restarts and time.monotonic() - self._spawned_at > STABLE_AFTER:
+                self.restarts = 0 # Healthy for a while, forgive earlier crashes
+            self.last_usage = process_tree_usage(self._process.pid)
+            if self.last_usage:
+                self.peak_usage["rss_bytes"] = max(self.peak_usage["rss_bytes"], self.last_usage["rss_bytes"])
+                self.peak_usage["cpu_seconds"] = max(self.peak_usage["cpu_seconds"], self.last_usage["cpu_seconds"])
+            if not self.memory_cap_mb or not self.last_usage:
+                return
+            rss_mb = self.last_usage["rss_bytes"] / (1024 * 1024)
+            if rss_mb <= self.memory_cap_mb:
+                return
+            _LOGGER.warning(f"[{self.account}] Browser worker uses {rss_mb:.0f}MB (cap {self.memory_cap_mb}MB), restarting")
+            self._kill_tree()
+            failed = True
+        else:
+            failed = self._process is None or self._process.exitcode != 0
+
+        if self.restart_policy == "never" or (self.restart_policy == "on-failure" and not failed):
+            self._started = False
+            return
+        now = time.monotonic()
+        if self._next_restart_at is None:
+            if self.restarts >= self.max_restarts:
+                _LOGGER.error(f"[{self.account}] Browser worker exceeded {self.max_restarts} restarts, giving up")
+                self._started = False
+                return
+            self.restarts += 1
+            # Back off a little more on every consecutive restart, without holding up the supervisor
+            self._next_restart_at = now + min(30, 2 ** self.restarts)
+            return
+        if now < self._next_restart_at:
+            return
+        # A call in progress respawns the worker itself
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_restart_at = None
+            if not self.is_alive():
+                self._spawn(autostart=True)
+        finally:
+            self._lock.release()
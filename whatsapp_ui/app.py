@@ -1,25 +1,59 @@
-from flask import Flask, render_template, request, jsonify
-import requests
+from flask import Flask, Blueprint, render_template, request, jsonify, Response, stream_with_context
 import logging
 import time
 import os
 import json
 import sqlite3
-import google.generativeai as genai
 from datetime import datetime
-from whatsapp_web_client import WhatsAppWebClient
+import re
+from account_workers import AccountWorker
+from ha_delivery import HADelivery
+from scrape_state import ScrapeState
+from event_feed import EventFeed
+from response_cache import ResponseCache
+from login_session import LoginSession
+from blocking import BoundedExecutor, ExecutorBusy, run_native
+from message_index import MessageIndex
+from suggestion_batcher import SuggestionBatcher, SuggestionTimeout
+from local_suggester import LocalSuggester
+from chat_summary import ChatSummary
+import message_export
+import metrics
 import threading
 
-app = Flask(__name__)
+crawl_rate = metrics.gauge("scrape_chats_per_minute", "Sidebar chats visited per minute in the last scrape")
+crawl_chats = metrics.gauge("scrape_chats_visited", "Sidebar chats visited in the last scrape")
+webhook_messages = metrics.counter("webhook_messages_total", "Messages received on /webhook")
+webhook_latency = metrics.histogram("webhook_request_seconds", "Time to handle a /webhook request",
+                                    buckets=metrics.LATENCY_BUCKETS)
+history_rows = metrics.counter("upload_history_rows_total", "Rows received on /api/upload_history")
+history_rate = metrics.gauge("upload_history_rows_per_second", "Insert rate of the last history upload")
+query_time = metrics.histogram("sqlite_query_seconds", "SQLite time per route, including commit",
+                               buckets=metrics.LATENCY_BUCKETS)
+gemini_latency = metrics.histogram("gemini_request_seconds", "Time for a Gemini suggestion request",
+                                   buckets=metrics.LATENCY_BUCKETS)
+gemini_errors = metrics.counter("gemini_errors_total", "Failed or rejected Gemini suggestion requests")
+browser_step_time = metrics.histogram("selenium_step_seconds", "Duration of browser actions and scrape steps",
+                                      buckets=metrics.LATENCY_BUCKETS)
+monitor_lag = metrics.histogram("monitor_loop_lag_seconds", "How late each monitor iteration started")
+retrieval_latency = metrics.histogram("suggestion_context_seconds", "Time to retrieve past messages for a suggestion prompt",
+                                      buckets=metrics.LATENCY_BUCKETS)
+local_fallbacks = metrics.counter("local_suggestion_fallbacks_total", "Suggestion requests answered by the local model instead of Gemini")
+
+# Routes are registered on the app by create_app()
+bp = Blueprint('gateway', __name__)
 
 # --- Configuration ---
 CONFIG_FILE = 'config.json'
 DB_FILE = 'whatsapp.db'
 config = {}
 
-# Global Client Instance for Gateway Mode
-whatsapp_client = None
-client_lock = threading.Lock()
+# One browser worker process per WhatsApp account, keyed by account name
+SESSION_ROOT = 'whatsapp_sessions'
+workers = {}
+workers_lock = threading.Lock()
+# Pending (or just finished) QR logins, keyed by account name
+login_sessions = {}
 
 def load_config():
     global config
@@ -34,6 +68,7 @@ def load_config():
         config = {
             "ha_url": "",
             "ha_token": "",
+            "ha_webhook_id": "",
             "gemini_api_key": ""
         }
 
@@ -44,12 +79,10 @@ def save_config(new_config):
         with open(CONFIG_FILE, 'w') as f:
             json.dump(config, f, indent=4)
         
-        # Re-configure Gemini if key changed
-        if config.get("gemini_api_key"):
-            genai.configure(api_key=config["gemini_api_key"])
-            global model
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            
+        # Re-configure Gemini on next use in case the key changed
+        global model
+        model = None
+
     except Exception as e:
         logging.error(f"Failed to save config: {e}")
 
@@ -57,6 +90,8 @@ def save_config(new_config):
 def init_db():
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
+    # Readers (exports, dashboards) see a snapshot and never block webhook inserts
+    c.execute("PRAGMA journal_mode=WAL")
     # Messages table
     c.execute('''CREATE TABLE IF NOT EXISTS messages
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -66,84 +101,298 @@ def init_db():
                   text TEXT,
                   timestamp TEXT,
                   UNIQUE(account, chat_name, timestamp, text))''')
+
+    # Per-chat counts and latest message, updated by a trigger on every insert
+    ChatSummary.init_db(c)
     
     # Account Status table
     c.execute('''CREATE TABLE IF NOT EXISTS account_status
                  (account TEXT PRIMARY KEY,
                   status TEXT,
                   last_seen TEXT)''')
+
+    # Outgoing queue for messages pushed to Home Assistant
+    HADelivery.init_db(c)
+
+    # Per-chat high-water marks for incremental scraping
+    ScrapeState.init_db(c)
     conn.commit()
     conn.close()
 
-# Load config on startup
-load_config()
-init_db()
-
-# Initialize Gemini if key exists
+def parse_message_line(msg):
+    """Splits a "[timestamp] Sender: Text" string. Returns (timestamp, sender, text)."""
+    match = re.match(r"\[(.*?)\]\s(.*?):\s(.*)", msg)
+    if match:
+        return match.group(1), match.group(2), match.group(3)
+    return "Unknown", "Unknown", msg
+
+# Live feed of ingested messages and status changes for open dashboards
+event_feed = EventFeed()
+
+# Serialised read responses, invalidated by every write (also from other processes)
+response_cache = ResponseCache(DB_FILE, on_external_write=lambda: notify_external_write())
+
+# Full-text index of the message history, used as long-term context for suggestions
+message_index = MessageIndex(DB_FILE)
+
+# Chat list without scanning messages
+chat_summary = ChatSummary(DB_FILE, on_commit=response_cache.bump)
+
+# Reply suggestions learned from the user's own messages, for instant results and Gemini outages
+local_suggester = LocalSuggester(DB_FILE, lambda: config)
+
+def notify_write(event_type, data):
+    """Called after every committed insert or update of messages or account status."""
+    response_cache.bump()
+    event_feed.publish(event_type, data)
+    if event_type in ("message", "history"):
+        message_index.notify()
+        local_suggester.notify()
+
+def notify_external_write():
+    """Called when rows were committed by another process (chat_import.py)."""
+    event_feed.publish("history", {})
+    message_index.notify()
+    local_suggester.notify()
+
+def cached_json(key, build):
+    """JSON response served from the write-generation cache, with ETag / 304 support."""
+    status, etag, body = response_cache.lookup(key, request.headers.get('If-None-Match'), lambda: run_native(build))
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['ETag'] = etag
+    # Browsers may keep the body but must revalidate it on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Batched push of monitored messages to Home Assistant
+ha_delivery = HADelivery(DB_FILE, lambda: config)
+
+# Blocking dependencies get their own bounded pools, so a slow Gemini response
+# or a stuck browser can never hold more than these threads
+gemini_pool = BoundedExecutor("gemini", max_workers=2, max_queue=8)
+browser_pool = BoundedExecutor("browser", max_workers=4, max_queue=16)
+
+# Long exports each hold a connection and a request thread; more are rejected
+export_slots = threading.BoundedSemaphore(2)
+
+# Gemini model, created on first use so the SDK is only imported when needed
 model = None
-if config.get("gemini_api_key"):
-    genai.configure(api_key=config["gemini_api_key"])
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-# Set up basic logging
-logging.basicConfig(level=logging.INFO)
 
-@app.route('/')
+def get_model():
+    """Returns the Gemini model, or None if no API key is configured."""
+    global model
+    if model is None and config.get("gemini_api_key"):
+        import google.generativeai as genai
+        # REST instead of gRPC: plain sockets, which the gevent server can make cooperative
+        genai.configure(api_key=config["gemini_api_key"], transport="rest")
+        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    return model
+
+def send_suggestion_prompt(prompt, timeout):
+    """Sends one (batched) suggestion prompt to Gemini and returns the answer text."""
+    model = get_model()
+    if model is None:
+        raise RuntimeError("Gemini API Key not configured")
+    with gemini_latency.time():
+        return gemini_pool.run(model.generate_content, prompt, timeout=timeout).text
+
+# Suggestion requests from all chats share rate-limited, batched Gemini calls
+suggestion_batcher = SuggestionBatcher(send_suggestion_prompt, lambda: config)
+
+def create_app():
+    """Loads config, prepares the database and returns the Flask app. Starts no threads."""
+    # Set up basic logging
+    logging.basicConfig(level=logging.INFO)
+    load_config()
+    init_db()
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app
+
+_background_started = False
+
+def start_background_workers():
+    """Starts the worker supervisor and HA delivery. Monitors start with their worker."""
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    threading.Thread(target=supervisor_thread, daemon=True).start()
+    ha_delivery.start()
+    message_index.start()
+    local_suggester.start()
+    chat_summary.start()
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/connect')
+@bp.route('/connect')
 def connect():
     return render_template('connect.html')
 
-@app.route('/api/start_connection', methods=['POST'])
+def default_account():
+    return config.get("account_name", "Gateway")
+
+def request_account():
+    """Account a request targets: ?account=..., an "account" JSON field, or the default one."""
+    data = request.get_json(silent=True) or {}
+    return request.args.get('account') or data.get('account') or default_account()
+
+def profile_dir(account):
+    """Chrome profile directory of an account. Each account gets its own."""
+    options = config.get("accounts", {}).get(account, {})
+    if options.get("profile_dir"):
+        return os.path.abspath(options["profile_dir"])
+    root = os.path.abspath(SESSION_ROOT)
+    if account == default_account() and os.path.isdir(os.path.join(root, "Default")):
+        # Session linked before multi-account support: keep using it
+        return root
+    safe_name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in account)
+    return os.path.join(root, safe_name)
+
+def get_worker(account, create=False):
+    """Returns the browser worker of an account, optionally creating it."""
+    with workers_lock:
+        worker = workers.get(account)
+        if worker is None and create:
+            options = config.get("accounts", {}).get(account, {})
+            worker = AccountWorker(
+                account,
+                profile_dir(account),
+                memory_cap_mb=options.get("memory_cap_mb"),
+                restart_policy=options.get("restart_policy", "on-failure"),
+                max_restarts=options.get("max_restarts", 5),
+                browser_profile=options.get("browser_profile", config.get("browser_profile", "default")),
+                debug=config.get("debug", False),
+            )
+            workers[account] = worker
+            threading.Thread(target=monitoring_thread, args=(worker,), daemon=True).start()
+        return worker
+
+def account_logged_in(worker):
+    """Login state of an account. While a QR login is open it comes from the session cache."""
+    session = login_sessions.get(worker.account)
+    if session and session.active:
+        return session.status == "logged_in"
+    return worker.is_logged_in()
+
+@bp.route('/api/start_connection', methods=['POST'])
 def start_connection():
-    global whatsapp_client
-    with client_lock:
-        if whatsapp_client:
-            whatsapp_client.close()
-        
-        # Sessions will be stored in a local folder
-        session_dir = os.path.abspath("whatsapp_sessions")
-        os.makedirs(session_dir, exist_ok=True)
-        whatsapp_client = WhatsAppWebClient(user_data_dir=session_dir)
-        
-        try:
-            status, data = whatsapp_client.get_qr_code_or_login()
-            return jsonify({"status": status, "qr_code": data})
-        except Exception as e:
-            logging.error(f"Failed to start connection: {e}")
-            return jsonify({"error": str(e)}), 500
+    account = request_account()
+    worker = get_worker(account, create=True)
+    previous = login_sessions.pop(account, None)
+    if previous:
+        previous.stop()
+    # Restart the account's browser so a fresh QR code or session is loaded
+    worker.close()
+    try:
+        with browser_step_time.labels(step="login").time():
+            status, data = browser_pool.run(worker.get_qr_code_or_login)
+    except Exception as e:
+        logging.error(f"Failed to start connection for {account}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    # Watch the QR canvas and push refreshed codes and the final login to the page
+    session = LoginSession(worker, event_feed)
+    login_sessions[account] = session
+    session.start(status, data)
+    return jsonify({"status": status, "qr_code": data, "account": account})
 
-@app.route('/api/check_login', methods=['GET'])
+@bp.route('/api/check_login', methods=['GET'])
 def check_login():
-    if not whatsapp_client:
+    account = request_account()
+    session = login_sessions.get(account)
+    if session and session.active:
+        # Served from the login session; the browser is not touched
+        return jsonify({"status": "qr_pending" if session.status == "qr_code" else session.status})
+
+    worker = get_worker(account)
+    if not worker:
         return jsonify({"status": "not_started"})
     
     try:
-        is_logged_in = whatsapp_client.is_logged_in()
+        is_logged_in = worker.is_logged_in()
         return jsonify({"status": "logged_in" if is_logged_in else "qr_pending"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/settings')
+@bp.route('/api/login_stream', methods=['GET'])
+def login_stream():
+    """Server-sent "qr" and "login" events of one account's QR login."""
+    account = request_account()
+
+    def generate():
+        # Taken before reading the session, so no change can slip in between
+        start_id = event_feed.last_id
+        session = login_sessions.get(account)
+        if session:
+            # Current state first, so a late subscriber doesn't wait for the next change
+            if session.status == "qr_code":
+                yield f"event: qr\ndata: {json.dumps({'account': account, 'qr_code': session.qr_code})}\n\n"
+            else:
+                yield f"event: login\ndata: {json.dumps({'account': account, 'status': session.status})}\n\n"
+        yield from event_feed.stream(start_id, accept=lambda event_type, data: event_type in ("qr", "login") and data.get("account") == account)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/accounts', methods=['GET'])
+def list_accounts():
+    """Browser workers with their process, restart and memory state."""
+    with workers_lock:
+        current = list(workers.values())
+    return jsonify([{
+        "account": worker.account,
+        "pid": worker.pid,
+        "alive": worker.is_alive(),
+        "restarts": worker.restarts,
+        "restart_policy": worker.restart_policy,
+        "memory_cap_mb": worker.memory_cap_mb,
+        "browser_profile": worker.browser_profile,
+        "rss_mb": round(worker.last_usage["rss_bytes"] / (1024 * 1024), 1) if worker.last_usage else None,
+        "peak_rss_mb": round(worker.peak_usage["rss_bytes"] / (1024 * 1024), 1),
+        "cpu_seconds": worker.last_usage["cpu_seconds"] if worker.last_usage else None,
+    } for worker in current])
+
+@bp.route('/settings')
 def settings():
     return render_template('settings.html')
 
-@app.route('/api/settings', methods=['GET', 'POST'])
+@bp.route('/api/settings', methods=['GET', 'POST'])
 def api_settings():
     if request.method == 'GET':
         return jsonify(config)
     elif request.method == 'POST':
         new_settings = request.json
         save_config(new_settings)
+        # Retrains right away if the own sender names changed
+        local_suggester.notify()
         return jsonify({"success": True})
 
-@app.route('/webhook', methods=['POST'])
+@bp.route('/webhook', methods=['POST'])
 def webhook():
     """Endpoint to receive real-time messages from Home Assistant."""
-    data = request.json
+    with webhook_latency.time():
+        return ingest_webhook(request.json)
+
+def insert_message(account, chat_name, sender, text, timestamp):
+    """Stores one message. Returns its id, or None if it was already stored."""
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        c = conn.execute("INSERT OR IGNORE INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                         (account, chat_name, sender, text, timestamp))
+        conn.commit()
+        return c.lastrowid if c.rowcount else None
+    finally:
+        conn.close()
+
+def ingest_webhook(data):
     if data:
+        webhook_messages.inc()
         logging.info(f"Received message via webhook: {data}")
         # data format expected: {sender:..., text:..., timestamp:..., account:..., chat_name:...}
         # Fallbacks for legacy format
@@ -153,29 +402,19 @@ def webhook():
         text = data.get('text', '')
         timestamp = data.get('timestamp', datetime.now().isoformat())
 
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
         try:
-            c.execute("INSERT OR IGNORE INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
-                      (account, chat_name, sender, text, timestamp))
-            conn.commit()
+            with query_time.labels(route="webhook").time():
+                message_id = run_native(insert_message, account, chat_name, sender, text, timestamp)
+            if message_id is not None:
+                notify_write("message", {"id": message_id, "account": account, "chat_name": chat_name,
+                                         "sender": sender, "text": text, "timestamp": timestamp})
         except Exception as e:
             logging.error(f"DB Error: {e}")
-        finally:
-            conn.close()
 
     return "OK", 200
 
-@app.route('/api/upload_history', methods=['POST'])
-def upload_history():
-    """Endpoint to receive bulk history from Home Assistant."""
-    data = request.json
-    account = data.get('account')
-    history = data.get('history', {}) # {chat_name: [messages]}
-    
-    if not account:
-        return jsonify({"error": "Account name required"}), 400
-
+def insert_history(account, history):
+    """Stores {chat_name: ["[timestamp] Sender: Text", ...]} in one transaction. Returns the number of lines."""
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     count = 0
@@ -183,33 +422,55 @@ def upload_history():
         for chat_name, messages in history.items():
             for msg in messages:
                 # msg string format: "[timestamp] Sender: Text"
-                # We need to parse it simply
-                timestamp = "Unknown"
-                sender = "Unknown"
-                text = msg
-                
                 # Simple parsing (matches logic in HA integration)
-                import re
-                match = re.match(r"\[(.*?)\]\s(.*?):\s(.*)", msg)
-                if match:
-                    timestamp = match.group(1)
-                    sender = match.group(2)
-                    text = match.group(3)
-                
+                timestamp, sender, text = parse_message_line(msg)
+
                 c.execute("INSERT OR IGNORE INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
                           (account, chat_name, sender, text, timestamp))
                 count += 1
         conn.commit()
+    finally:
+        conn.close()
+    return count
+
+@bp.route('/api/upload_history', methods=['POST'])
+def upload_history():
+    """Endpoint to receive bulk history from Home Assistant."""
+    data = request.json
+    account = data.get('account')
+    history = data.get('history', {}) # {chat_name: [messages]}
+    
+    if not account:
+        return jsonify({"error": "Account name required"}), 400
+
+    started = time.perf_counter()
+    try:
+        count = run_native(insert_history, account, history)
+        elapsed = time.perf_counter() - started
+        # Parsing and inserting happen together, so the whole loop counts as query time
+        query_time.labels(route="upload_history").observe(elapsed)
+        history_rows.inc(count)
+        history_rate.set(count / elapsed if elapsed else 0)
         logging.info(f"Uploaded {count} historical messages for {account}")
+        # One event for the whole upload; dashboards reload instead of replaying every row
+        if count:
+            notify_write("history", {"account": account, "count": count})
     except Exception as e:
         logging.error(f"DB Error during history upload: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
     return jsonify({"success": True, "count": count})
 
-@app.route('/api/update_status', methods=['POST'])
+def save_status(account, status, last_seen):
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        conn.execute("INSERT OR REPLACE INTO account_status (account, status, last_seen) VALUES (?, ?, ?)",
+                     (account, status, last_seen))
+        conn.commit()
+    finally:
+        conn.close()
+
+@bp.route('/api/update_status', methods=['POST'])
 def update_status():
     """Update connection status for an account."""
     data = request.json
@@ -219,85 +480,197 @@ def update_status():
     if not account or not status:
         return jsonify({"error": "Account and status required"}), 400
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO account_status (account, status, last_seen) VALUES (?, ?, ?)",
-              (account, status, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    last_seen = datetime.now().isoformat()
+    with query_time.labels(route="update_status").time():
+        run_native(save_status, account, status, last_seen)
+    notify_write("status", {"account": account, "status": status, "last_seen": last_seen})
     return jsonify({"success": True})
 
-@app.route('/api/account_status', methods=['GET'])
+@bp.route('/api/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-sent events: "message", "status", "history" and "reset".
+    Resumes after the Last-Event-ID header (sent by EventSource on reconnect)
+    or a last_event_id query parameter.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = Response(stream_with_context(event_feed.stream(last_event_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/account_status', methods=['GET'])
 def get_account_status():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM account_status")
-    rows = c.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    def build():
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        with query_time.labels(route="account_status").time():
+            c.execute("SELECT * FROM account_status")
+            rows = c.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
 
-@app.route('/api/messages', methods=['GET'])
+    return cached_json(('account_status',), build)
+
+@bp.route('/api/messages', methods=['GET'])
 def get_messages():
     """Endpoint for the frontend to fetch messages."""
     # Optional filtering
     account = request.args.get('account')
-    
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    query = "SELECT * FROM messages ORDER BY id DESC LIMIT 50"
-    params = ()
-    
-    if account:
-        query = "SELECT * FROM messages WHERE account = ? ORDER BY id DESC LIMIT 50"
-        params = (account,)
 
-    c.execute(query, params)
-    rows = c.fetchall()
-    conn.close()
-    
-    # Convert rows to dicts and reverse to show oldest first (top to bottom) if desired
-    # or keep newest first. Let's keep newest first for log style.
-    messages = [dict(row) for row in rows]
-    return jsonify(messages)
+    def build():
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        
+        query = "SELECT * FROM messages ORDER BY id DESC LIMIT 50"
+        params = ()
+        
+        if account:
+            query = "SELECT * FROM messages WHERE account = ? ORDER BY id DESC LIMIT 50"
+            params = (account,)
 
-@app.route('/api/generate_suggestions', methods=['POST'])
+        with query_time.labels(route="messages").time():
+            c.execute(query, params)
+            rows = c.fetchall()
+        conn.close()
+        
+        # Keep newest first for log style.
+        return [dict(row) for row in rows]
+
+    return cached_json(('messages', account), build)
+
+@bp.route('/api/chats', methods=['GET'])
+def get_chats():
+    """Chats with message count and latest message, most recently active first."""
+    account = request.args.get('account')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    offset = request.args.get('offset', 0, type=int)
+
+    def build():
+        with query_time.labels(route="chats").time():
+            return chat_summary.list_chats(account, limit, offset)
+
+    return cached_json(('chats', account, limit, offset), build)
+
+@bp.route('/api/export', methods=['GET'])
+def export_messages():
+    """
+    Streams the filtered archive (account, chat_name, since, until, after_id)
+    as ndjson, csv or parquet, one chunk per fetched batch.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in message_export.ENCODERS:
+        return jsonify({"error": f"Unknown format, use one of {', '.join(sorted(message_export.ENCODERS))}"}), 400
+    try:
+        encoder = message_export.ENCODERS[fmt]()
+    except message_export.ExportUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    filters = {key: request.args.get(key) for key in ('account', 'chat_name', 'since', 'until')}
+    filters['after_id'] = request.args.get('after_id', type=int)
+    if not export_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many exports running, try again later"}), 503
+
+    response = Response(stream_with_context(message_export.stream_export(DB_FILE, encoder, run=run_native, **filters)),
+                        mimetype=encoder.content_type)
+    # Runs when the server closes the response, also after a client disconnect
+    response.call_on_close(export_slots.release)
+    response.headers['Content-Disposition'] = f'attachment; filename="whatsapp_messages.{encoder.extension}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/generate_suggestions', methods=['POST'])
 def generate_suggestions():
     """
     Generates reply suggestions using Gemini.
     """
-    conversation = request.json.get('conversation', [])
+    data = request.json
+    conversation = data.get('conversation', [])
     logging.info(f"Generating suggestions for conversation...")
     
+    model = get_model()
     if not model:
-        return jsonify(["Error: Gemini API Key not configured. Please go to Settings."])
+        return local_fallback(conversation, ["Error: Gemini API Key not configured. Please go to Settings."])
+
+    # This request's part of the (possibly shared) prompt
+    prompt = ""
 
-    # Construct prompt
-    prompt = "You are an assistant helping me reply to WhatsApp messages. Here is the conversation history:\n\n"
+    # Earlier messages of the same chat that relate to what is being discussed now
+    last = conversation[-1] if conversation else {}
+    account = data.get('account') or last.get('account')
+    chat_name = data.get('chat_name') or last.get('chat_name')
+    if account and chat_name:
+        recent = conversation[-10:]
+        try:
+            with retrieval_latency.time():
+                context = run_native(
+                    message_index.search, account, chat_name,
+                    [msg.get('text', '') for msg in reversed(recent[-3:])],
+                    k=config.get("suggestion_context_messages", 5),
+                    exclude=[msg.get('text', '') for msg in recent],
+                )
+        except Exception as e:
+            logging.warning(f"Could not retrieve suggestion context: {e}")
+            context = []
+        if context:
+            prompt += "Some earlier messages from this chat that may be relevant:\n\n"
+            for msg in context:
+                prompt += f"[{msg['timestamp']}] {msg['sender']}: {msg['text']}\n"
+            prompt += "\n"
+
+    prompt += "Here is the conversation history:\n\n"
     for msg in conversation[-10:]: # Use last 10 messages for context
         sender = msg.get('sender', 'Unknown')
         text = msg.get('text', '')
         prompt += f"{sender}: {text}\n"
-    
-    prompt += "\nBased on the above, generate 3 distinct, casual, and relevant short replies that I could send next. Mimic the style of the user if possible. Return ONLY the 3 replies, separated by a pipe character (|)."
 
     try:
-        response = model.generate_content(prompt)
-        text_response = response.text.strip()
-        suggestions = [s.strip() for s in text_response.split('|')]
-        # Fallback if splitting fails
-        if len(suggestions) < 2:
-             suggestions = text_response.split('\n')
-        
+        suggestions = suggestion_batcher.submit(prompt, timeout=config.get("suggestion_deadline", 30))
         return jsonify(suggestions[:3])
+    except ExecutorBusy:
+        gemini_errors.inc()
+        logging.warning("Gemini pool saturated, rejecting suggestion request")
+        return local_fallback(conversation, ["Error: Too many suggestion requests, try again shortly."], 503)
+    except SuggestionTimeout as e:
+        gemini_errors.inc()
+        logging.warning(f"Suggestion request timed out: {e}")
+        return local_fallback(conversation, ["Error: Suggestions took too long, try again shortly."], 504)
     except Exception as e:
+        gemini_errors.inc()
         logging.error(f"Gemini API Error: {e}")
-        return jsonify(["Error generating suggestions."])
+        return local_fallback(conversation, ["Error generating suggestions."])
+
+def local_fallback(conversation, error, status=200):
+    """Local model suggestions when Gemini can't answer, else the error."""
+    try:
+        suggestions = local_suggester.suggest(conversation)
+    except Exception as e:
+        logging.error(f"Local suggestion error: {e}")
+        suggestions = []
+    if not suggestions:
+        return jsonify(error), status
+    local_fallbacks.inc()
+    response = jsonify(suggestions)
+    response.headers['X-Suggestion-Source'] = 'local'
+    return response
+
+@bp.route('/api/suggestions/local', methods=['POST'])
+def local_suggestions():
+    """
+    Instant reply suggestions from the local model (no network), shown while
+    Gemini is still working.
+    """
+    conversation = request.json.get('conversation', [])
+    return jsonify(local_suggester.suggest(conversation))
 
 
-@app.route('/api/send_message', methods=['POST'])
+@bp.route('/api/send_message', methods=['POST'])
 def send_message():
     """Endpoint for the frontend to send a message via Home Assistant."""
     data = request.json
@@ -325,8 +698,9 @@ def send_message():
         "message": message,
     }
 
+    import requests
     try:
-        response = requests.post(service_url, headers=headers, json=payload)
+        response = requests.post(service_url, headers=headers, json=payload, timeout=10)
         response.raise_for_status()
         logging.info(f"Successfully called send_message service for contact: {contact} from {sender}")
         return jsonify({"success": True, "ha_response": response.json()})
@@ -334,53 +708,115 @@ def send_message():
         logging.error(f"Error calling Home Assistant service: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/proxy_send_message', methods=['POST'])
+@bp.route('/api/proxy_send_message', methods=['POST'])
 def proxy_send_message():
     """Endpoint for HA to send a message via this gateway's browser."""
     data = request.json
     contact = data.get('contact')
     message = data.get('message')
 
-    if not whatsapp_client:
+    worker = get_worker(request_account())
+    if not worker or not worker.is_alive():
         return jsonify({"error": "WhatsApp client not running on gateway"}), 500
 
     try:
-        whatsapp_client.send_message(contact, message)
+        with browser_step_time.labels(step="send_message").time():
+            browser_pool.run(worker.send_message, contact, message)
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def monitoring_thread():
-    """Background task to poll WhatsApp and push to HA."""
-    logging.info("Starting monitoring thread...")
-    logged_messages = set()
-    while True:
-        if whatsapp_client and whatsapp_client.is_logged_in():
+@bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Gateway metrics (HA delivery lag, batch sizes, ...)."""
+    return jsonify(metrics.snapshot())
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """The same metrics in the Prometheus text format, for scraping."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def queue_scraped_messages(account, chat, messages):
+    """Queue freshly scraped messages of one chat for delivery to HA."""
+    for msg in messages:
+        logging.info(f"New message from {chat}: {msg}")
+        timestamp, sender, text = parse_message_line(msg)
+        ha_delivery.enqueue(account, chat, {"sender": sender, "text": text, "timestamp": timestamp})
+
+def run_scrape(worker, max_chats, resume=False):
+    account = worker.account
+    worker.scrape_all_data(
+        ScrapeState(DB_FILE, account),
+        max_chats=max_chats,
+        resume=resume,
+        on_chat=lambda chat, messages: queue_scraped_messages(account, chat, messages),
+    )
+    stats = worker.last_crawl_stats
+    crawl_rate.set(stats.get("chats_per_minute", 0))
+    crawl_chats.set(stats.get("chats", 0))
+    browser_step_time.labels(step="scrape").observe(stats.get("seconds", 0))
+    # Per-chat step timings are measured in the worker process and reported with the stats
+    for step, durations in stats.get("step_seconds", {}).items():
+        histogram = browser_step_time.labels(step=step)
+        for seconds in durations:
+            histogram.observe(seconds)
+    return stats
+
+@bp.route('/api/crawl', methods=['POST'])
+def start_crawl():
+    """Start a full sidebar crawl in the background, resuming an interrupted one."""
+    worker = get_worker(request_account())
+    if not worker or not account_logged_in(worker):
+        return jsonify({"error": "WhatsApp client not logged in"}), 400
+    if worker.busy():
+        return jsonify({"error": "A scrape is already running"}), 409
+
+    def crawl():
+        try:
+            stats = run_scrape(worker, max_chats=None, resume=True)
+            logging.info(f"Full crawl of {worker.account} finished: {stats}")
+        except Exception as e:
+            logging.error(f"Error in full crawl of {worker.account}: {e}")
+
+    threading.Thread(target=crawl, daemon=True).start()
+    return jsonify({"success": True})
+
+def monitoring_thread(worker):
+    """Background task to poll one account and queue new messages for HA."""
+    logging.info(f"Starting monitoring thread for {worker.account}...")
+    interval = 15
+    lag = monitor_lag.labels(account=worker.account)
+    previous_start = None
+    while get_worker(worker.account) is worker:
+        # Slow scrapes and a busy worker push each iteration past its planned start
+        now = time.monotonic()
+        if previous_start is not None:
+            lag.observe(max(0, now - previous_start - interval))
+        previous_start = now
+        if account_logged_in(worker):
             try:
-                # For this prototype, we monitor "Me" or recent chats
-                # In a full version, this would be more dynamic
-                chats = ["Me"] 
-                for chat in chats:
-                    messages = whatsapp_client.get_latest_messages(chat)
-                    for msg in messages:
-                        if msg not in logged_messages:
-                            logging.info(f"New message from {chat}: {msg}")
-                            # Push to HA if configured
-                            ha_url = config.get("ha_url")
-                            if ha_url:
-                                try:
-                                    # Simple webhook push to HA (if HA supports it)
-                                    # Or we just store it locally and HA polls
-                                    pass 
-                                except:
-                                    pass
-                            logged_messages.add(msg)
+                # Chats with new activity move to the top of the list, so the
+                # monitor only walks the first few rows. Only chats whose row
+                # changed are opened, and only messages newer than the stored
+                # high-water mark are returned.
+                run_scrape(worker, max_chats=config.get("monitor_chats", 10))
             except Exception as e:
-                logging.error(f"Error in monitoring: {e}")
-        time.sleep(15)
+                logging.error(f"Error in monitoring {worker.account}: {e}")
+        time.sleep(interval)
 
-# Start background monitor
-threading.Thread(target=monitoring_thread, daemon=True).start()
+def supervisor_thread():
+    """Applies memory caps and restart policies of all browser workers."""
+    while True:
+        with workers_lock:
+            current = list(workers.values())
+        for worker in current:
+            try:
+                worker.supervise()
+            except Exception as e:
+                logging.error(f"Error supervising {worker.account}: {e}")
+        time.sleep(10)
 
 if __name__ == '__main__':
+    app = create_app()
+    start_background_workers()
     app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
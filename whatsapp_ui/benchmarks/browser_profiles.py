@@ -0,0 +1,63 @@
+"""
+Compares peak RSS and CPU time of the "default" and "lean" browser profiles.
+
+Each profile opens WhatsApp Web in a fresh Chromium and is sampled once per
+second. Pass an existing, logged-in profile directory to measure the chat view
+instead of the QR screen.
+
+    python benchmarks/browser_profiles.py --seconds 60 [--user-data-dir whatsapp_sessions]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp_web_client import BROWSER_PROFILES, WhatsAppWebClient
+
+
+def measure(profile, seconds, user_data_dir):
+    client = WhatsAppWebClient(user_data_dir=user_data_dir, profile=profile)
+    started = time.monotonic()
+    try:
+        status, _ = client.get_qr_code_or_login()
+        while time.monotonic() - started < seconds:
+            client.resource_usage()
+            time.sleep(1)
+        usage = client.resource_usage() or {}
+    finally:
+        client.close()
+    elapsed = time.monotonic() - started
+    return {
+        "profile": profile,
+        "status": status,
+        "peak_rss_mb": client.peak_usage["rss_bytes"] / (1024 * 1024),
+        "cpu_seconds": usage.get("cpu_seconds", client.peak_usage["cpu_seconds"]),
+        "cpu_percent": 100 * usage.get("cpu_seconds", 0) / elapsed if elapsed else 0,
+        "processes": usage.get("processes", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60, help="How long to sample each profile")
+    parser.add_argument("--user-data-dir", help="Chrome profile to reuse (default: a fresh temporary one)")
+    args = parser.parse_args()
+
+    results = []
+    for profile in BROWSER_PROFILES:
+        if args.user_data_dir:
+            results.append(measure(profile, args.seconds, os.path.abspath(args.user_data_dir)))
+        else:
+            with tempfile.TemporaryDirectory() as user_data_dir:
+                results.append(measure(profile, args.seconds, user_data_dir))
+
+    print(f"{'profile':<10}{'status':<12}{'peak RSS MB':>12}{'CPU s':>10}{'CPU %':>8}{'procs':>7}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['status']:<12}{r['peak_rss_mb']:>12.0f}{r['cpu_seconds']:>10.1f}{r['cpu_percent']:>8.1f}{r['processes']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Chat-export import throughput on a large synthetic export set.
+
+Writes `--size-mb` of Android-style exports (with multi-line messages and
+system lines) split over `--files` files into a scratch directory, then
+imports them into a fresh database with each `--workers` count and reports
+MB/s and messages/s:
+
+    python benchmarks/import_throughput.py --size-mb 4096 --workers 1 4
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_import import format_stats, import_exports  # noqa: E402
+
+WORDS = ("dinner tonight tomorrow train late home work meeting coffee birthday party weekend movie "
+         "football match holiday flight hotel beach rain sunny doctor school kids shopping pizza").split()
+
+
+def write_export(path, size, rng):
+    written = 0
+    minute = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("01/01/20, 00:00 - Messages and calls are end-to-end encrypted.\n")
+        while written < size:
+            minute += rng.randint(1, 30)
+            day, hour = divmod(minute // 60, 24)
+            lines = [f"{day % 28 + 1:02d}/{day // 28 % 12 + 1:02d}/{20 + day // 336}, {hour:02d}:{minute % 60:02d} - "
+                     f"{rng.choice(('Alice', 'Me'))}: {' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 15)))}"]
+            if rng.random() < 0.1:
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 15))))
+            chunk = "\n".join(lines) + "\n"
+            f.write(chunk)
+            written += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as scratch:
+        exports = os.path.join(scratch, "exports")
+        os.mkdir(exports)
+        for i in range(args.files):
+            write_export(os.path.join(exports, f"WhatsApp Chat with Friend {i}.txt"),
+                         args.size_mb * 1024 * 1024 // args.files, rng)
+
+        for workers in args.workers:
+            db_file = os.path.join(scratch, f"whatsapp_{workers}.db")
+            conn = sqlite3.connect(db_file)
+            conn.execute('''CREATE TABLE messages
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT, account TEXT, chat_name TEXT,
+                             sender TEXT, text TEXT, timestamp TEXT,
+                             UNIQUE(account, chat_name, timestamp, text))''')
+            conn.close()
+            stats = import_exports([exports], "Gateway", db_file, workers=workers)
+            print(f"{workers} workers: {format_stats(stats)}")
+            os.remove(db_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures how long `import app` and `create_app()` take, and keeps a history.
+
+Every run appends one line to benchmarks/import_time_history.jsonl, with the
+git commit, so regressions show up when comparing against earlier entries.
+The probes run in a scratch directory, so create_app() initialises a throwaway
+database and config instead of the gateway's own.
+
+    python benchmarks/import_time.py [--runs 5] [--no-record]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_FILE = os.path.join(GATEWAY_DIR, "benchmarks", "import_time_history.jsonl")
+
+# Runs in a fresh interpreter so nothing is already imported
+_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000}))
+"""
+
+
+def _run_gateway_python(args, scratch):
+    """Runs Python with the gateway importable and `scratch` as the working (data) directory."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [GATEWAY_DIR, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable] + args, cwd=scratch, env=env, capture_output=True, text=True, check=True)
+
+
+def _probe(scratch):
+    result = _run_gateway_python(["-c", _PROBE], scratch)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _slowest_imports(scratch, limit=10):
+    """Modules imported directly by app, by cumulative import time, from `python -X importtime`."""
+    result = _run_gateway_python(["-X", "importtime", "-c", "import app"], scratch)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two spaces per level; keep what `app` imports directly
+        if len(name) - len(name.lstrip()) == 3:
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:limit]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=GATEWAY_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-record", action="store_true", help="Don't append the result to the history file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        samples = [_probe(scratch) for _ in range(args.runs)]
+        slowest_imports = _slowest_imports(scratch)
+    entry = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "create_app_ms": round(statistics.median(s["create_app_ms"] for s in samples), 1),
+        "slowest_imports": [{"module": name, "ms": round(ms, 1)} for ms, name in slowest_imports],
+    }
+
+    previous = None
+    if os.path.exists(HISTORY_FILE):
+        with open(HISTORY_FILE) as f:
+            lines = [line for line in f if line.strip()]
+        if lines:
+            previous = json.loads(lines[-1])
+
+    print(f"import app:   {entry['import_ms']:.1f} ms (median of {args.runs})")
+    print(f"create_app(): {entry['create_app_ms']:.1f} ms")
+    if previous:
+        print(f"previous ({previous.get('commit')}): import {previous['import_ms']:.1f} ms, create_app {previous['create_app_ms']:.1f} ms")
+    print("slowest imports:")
+    for item in entry["slowest_imports"]:
+        print(f"  {item['ms']:8.1f} ms  {item['module']}")
+
+    if not args.no_record:
+        with open(HISTORY_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Recorder growth of one tracked contact's binary sensor over a simulated day.
+
+Replays coordinator refreshes every `--interval` seconds for a contact that is
+online for `--sessions` sessions of `--session-minutes` each, with the engine's
+`today_duration` counter ticking while online. Each state write is stored in a
+SQLite copy of the recorder's `states` / `state_attributes` tables (writes that
+change nothing dropped and attributes de-duplicated by content, as HA does), and
+the rows and file size are reported for:
+
+- every refresh: the old listener, one write per refresh, all attributes recorded
+- throttled: ThrottledWriteMixin from the integration, all attributes recorded
+- throttled + unrecorded: the mixin plus `_unrecorded_attributes`
+
+    python benchmarks/recorder_growth.py [--interval 10] [--write-interval 300]
+
+Home Assistant itself isn't needed: the mixin only uses `callback` from it, so
+placeholder modules are put in place when it isn't installed.
+"""
+import argparse
+import collections
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import types
+
+ENTITY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           "custom_components", "whatsapp_hass", "entity.py")
+DAY = 86400
+
+
+def load_mixin():
+    try:
+        import homeassistant.core  # noqa: F401
+    except ImportError:
+        core = types.ModuleType("homeassistant.core")
+        core.callback = lambda func: func
+        helpers = types.ModuleType("homeassistant.helpers")
+        for name in ("device_registry", "entity_platform", "entity_registry"):
+            setattr(helpers, name, types.ModuleType(f"homeassistant.helpers.{name}"))
+        sys.modules.update({"homeassistant": types.ModuleType("homeassistant"),
+                            "homeassistant.core": core, "homeassistant.helpers": helpers})
+    spec = importlib.util.spec_from_file_location("whatsapp_hass_entity", ENTITY_FILE)
+    entity = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(entity)
+    return entity
+
+
+class Recorder:
+    """The columns of the recorder's tables that grow per state write."""
+
+    def __init__(self, db_file):
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute('''CREATE TABLE states
+                             (state_id INTEGER PRIMARY KEY, entity_id TEXT, state TEXT,
+                              attributes_id INTEGER, last_changed_ts REAL, last_updated_ts REAL)''')
+        self.conn.execute('''CREATE TABLE state_attributes
+                             (attributes_id INTEGER PRIMARY KEY, hash INTEGER, shared_attrs TEXT)''')
+        self.conn.execute("CREATE INDEX ix_states_entity_id_last_updated_ts ON states (entity_id, last_updated_ts)")
+        self.conn.execute("CREATE INDEX ix_state_attributes_hash ON state_attributes (hash)")
+        self._attributes_ids = {}
+        self._last_state = None
+        self._last_written = None
+        self._last_changed = 0.0
+
+    def write(self, entity_id, state, attributes, unrecorded, now):
+        # HA's state machine drops writes that change neither state nor attributes;
+        # the recorder then stores the attributes without the unrecorded ones
+        written = json.dumps(attributes, sort_keys=True)
+        if (state, written) == (self._last_state, self._last_written):
+            return
+        self._last_written = written
+        shared = json.dumps({k: v for k, v in attributes.items() if k not in unrecorded},
+                            sort_keys=True, separators=(",", ":"))
+        attributes_id = self._attributes_ids.get(shared)
+        if attributes_id is None:
+            attributes_id = self.conn.execute("INSERT INTO state_attributes (hash, shared_attrs) VALUES (?, ?)",
+                                              (hash(shared), shared)).lastrowid
+            self._attributes_ids[shared] = attributes_id
+        if state != self._last_state:
+            self._last_state, self._last_changed = state, now
+        self.conn.execute('''INSERT INTO states (entity_id, state, attributes_id, last_changed_ts, last_updated_ts)
+                             VALUES (?, ?, ?, ?, ?)''', (entity_id, state, attributes_id, self._last_changed, now))
+
+    def usage(self):
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        states = self.conn.execute("SELECT COUNT(*) FROM states").fetchone()[0]
+        attributes = self.conn.execute("SELECT COUNT(*) FROM state_attributes").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        self.conn.close()
+        return states, attributes, page_size * pages
+
+
+def engine_contact(now, sessions, session_minutes):
+    """The contact the engine reports at `now`: online for evenly spread sessions."""
+    spacing = DAY / sessions
+    index, offset = divmod(now, spacing)
+    online = offset < session_minutes * 60
+    today = index * session_minutes * 60 + min(offset, session_minutes * 60)
+    if online:
+        status_since = index * spacing
+    else:
+        status_since = index * spacing + session_minutes * 60
+    return {
+        "presence": "available" if online else "unavailable",
+        "status_since": status_since,
+        "last_online": status_since if not online else (index - 1) * spacing + session_minutes * 60,
+        "today_duration": int(today),
+    }
+
+
+def run(entity, variant, args, db_file):
+    recorder = Recorder(db_file)
+    clock = [0.0]
+    # The mixin times its writes with time.monotonic(); drive it from the simulated clock
+    entity.time = types.SimpleNamespace(monotonic=lambda: clock[0])
+    coordinator = types.SimpleNamespace(attribute_write_interval=args.write_interval,
+                                        state_writes=collections.Counter(), contact=None)
+
+    class ContactSensor(entity.ThrottledWriteMixin):
+        entity_id = "binary_sensor.wa_social_31612345678"
+        _volatile_attributes = frozenset({"today_duration_seconds"})
+        _unrecorded_attributes = frozenset({"today_duration_seconds"}) if variant == "throttled + unrecorded" else frozenset()
+
+        def __init__(self):
+            self.coordinator = coordinator
+
+        @property
+        def state(self):
+            return "on" if coordinator.contact["presence"] == "available" else "off"
+
+        @property
+        def extra_state_attributes(self):
+            contact = coordinator.contact
+            return {
+                "contact_name": "Alice",
+                "status_since": contact["status_since"],
+                "last_seen": contact["last_online"],
+                "today_duration_seconds": contact["today_duration"],
+                "jid": "31612345678@s.whatsapp.net",
+            }
+
+        def async_write_ha_state(self):
+            recorder.write(self.entity_id, self.state, self.extra_state_attributes, self._unrecorded_attributes, clock[0])
+
+    sensor = ContactSensor()
+    while clock[0] < DAY:
+        coordinator.contact = engine_contact(clock[0], args.sessions, args.session_minutes)
+        if variant == "every refresh":
+            sensor.async_write_ha_state()
+        else:
+            sensor._async_write_if_changed()
+        clock[0] += args.interval
+    return recorder.usage()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between coordinator refreshes")
+    parser.add_argument("--write-interval", type=float, default=300, help="attribute_write_interval of the mixin")
+    parser.add_argument("--sessions", type=int, default=8, help="Online sessions per day")
+    parser.add_argument("--session-minutes", type=float, default=15)
+    args = parser.parse_args()
+
+    entity = load_mixin()
+    print(f"One contact, {DAY // 3600} h, refresh every {args.interval:g} s, "
+          f"{args.sessions} x {args.session_minutes:g} min online, write interval {args.write_interval:g} s")
+    print(f"{'variant':<24}{'state rows':>12}{'attr rows':>12}{'KiB':>10}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for variant in ("every refresh", "throttled", "throttled + unrecorded"):
+            states, attributes, size = run(entity, variant, args, os.path.join(scratch, f"{variant}.db"))
+            print(f"{variant:<24}{states:>12}{attributes:>12}{size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Suggestion-context retrieval latency on a large synthetic history.
+
+Fills a scratch whatsapp.db with `--messages` rows spread over `--chats` chats,
+builds the FTS index (timed), then runs `--queries` searches the way
+/api/generate_suggestions does and reports p50 / p99 / max latency:
+
+    python benchmarks/retrieval_latency.py --messages 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_index import MessageIndex  # noqa: E402
+
+WORDS = ("dinner tonight tomorrow train late home work meeting coffee birthday party weekend movie "
+         "football match holiday flight hotel beach rain sunny doctor dentist school kids homework "
+         "shopping groceries pizza sushi restaurant cinema concert tickets car garage bike office "
+         "project deadline report email phone call music guitar gym running swimming").split()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as scratch:
+        db_file = os.path.join(scratch, "whatsapp.db")
+        conn = sqlite3.connect(db_file)
+        conn.execute('''CREATE TABLE messages
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT, account TEXT, chat_name TEXT,
+                         sender TEXT, text TEXT, timestamp TEXT,
+                         UNIQUE(account, chat_name, timestamp, text))''')
+        conn.executemany("INSERT INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                         (("Gateway", f"Chat {i % args.chats}", f"Person {i % 7}", sentence(rng), str(i))
+                          for i in range(args.messages)))
+        conn.commit()
+        conn.close()
+
+        index = MessageIndex(db_file)
+        started = time.perf_counter()
+        added = index.sync()
+        build = time.perf_counter() - started
+        print(f"Indexed {added} messages in {build:.1f}s ({added / build:,.0f} rows/s), "
+              f"index {os.path.getsize(index._index_file) / 1e6:.0f} MB")
+
+        latencies = []
+        for _ in range(args.queries):
+            chat = f"Chat {rng.randrange(args.chats)}"
+            texts = [sentence(rng) for _ in range(3)]
+            started = time.perf_counter()
+            index.search("Gateway", chat, texts, k=args.top_k, exclude=texts)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        print(f"Retrieval over {args.messages} messages: p50 {percentile(latencies, 50):.1f} ms, "
+              f"p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
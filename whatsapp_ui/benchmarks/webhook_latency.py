@@ -0,0 +1,132 @@
+"""
+Webhook latency while suggestion generation is saturated.
+
+Keeps `--suggesters` clients calling /api/generate_suggestions in a loop (pass
+a Gemini key so each call is slow) and meanwhile posts `--webhooks` messages to
+/webhook, reporting their p50 / p99 / max latency. The gateway is started in a
+scratch directory, so the probe messages never reach the real database. Run it
+for both server modes:
+
+    python benchmarks/webhook_latency.py --gemini-key AIza...
+    python benchmarks/webhook_latency.py --gemini-key AIza... --async
+
+`--url` benchmarks an already running gateway instead, which keeps the messages.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def post(url, payload, timeout=120):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@contextlib.contextmanager
+def scratch_gateway(use_async, gemini_key):
+    """Runs serve.py in a temporary data directory (config, database, sessions) and yields its URL."""
+    with tempfile.TemporaryDirectory() as scratch:
+        with open(os.path.join(scratch, "config.json"), "w") as f:
+            json.dump({"gemini_api_key": gemini_key or ""}, f)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        command = [sys.executable, os.path.join(GATEWAY_DIR, "serve.py"), "--host", "127.0.0.1", "--port", str(port)]
+        server = subprocess.Popen(command + (["--async"] if use_async else []), cwd=scratch,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(100):
+                if server.poll() is not None:
+                    raise SystemExit(f"Gateway exited with code {server.returncode}")
+                try:
+                    urllib.request.urlopen(f"{url}/api/stats", timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            else:
+                raise SystemExit("Gateway did not start")
+            yield url
+        finally:
+            server.terminate()
+            server.wait(10)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(args, url):
+    stop = threading.Event()
+    suggestion_status = {}
+    conversation = [{"sender": "Alice", "text": "Are we still on for dinner tonight?"}]
+
+    def suggester():
+        while not stop.is_set():
+            status = post(f"{url}/api/generate_suggestions", {"conversation": conversation})
+            suggestion_status[status] = suggestion_status.get(status, 0) + 1
+
+    threads = [threading.Thread(target=suggester, daemon=True) for _ in range(args.suggesters)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2) # Let the suggestion load build up
+
+    latencies = []
+    errors = 0
+    for i in range(args.webhooks):
+        started = time.perf_counter()
+        status = post(f"{url}/webhook", {
+            "account": "bench", "chat_name": "bench", "sender": "bench",
+            "text": f"webhook latency probe {time.time()} {i}",
+        }, timeout=30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status != 200:
+            errors += 1
+        time.sleep(max(0, 1 / args.rate - latencies[-1] / 1000))
+    stop.set()
+    # Let in-flight suggestions finish before a scratch gateway is stopped
+    for thread in threads:
+        thread.join()
+
+    print(f"webhook calls: {len(latencies)}  errors: {errors}")
+    print(f"p50 {statistics.median(latencies):.1f} ms  p99 {percentile(latencies, 99):.1f} ms  max {max(latencies):.1f} ms")
+    print(f"suggestion responses by status: {suggestion_status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark this running gateway instead of a scratch one")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Start the scratch gateway with gevent")
+    parser.add_argument("--gemini-key", default=os.environ.get("GEMINI_API_KEY"), help="Gemini key for the scratch gateway")
+    parser.add_argument("--suggesters", type=int, default=20, help="Concurrent suggestion clients")
+    parser.add_argument("--webhooks", type=int, default=500, help="Webhook calls to time")
+    parser.add_argument("--rate", type=float, default=50, help="Webhook calls per second")
+    args = parser.parse_args()
+
+    if args.url:
+        run(args, args.url)
+    else:
+        with scratch_gateway(args.use_async, args.gemini_key) as url:
+            run(args, url)
+
+
+if __name__ == "__main__":
+    main()
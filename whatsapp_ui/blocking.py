@@ -0,0 +1,77 @@
+"""Bounded thread pools for blocking calls (Gemini, browser workers, SQLite)."""
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    """Raised when a pool already has as many calls running and queued as it allows."""
+
+
+def _gevent_active():
+    if "gevent.monkey" not in sys.modules:
+        return False
+    return sys.modules["gevent.monkey"].is_module_patched("socket")
+
+
+def run_native(fn, *args, **kwargs):
+    """
+    Calls `fn` on a real OS thread under the gevent server and waits for it,
+    yielding to the hub meanwhile; a plain call otherwise. For SQLite and other
+    work that blocks in C code, which would otherwise stall every greenlet. The
+    hub's thread pool is bounded, so a burst queues instead of adding threads.
+    """
+    if not _gevent_active():
+        return fn(*args, **kwargs)
+    import gevent
+    return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls on a fixed number of real OS threads and rejects new calls
+    once `max_workers + max_queue` are in flight, so a slow dependency can only
+    ever hold its own pool and never the request handlers.
+
+    Under the gevent server, threads from `threading` are greenlets, so the pool
+    uses gevent's native thread pool and waiting callers just yield to the hub.
+    """
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if _gevent_active():
+                    from gevent.threadpool import ThreadPool
+                    self._pool = ThreadPool(self.max_workers)
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+            return self._pool
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Runs `fn` in the pool and waits for its result (re-raising its exception).
+        A call that times out keeps its slot until it really finishes.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy(f"{self.name} pool is saturated")
+        try:
+            pool = self._get_pool()
+            if isinstance(pool, ThreadPoolExecutor):
+                task = pool.submit(fn, *args, **kwargs)
+                task.add_done_callback(lambda _: self._slots.release())
+            else:
+                task = pool.spawn(fn, *args, **kwargs)
+                task.rawlink(lambda _: self._slots.release())
+        except Exception:
+            self._slots.release()
+            raise
+        if isinstance(task, Future):
+            return task.result(timeout)
+        return task.get(timeout=timeout)
@@ -0,0 +1,307 @@
+"""
+Imports native WhatsApp chat exports (.txt, or .zip as produced by "Export chat")
+into the messages table.
+
+    python chat_import.py --account Gateway exports/               # every .txt/.zip below
+    python chat_import.py --account Gateway "WhatsApp Chat with Alice.zip" --date-order mdy
+
+Plain .txt files are split into byte ranges and zip members are one task each;
+tasks are parsed in a process pool and written by this process in one
+transaction per task. Both Android ("31/12/20, 21:41 - Alice: Hi") and iOS
+("[31.12.20, 21:41:05] Alice: Hi") layouts are recognised, lines without a
+header are continuation lines of the previous message, and timestamps are
+stored as "YYYY-MM-DD HH:MM:SS". Rows already present are ignored, so
+importing the same export twice adds nothing. A running gateway notices the
+new rows on its next read request (see ResponseCache) and refreshes its
+caches, dashboards, index and suggester.
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+import zipfile
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+# Bytes read from a file to guess its date order
+SAMPLE_SIZE = 64 * 1024
+SAMPLES = 8
+
+HEADER = re.compile(
+    r"^[\u200e\u200f]?\[?(\d{1,4})[./-](\d{1,2})[./-](\d{1,4}),?\s+"
+    r"(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?\s*([AaPp]\.?\s?[Mm]\.?)?\]?\s*(?:[-\u2013]\s)?(.*)$"
+)
+# "WhatsApp Chat with Alice.txt", "WhatsApp-Chat mit Alice.zip", "WhatsApp Chat - Alice.zip"
+EXPORT_NAME = re.compile(r"^WhatsApp[- ]Chat\s*(?:with|mit|con|avec|met|com|-)?\s*", re.IGNORECASE)
+
+
+def chat_name_from_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return EXPORT_NAME.sub("", name).strip() or name
+
+
+def detect_date_order(lines):
+    """
+    "dmy", "mdy" or "ymd" from header lines: a first field above 12 means
+    day-first, a second one means month-first. Undecided files with AM/PM
+    times are taken as US (month-first), all others as day-first.
+    """
+    first = second = 0
+    twelve_hour = False
+    for line in lines:
+        match = HEADER.match(line)
+        if not match:
+            continue
+        if len(match.group(1)) == 4:
+            return "ymd"
+        first = max(first, int(match.group(1)))
+        second = max(second, int(match.group(2)))
+        twelve_hour = twelve_hour or bool(match.group(7))
+    if first > 12:
+        return "dmy"
+    if second > 12:
+        return "mdy"
+    return "mdy" if twelve_hour else "dmy"
+
+
+def normalise_date(a, b, c, order):
+    """"YYYY-MM-DD" from the three date fields of a header, as strings."""
+    if len(a) == 4 or order == "ymd":
+        year, month, day = int(a), int(b), int(c)
+    elif order == "mdy":
+        month, day, year = int(a), int(b), int(c)
+    else:
+        day, month, year = int(a), int(b), int(c)
+    if month > 12:
+        # The guessed order was wrong for this line
+        day, month = month, day
+    if year < 100:
+        year += 2000
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def normalise_time(hour, minute, second, meridiem):
+    hour = int(hour)
+    if meridiem:
+        hour %= 12
+        if meridiem[0] in "pP":
+            hour += 12
+    return f"{hour:02d}:{minute}:{second or '00'}"
+
+
+class _Parser:
+    """Turns export lines into (sender, text, timestamp) rows."""
+
+    def __init__(self, order):
+        self.order = order
+        self.rows = []
+        self.system = 0
+        self._current = None
+        # Many messages share a day, and parsing dates is most of the work
+        self._dates = {}
+
+    def header(self, match):
+        """Starts a new message from a header line match."""
+        self.flush()
+        a, b, c, hour, minute, second, meridiem, rest = match.groups()
+        sender, separator, text = rest.partition(": ")
+        if not separator:
+            # "Messages and calls are end-to-end encrypted", "Alice added Bob", ...
+            self.system += 1
+            self._current = None
+            return
+        date = self._dates.get((a, b, c))
+        if date is None:
+            date = self._dates[(a, b, c)] = normalise_date(a, b, c, self.order)
+        self._current = [sender.strip("\u200e\u202a\u202c "), [text],
+                         f"{date} {normalise_time(hour, minute, second, meridiem)}"]
+
+    def continuation(self, line):
+        if self._current is not None:
+            self._current[1].append(line)
+
+    def flush(self):
+        if self._current is not None:
+            sender, parts, timestamp = self._current
+            text = parts[0] if len(parts) == 1 else "\n".join(parts)
+            self.rows.append((sender, text.replace("\u200e", "").strip(), timestamp))
+            self._current = None
+
+
+def _decode(raw):
+    return raw.decode("utf-8", "replace").lstrip("\ufeff").rstrip("\r\n")
+
+
+def parse_range(path, start, end, order):
+    """
+    Rows of the messages whose header line starts in [start, end) of a plain
+    export. The last one may continue past `end`.
+    """
+    with open(path, "rb") as f:
+        if start:
+            # Skip the line that crosses `start`; it belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        # One read and one decode for the whole range is several times faster than per line
+        data = [f.read(max(0, min(end, os.fstat(f.fileno()).st_size) - f.tell()))]
+        if data[0] and not data[0].endswith(b"\n"):
+            data.append(f.readline())
+        # Continuation lines of the last message, up to the next header
+        for raw in f:
+            if HEADER.match(_decode(raw)):
+                break
+            data.append(raw)
+    text = b"".join(data).decode("utf-8", "replace")
+    if not start:
+        text = text.lstrip("\ufeff")
+    lines = text.split("\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    return parse_lines((line.rstrip("\r") for line in lines), order)
+
+
+def parse_lines(lines, order):
+    parser = _Parser(order)
+    match_header = HEADER.match
+    for line in lines:
+        match = match_header(line)
+        if match:
+            parser.header(match)
+        else:
+            parser.continuation(line)
+    parser.flush()
+    return parser.rows, parser.system
+
+
+def parse_task(task):
+    """Worker entry point. Returns (task, rows, system line count)."""
+    if task["kind"] == "range":
+        rows, system = parse_range(task["path"], task["start"], task["end"], task["order"])
+    else:
+        with zipfile.ZipFile(task["path"]) as archive, archive.open(task["member"]) as member:
+            rows, system = parse_lines((_decode(raw) for raw in member), task["order"])
+    return task, rows, system
+
+
+def _sample_file(path, size):
+    """A few blocks spread over the file, as lines."""
+    lines = []
+    with open(path, "rb") as f:
+        for i in range(SAMPLES if size > SAMPLE_SIZE * SAMPLES else 1):
+            f.seek(size * i // SAMPLES)
+            lines.extend(_decode(raw) for raw in f.read(SAMPLE_SIZE).splitlines())
+    return lines
+
+
+def plan_tasks(paths, chunk_size=DEFAULT_CHUNK_SIZE, date_order=None, chat_name=None):
+    """Import tasks for files, zips and directories (searched recursively)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith((".txt", ".zip")))
+        else:
+            files.append(path)
+
+    tasks = []
+    for path in files:
+        chat = chat_name or chat_name_from_path(path)
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.filename.lower().endswith(".txt"):
+                        continue
+                    with archive.open(info) as member:
+                        order = date_order or detect_date_order(_decode(raw) for raw in io.BytesIO(member.read(SAMPLE_SIZE * SAMPLES)))
+                    tasks.append({"kind": "zip", "path": path, "member": info.filename, "chat_name": chat,
+                                  "order": order, "bytes": info.file_size})
+            continue
+        size = os.path.getsize(path)
+        order = date_order or detect_date_order(_sample_file(path, size))
+        for start in range(0, max(size, 1), chunk_size):
+            end = min(size, start + chunk_size)
+            tasks.append({"kind": "range", "path": path, "start": start, "end": end, "chat_name": chat,
+                          "order": order, "bytes": end - start})
+    return tasks
+
+
+def import_exports(paths, account, db_file, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   date_order=None, chat_name=None, progress=None):
+    """
+    Imports the exports under `paths` for `account`. Returns a dict with
+    files, bytes, messages (parsed), inserted (new rows), system (skipped
+    system lines) and seconds. `progress(stats)` is called after each task.
+    """
+    started = time.perf_counter()
+    tasks = plan_tasks(paths, chunk_size, date_order, chat_name)
+    stats = {"files": len({task["path"] for task in tasks}), "tasks": len(tasks), "bytes": 0,
+             "messages": 0, "inserted": 0, "system": 0, "seconds": 0.0}
+    if not tasks:
+        return stats
+
+    conn = sqlite3.connect(db_file)
+    pool = multiprocessing.Pool(min(workers or os.cpu_count() or 1, len(tasks)))
+    try:
+        # Unordered: the writer stores whatever chunk finishes first while the rest are parsed
+        for task, rows, system in pool.imap_unordered(parse_task, tasks):
+            # rowcount leaves out the chat_summary writes of the insert trigger
+            cursor = conn.executemany("INSERT OR IGNORE INTO messages (account, chat_name, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                             ((account, task["chat_name"], sender, text, timestamp) for sender, text, timestamp in rows))
+            conn.commit()
+            stats["bytes"] += task["bytes"]
+            stats["messages"] += len(rows)
+            stats["inserted"] += cursor.rowcount
+            stats["system"] += system
+            stats["seconds"] = time.perf_counter() - started
+            if progress:
+                progress(stats)
+    finally:
+        pool.close()
+        pool.join()
+        conn.close()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def format_stats(stats):
+    seconds = stats["seconds"] or 1e-9
+    return (f"{stats['messages']:,} messages ({stats['inserted']:,} new, {stats['system']:,} system lines skipped) "
+            f"from {stats['files']} files, {stats['bytes'] / 1e6:,.1f} MB in {stats['seconds']:.1f}s: "
+            f"{stats['bytes'] / 1e6 / seconds:,.1f} MB/s, {stats['messages'] / seconds:,.0f} messages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import WhatsApp chat exports into the gateway database",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument("paths", nargs="+", help=".txt or .zip exports, or directories containing them")
+    parser.add_argument("--account", required=True, help="Account the chats belong to")
+    parser.add_argument("--db", default="whatsapp.db")
+    parser.add_argument("--chat", help="Chat name for all files (default: taken from each file name)")
+    parser.add_argument("--date-order", choices=("dmy", "mdy", "ymd"), help="Date order (default: detected per file)")
+    parser.add_argument("--workers", type=int, help="Parser processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Same schema as the gateway, so the import works before its first start
+    import app
+    app.DB_FILE = args.db
+    app.init_db()
+
+    stats = import_exports(
+        args.paths, args.account, args.db, workers=args.workers, chunk_size=args.chunk_mb * 1024 * 1024,
+        date_order=args.date_order, chat_name=args.chat,
+        progress=lambda stats: print(f"\r{stats['bytes'] / 1e6:,.0f} MB, {stats['messages']:,} messages", end="", flush=True),
+    )
+    print()
+    print(f"Imported {format_stats(stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Per-chat message count and latest message, kept up to date by a trigger on messages."""
+import logging
+import sqlite3
+import threading
+
+from blocking import run_native
+
+_LOGGER = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = ("account", "chat_name", "message_count", "last_id", "last_sender", "last_text", "last_timestamp")
+
+
+class ChatSummary:
+    """
+    One `chat_summary` row per (account, chat). An AFTER INSERT trigger on
+    `messages` updates it in the same transaction as every inserted row
+    (webhook, history upload, export import), and only for rows INSERT OR
+    IGNORE actually added. Rows that existed before the trigger was created
+    are counted once by a background backfill in id batches. Chats sort by
+    `last_id`, the id of their newest message, through an index, so listing
+    them never touches `messages`. `on_commit` is called after every backfill
+    batch, since those rows don't go through the gateway's write path.
+    """
+
+    def __init__(self, db_file, batch=50000, on_commit=None):
+        self.db_file = db_file
+        self._batch = batch
+        self._on_commit = on_commit
+        self._thread = None
+
+    @staticmethod
+    def init_db(conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS chat_summary
+                        (account TEXT,
+                         chat_name TEXT,
+                         message_count INTEGER,
+                         last_id INTEGER,
+                         last_sender TEXT,
+                         last_text TEXT,
+                         last_timestamp TEXT,
+                         PRIMARY KEY (account, chat_name))''')
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_summary_recent ON chat_summary (last_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_summary_account_recent ON chat_summary (account, last_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS chat_summary_state (key TEXT PRIMARY KEY, value INTEGER)")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'chat_summary_insert'").fetchone():
+            return
+        # This insert opens the write transaction, so no message can land between
+        # the boundary and the trigger: older rows are the backfill's, newer the trigger's
+        conn.execute("INSERT OR REPLACE INTO chat_summary_state (key, value) VALUES ('backfill_to', (SELECT COALESCE(MAX(id), 0) FROM messages))")
+        conn.execute('''CREATE TRIGGER chat_summary_insert AFTER INSERT ON messages
+                        BEGIN
+                            INSERT INTO chat_summary (account, chat_name, message_count, last_id, last_sender, last_text, last_timestamp)
+                            VALUES (NEW.account, NEW.chat_name, 1, NEW.id, NEW.sender, NEW.text, NEW.timestamp)
+                            ON CONFLICT (account, chat_name) DO UPDATE SET
+                                message_count = message_count + 1,
+                                last_id = excluded.last_id,
+                                last_sender = excluded.last_sender,
+                                last_text = excluded.last_text,
+                                last_timestamp = excluded.last_timestamp;
+                        END''')
+
+    def start(self):
+        """Runs the backfill in the background if one is pending."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run_backfill, name="chat-summary-backfill", daemon=True)
+        self._thread.start()
+
+    def _run_backfill(self):
+        try:
+            run_native(self.backfill)
+        except Exception as e:
+            _LOGGER.error(f"Error backfilling chat summaries: {e}")
+
+    def backfill(self):
+        """Adds messages older than the trigger in batches. Returns the number of messages added."""
+        conn = sqlite3.connect(self.db_file)
+        try:
+            state = dict(conn.execute("SELECT key, value FROM chat_summary_state").fetchall())
+            done, target = state.get("backfill_done", 0), state.get("backfill_to", 0)
+            if done >= target:
+                return 0
+            _LOGGER.info(f"Backfilling chat summaries for messages {done + 1} to {target}")
+            added = 0
+            while done < target:
+                top = min(done + self._batch, target)
+                # With a single MAX() aggregate, SQLite takes the bare columns from
+                # the row holding the maximum, i.e. the newest message of the chat
+                conn.execute('''INSERT INTO chat_summary (account, chat_name, message_count, last_id, last_sender, last_text, last_timestamp)
+                                SELECT account, chat_name, COUNT(*), MAX(id), sender, text, timestamp
+                                FROM messages WHERE id > ? AND id <= ? GROUP BY account, chat_name
+                                ON CONFLICT (account, chat_name) DO UPDATE SET
+                                    message_count = message_count + excluded.message_count,
+                                    last_sender = CASE WHEN excluded.last_id > last_id THEN excluded.last_sender ELSE last_sender END,
+                                    last_text = CASE WHEN excluded.last_id > last_id THEN excluded.last_text ELSE last_text END,
+                                    last_timestamp = CASE WHEN excluded.last_id > last_id THEN excluded.last_timestamp ELSE last_timestamp END,
+                                    last_id = MAX(last_id, excluded.last_id)''', (done, top))
+                added += conn.execute("SELECT COUNT(*) FROM messages WHERE id > ? AND id <= ?", (done, top)).fetchone()[0]
+                conn.execute("INSERT OR REPLACE INTO chat_summary_state (key, value) VALUES ('backfill_done', ?)", (top,))
+                conn.commit()
+                done = top
+                if self._on_commit:
+                    self._on_commit()
+            _LOGGER.info(f"Chat summaries backfilled with {added} messages")
+            return added
+        finally:
+            conn.close()
+
+    def list_chats(self, account=None, limit=100, offset=0):
+        """Chats with their latest message, most recently active first."""
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            where, params = ("WHERE account = ? ", [account]) if account else ("", [])
+            rows = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM chat_summary {where}ORDER BY last_id DESC LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
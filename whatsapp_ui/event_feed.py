@@ -0,0 +1,92 @@
+"""In-memory feed of ingest events, streamed to dashboards as server-sent events."""
+import collections
+import json
+import threading
+import uuid
+
+
+class EventFeed:
+    """
+    Keeps the most recent events with increasing ids so a client that reconnects
+    with its last event id gets exactly what it missed. Waiting clients block on a
+    condition variable and cost nothing until something is published. SSE ids
+    carry a per-process boot id ("<boot>-<n>"), so an id from before a restart
+    is recognised even once the new process has published as many events.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._events = collections.deque(maxlen=maxlen)
+        # Distinguishes ids of this process from those before a restart
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data):
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def sse_id(self, event_id):
+        return f"{self._boot_id}-{event_id}"
+
+    def parse_sse_id(self, value):
+        """The event number of an SSE id sent by this process, else None."""
+        boot_id, _, number = (value or "").rpartition("-")
+        if boot_id != self._boot_id or not number.isdigit():
+            return None
+        return int(number)
+
+    def since(self, last_event_id):
+        """
+        Events newer than `last_event_id`, or None if the client cannot be resumed
+        (the events were already dropped, or the id is from before a restart).
+        """
+        with self._cond:
+            if last_event_id > self._last_id:
+                return None
+            if self._events and self._events[0][0] > last_event_id + 1:
+                return None
+            return [event for event in self._events if event[0] > last_event_id]
+
+    def wait(self, last_event_id, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id != last_event_id, timeout)
+        return self.since(last_event_id)
+
+    def stream(self, last_event_id=None, keepalive=25, accept=None):
+        """
+        Generator of SSE frames, starting after `last_event_id` (or from now).
+        That is an event number, or an SSE id from a client; one this process
+        didn't send gets a "reset". `accept(event_type, data)` can narrow the
+        stream down to some events.
+        """
+        # Ask the browser to wait a bit before reconnecting after a drop
+        yield "retry: 3000\n\n"
+        if isinstance(last_event_id, str):
+            resumed = self.parse_sse_id(last_event_id)
+            last_event_id = self._last_id if resumed is None else resumed
+            if resumed is None:
+                yield f"id: {self.sse_id(last_event_id)}\nevent: reset\ndata: {{}}\n\n"
+        elif last_event_id is None:
+            last_event_id = self._last_id
+        while True:
+            events = self.wait(last_event_id, keepalive)
+            if events is None:
+                # Too far behind to replay: the client reloads everything instead
+                last_event_id = self._last_id
+                yield f"id: {self.sse_id(last_event_id)}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event_id, event_type, data in events:
+                last_event_id = event_id
+                if accept and not accept(event_type, data):
+                    continue
+                yield f"id: {self.sse_id(event_id)}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
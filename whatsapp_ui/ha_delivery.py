@@ -0,0 +1,232 @@
+"""Batched, persistent delivery of monitored messages to Home Assistant."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import metrics
+from blocking import run_native
+
+_LOGGER = logging.getLogger(__name__)
+
+# Event fired on the HA bus when no webhook id is configured
+HA_EVENT_TYPE = "whatsapp_gateway_messages"
+
+delivery_lag = metrics.histogram("ha_delivery_lag_seconds", "Time between a message being queued and delivered to HA")
+delivery_batch_size = metrics.histogram("ha_delivery_batch_size", "Messages per delivered batch",
+                                        buckets=(1, 5, 10, 25, 50, 100, 250))
+delivered_total = metrics.counter("ha_delivered_messages_total", "Messages delivered to HA")
+delivery_failures = metrics.counter("ha_delivery_failures_total", "Failed batch deliveries to HA")
+pending_gauge = metrics.gauge("ha_delivery_pending", "Messages waiting to be delivered to HA")
+dead_lettered = metrics.counter("ha_delivery_dead_letter_total", "Messages given up on and moved to the dead-letter table")
+
+
+class HADelivery:
+    """
+    Collects newly detected messages and pushes them to Home Assistant in batches.
+
+    Messages are written to the `delivery_queue` table first, so a restart or an
+    unreachable HA never loses them. Batches are taken strictly in queue order and
+    a failed batch blocks everything behind it, which keeps delivery ordered per chat.
+    Nothing is queued while no HA target is configured, and a batch HA rejects
+    (4xx other than 408/429) or that failed `max_attempts` times is moved to
+    `delivery_dead_letter`, so one bad batch can't block the queue forever.
+    """
+
+    def __init__(self, db_file, get_config, interval=5, max_batch=100, max_backoff=300, max_attempts=10):
+        self._db_file = db_file
+        self._get_config = get_config
+        self._interval = interval
+        self._max_batch = max_batch
+        self._max_backoff = max_backoff
+        self._max_attempts = max_attempts
+        self._backoff = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # One pooled keep-alive connection to HA for every batch, created on first flush
+        self._session = None
+
+    @staticmethod
+    def init_db(conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS delivery_queue
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         account TEXT,
+                         chat_name TEXT,
+                         payload TEXT,
+                         queued_at REAL,
+                         attempts INTEGER DEFAULT 0)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS delivery_dead_letter
+                        (id INTEGER PRIMARY KEY,
+                         account TEXT,
+                         chat_name TEXT,
+                         payload TEXT,
+                         queued_at REAL,
+                         attempts INTEGER,
+                         failed_at REAL,
+                         error TEXT)''')
+
+    def enqueue(self, account, chat_name, message):
+        """
+        Persist a message for delivery. `message` is a JSON-serialisable dict.
+        Dropped when HA isn't configured, as it could never be delivered.
+        """
+        if self._target() is None:
+            return
+        run_native(self._insert, account, chat_name, json.dumps(message))
+
+    def _insert(self, account, chat_name, payload):
+        conn = sqlite3.connect(self._db_file)
+        try:
+            conn.execute("INSERT INTO delivery_queue (account, chat_name, payload, queued_at) VALUES (?, ?, ?, ?)",
+                         (account, chat_name, payload, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ha-delivery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run(self):
+        _LOGGER.info("Starting HA delivery thread...")
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._backoff or self._get_config().get("delivery_interval", self._interval))
+            self._wakeup.clear()
+            try:
+                # Drain the queue batch by batch until it is empty or HA fails
+                while self.flush():
+                    pass
+            except Exception as e:
+                _LOGGER.error(f"Error in HA delivery: {e}")
+
+    def _target(self):
+        """Returns (url, headers) for the configured delivery method, or None."""
+        config = self._get_config()
+        ha_url = (config.get("ha_url") or "").rstrip("/")
+        if not ha_url:
+            return None
+        webhook_id = config.get("ha_webhook_id")
+        if webhook_id:
+            return f"{ha_url}/api/webhook/{webhook_id}", {"Content-Type": "application/json"}
+        ha_token = config.get("ha_token")
+        if not ha_token:
+            return None
+        headers = {
+            "Authorization": f"Bearer {ha_token}",
+            "Content-Type": "application/json",
+        }
+        return f"{ha_url}/api/events/{HA_EVENT_TYPE}", headers
+
+    @staticmethod
+    def _dead_letter(conn, ids, max_attempts, error):
+        """
+        Moves the queued rows in `ids` to the dead-letter table, only those with
+        at least `max_attempts` attempts unless that is None. Returns how many moved.
+        """
+        where = "id = ?" if max_attempts is None else "id = ? AND attempts >= ?"
+        params = ids if max_attempts is None else [(row_id, max_attempts) for (row_id,) in ids]
+        now = time.time()
+        moved = 0
+        for param in params:
+            cursor = conn.execute(f'''INSERT INTO delivery_dead_letter (id, account, chat_name, payload, queued_at, attempts, failed_at, error)
+                                     SELECT id, account, chat_name, payload, queued_at, attempts, ?, ? FROM delivery_queue WHERE {where}''',
+                                  (now, error) + param)
+            if cursor.rowcount:
+                conn.execute("DELETE FROM delivery_queue WHERE id = ?", param[:1])
+                moved += 1
+        if moved:
+            dead_lettered.inc(moved)
+        return moved
+
+    def _next_batch(self):
+        """Returns (pending count, oldest batch of rows)."""
+        conn = sqlite3.connect(self._db_file)
+        try:
+            pending = conn.execute("SELECT COUNT(*) FROM delivery_queue").fetchone()[0]
+            rows = conn.execute("SELECT id, account, chat_name, payload, queued_at FROM delivery_queue ORDER BY id LIMIT ?",
+                                (self._max_batch,)).fetchall() if pending else []
+            return pending, rows
+        finally:
+            conn.close()
+
+    def _record_failure(self, ids, rejected, error):
+        """Counts an attempt for the rows in `ids`. Returns how many were dead-lettered."""
+        conn = sqlite3.connect(self._db_file)
+        try:
+            conn.executemany("UPDATE delivery_queue SET attempts = attempts + 1 WHERE id = ?", ids)
+            dead = self._dead_letter(conn, ids, None if rejected else self._max_attempts, error)
+            conn.commit()
+            return dead
+        finally:
+            conn.close()
+
+    def _remove(self, ids):
+        conn = sqlite3.connect(self._db_file)
+        try:
+            conn.executemany("DELETE FROM delivery_queue WHERE id = ?", ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def flush(self):
+        """
+        Deliver the oldest pending batch.
+        Returns True if a full batch was delivered, or the batch was dead-lettered,
+        and more may be waiting.
+        """
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        target = self._target()
+        pending, rows = run_native(self._next_batch)
+        pending_gauge.set(pending)
+        if not pending or not target:
+            return False
+
+        payload = {
+            "messages": [
+                dict(json.loads(row[3]), account=row[1], chat_name=row[2], queued_at=row[4])
+                for row in rows
+            ]
+        }
+        url, headers = target
+        ids = [(row[0],) for row in rows]
+        try:
+            response = self._session.post(url, headers=headers, json=payload, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            delivery_failures.inc()
+            status = e.response.status_code if e.response is not None else None
+            # Client errors other than timeouts and rate limits won't go away by retrying
+            rejected = status is not None and 400 <= status < 500 and status not in (408, 429)
+            dead = run_native(self._record_failure, ids, rejected, str(e))
+            if dead:
+                _LOGGER.error(f"Gave up delivering {dead} messages to HA, moved to delivery_dead_letter: {e}")
+                if dead == len(rows):
+                    self._backoff = 0
+                    return True
+            self._backoff = min(self._max_backoff, max(self._interval, self._backoff * 2))
+            _LOGGER.warning(f"HA delivery of {len(rows)} messages failed, retrying in {self._backoff}s: {e}")
+            return False
+
+        run_native(self._remove, ids)
+        self._backoff = 0
+
+        now = time.time()
+        for row in rows:
+            delivery_lag.observe(now - row[4])
+        delivery_batch_size.observe(len(rows))
+        delivered_total.inc(len(rows))
+        pending_gauge.set(pending - len(rows))
+        _LOGGER.info(f"Delivered {len(rows)} messages to Home Assistant")
+        return len(rows) == self._max_batch
@@ -0,0 +1,231 @@
+"""Offline reply suggestions learned from the user's own past replies."""
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from blocking import run_native
+
+_LOGGER = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+_WORD = re.compile(r"[^\W_]{2,}")
+# Rows can also arrive without a notify() (chat_import.py, other processes)
+CATCH_UP_INTERVAL = 60
+# Longer messages are rarely a reusable reply
+MAX_REPLY_LENGTH = 120
+
+
+def words(text):
+    return set(_WORD.findall((text or "").lower()))
+
+
+def reply_key(text):
+    return " ".join((text or "").lower().split())
+
+
+class LocalSuggester:
+    """
+    Learns which of the user's replies follow which words in incoming messages.
+    Every outgoing message (sender in `my_names`) is paired with the last
+    incoming message of its chat, and each word of that message counts toward
+    the reply. Suggesting is a weighted vote of the query's words over those
+    counts and takes well under a millisecond.
+
+    The model is bounded: at most `max_terms` words with `replies_per_term`
+    replies each and `max_replies` distinct replies, evicting the rarest first,
+    so memory and the model file stay a few MB however long the history is.
+    Training resumes from a high-water mark on the messages table.
+    """
+
+    def __init__(self, db_file, get_config, model_file=None, max_terms=20000, replies_per_term=16,
+                 max_replies=5000, max_chats=2000, batch=5000):
+        self._db_file = db_file
+        self._get_config = get_config
+        root, _ = os.path.splitext(os.path.abspath(db_file))
+        self._model_file = model_file or f"{root}_suggest.json"
+        self._max_terms = max_terms
+        self._replies_per_term = replies_per_term
+        self._max_replies = max_replies
+        self._max_chats = max_chats
+        self._batch = batch
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._reset([])
+        self._loaded = False
+
+    def _reset(self, my_names):
+        self.my_names = sorted(my_names)
+        self.last_id = 0
+        self.pairs = 0
+        self.df = {}          # word -> pairs containing it
+        self.assoc = {}       # word -> {reply key: count}
+        self.replies = {}     # reply key -> [text, count]
+        self.last_incoming = {}  # "account|chat" -> text
+
+    def _configured_names(self):
+        return sorted({name.strip() for name in self._get_config().get("my_names", []) if name.strip()})
+
+    # --- Persistence ---
+
+    def load(self):
+        with self._lock:
+            self._loaded = True
+            if not os.path.exists(self._model_file):
+                return
+            try:
+                with open(self._model_file, 'r') as f:
+                    data = json.load(f)
+            except Exception as e:
+                _LOGGER.error(f"Failed to load suggestion model, retraining: {e}")
+                return
+            if data.get("version") != MODEL_VERSION:
+                return
+            self.my_names = data["my_names"]
+            self.last_id = data["last_id"]
+            self.pairs = data["pairs"]
+            self.df = data["df"]
+            self.assoc = data["assoc"]
+            self.replies = data["replies"]
+            self.last_incoming = data["last_incoming"]
+
+    def _save(self):
+        data = {
+            "version": MODEL_VERSION, "my_names": self.my_names, "last_id": self.last_id, "pairs": self.pairs,
+            "df": self.df, "assoc": self.assoc, "replies": self.replies, "last_incoming": self.last_incoming,
+        }
+        tmp_file = self._model_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_file, self._model_file)
+
+    # --- Training ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="local-suggester", daemon=True)
+        self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Called after messages were inserted."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(CATCH_UP_INTERVAL)
+            self._wakeup.clear()
+            try:
+                run_native(self.train)
+            except Exception as e:
+                _LOGGER.error(f"Error training suggestion model: {e}")
+
+    def train(self):
+        """Learns from all messages above the high-water mark. Returns the number of replies learned."""
+        if not self._loaded:
+            self.load()
+        names = self._configured_names()
+        if not names:
+            return 0
+        if names != self.my_names:
+            with self._lock:
+                _LOGGER.info("Own sender names changed, retraining suggestion model")
+                self._reset(names)
+        mine = set(names)
+
+        learned = 0
+        start_id = self.last_id
+        conn = sqlite3.connect(self._db_file)
+        try:
+            while not self._stopped.is_set():
+                rows = conn.execute("SELECT id, account, chat_name, sender, text FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                                    (self.last_id, self._batch)).fetchall()
+                if not rows:
+                    break
+                with self._lock:
+                    for row_id, account, chat_name, sender, text in rows:
+                        chat = f"{account}|{chat_name}"
+                        if sender not in mine:
+                            self.last_incoming.pop(chat, None)
+                            self.last_incoming[chat] = text
+                        elif chat in self.last_incoming and text and len(text) <= MAX_REPLY_LENGTH:
+                            self._learn(self.last_incoming[chat], text)
+                            learned += 1
+                    self.last_id = rows[-1][0]
+                    self._evict()
+        finally:
+            conn.close()
+        if self.last_id != start_id:
+            with self._lock:
+                self._save()
+        if learned:
+            _LOGGER.info(f"Suggestion model learned {learned} replies")
+        return learned
+
+    def _learn(self, incoming, reply):
+        key = reply_key(reply)
+        entry = self.replies.setdefault(key, [reply.strip(), 0])
+        entry[1] += 1
+        self.pairs += 1
+        for word in words(incoming):
+            self.df[word] = self.df.get(word, 0) + 1
+            counts = self.assoc.setdefault(word, {})
+            counts[key] = counts.get(key, 0) + 1
+            if len(counts) > self._replies_per_term:
+                del counts[min(counts, key=counts.get)]
+
+    def _evict(self):
+        """Drops the rarest words, replies and chats once a bound is exceeded by 10%."""
+        if len(self.assoc) > self._max_terms * 1.1:
+            for word in sorted(self.assoc, key=self.df.get)[:len(self.assoc) - self._max_terms]:
+                del self.assoc[word]
+                del self.df[word]
+        if len(self.replies) > self._max_replies * 1.1:
+            for key in sorted(self.replies, key=lambda k: self.replies[k][1])[:len(self.replies) - self._max_replies]:
+                del self.replies[key]
+            # Drop references to evicted replies
+            for counts in self.assoc.values():
+                for key in [key for key in counts if key not in self.replies]:
+                    del counts[key]
+        while len(self.last_incoming) > self._max_chats:
+            # Dicts keep insertion order and updates re-insert, so the first chat is the least recent
+            del self.last_incoming[next(iter(self.last_incoming))]
+
+    # --- Suggesting ---
+
+    def suggest(self, conversation, k=3):
+        """
+        Up to `k` past replies fitting the conversation (list of message dicts,
+        oldest first), best first. Scores come from the newest message not sent
+        by the user; frequent replies fill up when too few words are known.
+        """
+        if not self._loaded:
+            self.load()
+        mine = set(self.my_names)
+        incoming = next((msg.get('text', '') for msg in reversed(conversation) if msg.get('sender') not in mine), "")
+        with self._lock:
+            scores = {}
+            for word in words(incoming):
+                counts = self.assoc.get(word)
+                if not counts:
+                    continue
+                # Rare words say more about the reply than "ok" or "the"
+                weight = math.log(1 + self.pairs / self.df[word]) / self.df[word]
+                for key, count in counts.items():
+                    scores[key] = scores.get(key, 0) + weight * count
+            ranked = sorted(scores, key=lambda key: (-scores[key], -self.replies[key][1]))
+            if len(ranked) < k:
+                frequent = sorted(self.replies, key=lambda key: -self.replies[key][1])
+                ranked += [key for key in frequent[:k + len(ranked)] if key not in scores]
+            return [self.replies[key][0] for key in ranked[:k]]
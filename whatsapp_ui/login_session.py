@@ -0,0 +1,69 @@
+"""Watches a pending WhatsApp Web login and pushes QR refreshes to the browser."""
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LoginSession:
+    """
+    While an account is waiting for its QR code to be scanned, this is the only
+    thing that talks to its browser: it polls the login page in one script call,
+    publishes "qr" events whenever WhatsApp rotates the code and a final "login"
+    event, and keeps the latest status cached for everyone else.
+    """
+
+    def __init__(self, worker, feed, interval=1.5, timeout=300):
+        self.worker = worker
+        self.account = worker.account
+        self._feed = feed
+        self._interval = interval
+        self._timeout = timeout
+        self._stopped = threading.Event()
+        self.status = "loading"
+        self.qr_code = None
+
+    @property
+    def active(self):
+        return not self._stopped.is_set()
+
+    def start(self, status, qr_code):
+        """Start watching from the state returned by get_qr_code_or_login."""
+        self._update(status, qr_code)
+        if status == "logged_in":
+            self._stopped.set()
+            return
+        threading.Thread(target=self._run, name=f"login-{self.account}", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _update(self, status, qr_code):
+        if status == self.status and qr_code == self.qr_code:
+            return
+        self.status = status
+        self.qr_code = qr_code
+        if status == "qr_code":
+            self._feed.publish("qr", {"account": self.account, "qr_code": qr_code})
+        else:
+            self._feed.publish("login", {"account": self.account, "status": status})
+
+    def _run(self):
+        started = time.monotonic()
+        while not self._stopped.wait(self._interval):
+            if time.monotonic() - started > self._timeout:
+                _LOGGER.info(f"[{self.account}] QR login timed out")
+                self._update("expired", None)
+                break
+            try:
+                status, qr_code = self.worker.login_snapshot()
+            except Exception as e:
+                _LOGGER.error(f"[{self.account}] Failed to read login state: {e}")
+                self._update("error", None)
+                break
+            self._update(status, qr_code)
+            if status == "logged_in":
+                _LOGGER.info(f"[{self.account}] Logged in")
+                break
+        self._stopped.set()
@@ -0,0 +1,204 @@
+"""
+Streaming export of the message archive as NDJSON, CSV or Parquet.
+
+    python message_export.py --format csv --account Gateway --since 2024-01-01 -o messages.csv
+    python message_export.py --format parquet --chat "Alice" -o alice.parquet
+
+Rows are read with fetchmany in id order and encoded batch by batch, so memory
+stays flat however large the archive is. The database runs in WAL mode, so an
+export reads a snapshot and never holds up the gateway's writes. Parquet needs
+pyarrow (pip install pyarrow).
+"""
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+
+COLUMNS = ("id", "account", "chat_name", "sender", "text", "timestamp")
+BATCH_SIZE = 5000
+
+
+class ExportUnavailable(Exception):
+    """Raised when a format's optional dependency is missing."""
+
+
+def build_query(account=None, chat_name=None, since=None, until=None, after_id=None):
+    """
+    SELECT for the filtered messages in id order. `since` / `until` compare
+    against the stored timestamp text, which orders correctly for ISO
+    timestamps ("2024-01-31 18:00:00", "2024-01-31T18:00:00").
+    """
+    clauses, params = [], []
+    for clause, value in (("account = ?", account), ("chat_name = ?", chat_name), ("timestamp >= ?", since),
+                          ("timestamp < ?", until), ("id > ?", after_id)):
+        if value is not None and value != "":
+            clauses.append(clause)
+            params.append(value)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT {', '.join(COLUMNS)} FROM messages{where} ORDER BY id", params
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+def iter_batches(db_file, batch_size=BATCH_SIZE, run=_call, **filters):
+    """
+    Lists of up to `batch_size` row tuples, read through one cursor. The query
+    and every fetch go through `run(fn, *args)`, which may call them on another
+    thread (the gateway passes blocking.run_native).
+    """
+    query, params = build_query(**filters)
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    try:
+        cursor = run(conn.execute, query, params)
+        while True:
+            rows = run(cursor.fetchmany, batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+class NDJSONEncoder:
+    content_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def begin(self):
+        return b""
+
+    def encode(self, rows):
+        return "".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+    def end(self):
+        return b""
+
+
+class CSVEncoder:
+    content_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _take(self):
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def begin(self):
+        self._writer.writerow(COLUMNS)
+        return self._take()
+
+    def encode(self, rows):
+        self._writer.writerows(rows)
+        return self._take()
+
+    def end(self):
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetEncoder:
+    """One row group per batch; the footer comes with end()."""
+
+    content_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportUnavailable("Parquet export needs pyarrow (pip install pyarrow)")
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([("id", pyarrow.int64())] + [(name, pyarrow.string()) for name in COLUMNS[1:]])
+        self._sink = _ChunkSink()
+        self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def begin(self):
+        return self._sink.take()
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema,
+        ))
+        return self._sink.take()
+
+    def end(self):
+        self._writer.close()
+        return self._sink.take()
+
+
+ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "parquet": ParquetEncoder}
+
+
+def stream_export(db_file, encoder, batch_size=BATCH_SIZE, run=_call, **filters):
+    """Encoded chunks of the export, one per batch."""
+    yield encoder.begin()
+    for rows in iter_batches(db_file, batch_size, run, **filters):
+        chunk = encoder.encode(rows)
+        if chunk:
+            yield chunk
+    yield encoder.end()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export messages from the gateway database",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument("--db", default="whatsapp.db")
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="ndjson")
+    parser.add_argument("--account")
+    parser.add_argument("--chat", dest="chat_name")
+    parser.add_argument("--since", help="Earliest timestamp (ISO), inclusive")
+    parser.add_argument("--until", help="Latest timestamp (ISO), exclusive")
+    parser.add_argument("--after-id", type=int, help="Only messages with a higher id (incremental exports)")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        encoder = ENCODERS[args.format]()
+    except ExportUnavailable as e:
+        parser.error(str(e))
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_export(args.db, encoder, account=args.account, chat_name=args.chat_name,
+                                   since=args.since, until=args.until, after_id=args.after_id):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
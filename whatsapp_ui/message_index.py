@@ -0,0 +1,151 @@
+"""Incremental full-text index over the message history, for suggestion context."""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from blocking import run_native
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rows can also arrive without a notify() (chat_import.py, other processes)
+CATCH_UP_INTERVAL = 60
+
+# Letters and digits only: FTS5's tokenizer splits on "_" and punctuation
+_WORD = re.compile(r"[^\W_]{3,}")
+
+
+def chat_key(account, chat_name):
+    """Fixed-length prefix identifying a chat."""
+    return "c" + hashlib.sha1(f"{account}\x1f{chat_name}".encode("utf-8")).hexdigest()[:16]
+
+
+def chat_terms(account, chat_name, text):
+    """
+    Words of a message, each prefixed with its chat key. Every chat gets its own
+    vocabulary, so a lookup only reads the posting lists of that chat instead
+    of intersecting history-wide lists with a chat filter.
+    """
+    key = chat_key(account, chat_name)
+    return " ".join(key + word for word in _WORD.findall((text or "").lower()))
+
+
+def query_terms(account, chat_name, texts, limit=12):
+    """Distinct chat-prefixed words of `texts`, first text first, quoted for an FTS5 MATCH."""
+    key = chat_key(account, chat_name)
+    terms = []
+    for text in texts:
+        for word in _WORD.findall((text or "").lower()):
+            if word not in terms:
+                terms.append(word)
+    return [f'"{key}{term}"' for term in terms[:limit]]
+
+
+class MessageIndex:
+    """
+    BM25 index of the `messages` table in an FTS5 database next to it
+    (whatsapp.db -> whatsapp_index.db), with per-chat terms. Rows are indexed
+    in id order from a stored high-water mark by a background thread woken on
+    every write (and every CATCH_UP_INTERVAL seconds), so ingest never waits
+    for indexing and a rebuild only ever covers new rows.
+    """
+
+    def __init__(self, db_file, index_file=None, batch=20000):
+        self._db_file = os.path.abspath(db_file)
+        root, ext = os.path.splitext(self._db_file)
+        self._index_file = index_file or f"{root}_index{ext}"
+        self._batch = batch
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self._index_file)
+        conn.create_function("chat_terms", 3, chat_terms, deterministic=True)
+        conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+                        USING fts5(terms, tokenize="unicode61 remove_diacritics 2")''')
+        conn.execute("CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value INTEGER)")
+        return conn
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="message-index", daemon=True)
+        self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Called after messages were inserted."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(CATCH_UP_INTERVAL)
+            self._wakeup.clear()
+            try:
+                run_native(self.sync)
+            except Exception as e:
+                _LOGGER.error(f"Error indexing messages: {e}")
+
+    def sync(self):
+        """Indexes all messages above the high-water mark. Returns the number of rows added."""
+        with self._sync_lock:
+            conn = self._connect()
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (self._db_file,))
+                row = conn.execute("SELECT value FROM index_state WHERE key = 'last_id'").fetchone()
+                last_id = row[0] if row else 0
+                added = 0
+                while True:
+                    # One transaction per batch keeps the index readable during a large catch-up
+                    top = conn.execute("SELECT MAX(id) FROM (SELECT id FROM src.messages WHERE id > ? ORDER BY id LIMIT ?)",
+                                       (last_id, self._batch)).fetchone()[0]
+                    if top is None:
+                        break
+                    cursor = conn.execute('''INSERT INTO message_fts (rowid, terms)
+                                             SELECT id, chat_terms(account, chat_name, text)
+                                             FROM src.messages WHERE id > ? AND id <= ?''', (last_id, top))
+                    conn.execute("INSERT OR REPLACE INTO index_state (key, value) VALUES ('last_id', ?)", (top,))
+                    conn.commit()
+                    added += cursor.rowcount
+                    last_id = top
+                if added:
+                    _LOGGER.info(f"Indexed {added} messages for suggestion context")
+                return added
+            finally:
+                conn.close()
+
+    def search(self, account, chat_name, texts, k=5, exclude=()):
+        """
+        Up to `k` earlier messages of the chat that best match `texts` (BM25),
+        as dicts with sender, text and timestamp, oldest first. Messages whose
+        text is in `exclude` (the visible conversation) are skipped.
+        """
+        terms = query_terms(account, chat_name, texts)
+        if not terms or k <= 0:
+            return []
+        conn = self._connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (self._db_file,))
+            rows = conn.execute(
+                '''SELECT m.id, m.sender, m.text, m.timestamp
+                   FROM (SELECT rowid, bm25(message_fts) AS rank FROM message_fts
+                         WHERE message_fts MATCH ? ORDER BY rank LIMIT ?) AS hit
+                   JOIN src.messages m ON m.id = hit.rowid
+                   ORDER BY hit.rank''',
+                (" OR ".join(terms), k + len(exclude)),
+            ).fetchall()
+        finally:
+            conn.close()
+        exclude = set(exclude)
+        hits = [row for row in rows if row[2] not in exclude][:k]
+        hits.sort(key=lambda row: row[0])
+        return [{"sender": sender, "text": text, "timestamp": timestamp} for _, sender, text, timestamp in hits]
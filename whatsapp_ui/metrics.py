@@ -0,0 +1,181 @@
+"""Small in-process metrics registry for the gateway, with Prometheus text output."""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_registry = {}
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+# For request and query timings, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self._labels = labels
+        self._children = {}
+
+    def labels(self, **labels):
+        """Child metric for one combination of label values."""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with _lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                child._labels = key
+                self._children[key] = child
+            return child
+
+    def _series(self):
+        """(label pairs, metric) for this metric and each labelled child."""
+        if self._children:
+            return list(self._children.items())
+        return [(self._labels, self)]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.description)
+
+    def inc(self, amount=1):
+        with _lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.value = 0
+
+    def _new_child(self):
+        return Gauge(self.name, self.description)
+
+    def set(self, value):
+        with _lock:
+            self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS, labels=()):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.description, self.buckets)
+
+    def observe(self, value):
+        with _lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    @contextmanager
+    def time(self):
+        """Observes the duration of the `with` block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0,
+            "buckets": dict(zip(self.buckets, self.counts)),
+        }
+
+
+def _get_or_create(cls, name, description, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, description, **kwargs)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name, description=""):
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name, description=""):
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name, description="", buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, description, buckets=buckets)
+
+
+def snapshot():
+    """Return the current value of every registered metric."""
+    result = {}
+    for name, metric in list(_registry.items()):
+        if metric._children:
+            result[name] = {",".join(f"{k}={v}" for k, v in key): child.snapshot()
+                            for key, child in list(metric._children.items())}
+        else:
+            result[name] = metric.snapshot()
+    return result
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {metric.description}")
+        lines.append(f"# TYPE {name} {metric.type_name}")
+        for pairs, series in metric._series():
+            if isinstance(series, Histogram):
+                for bound, count in zip(series.buckets, series.counts):
+                    lines.append(f"{name}_bucket{_format_labels(pairs + (('le', _format_value(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(pairs + (('le', '+Inf'),))} {series.count}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(series.sum)}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {series.count}")
+            else:
+                lines.append(f"{name}{_format_labels(pairs)} {_format_value(series.value)}")
+    return "\n".join(lines) + "\n"
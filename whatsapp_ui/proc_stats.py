@@ -0,0 +1,73 @@
+"""Resource usage of a process and its children, read from /proc (Linux only)."""
+import os
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _read_stat(pid):
+    """Returns (ppid, cpu_seconds, rss_bytes) for one pid, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so split after its closing parenthesis
+    fields = stat[stat.rindex(")") + 2:].split()
+    ppid = int(fields[1])
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    rss_bytes = int(fields[21]) * _PAGE_SIZE
+    return ppid, cpu_seconds, rss_bytes
+
+
+def _process_table():
+    """Returns ({pid: (ppid, cpu_seconds, rss_bytes)}, {ppid: [child pids]})."""
+    stats = {}
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = _read_stat(int(entry))
+        if stat:
+            stats[int(entry)] = stat
+            children.setdefault(stat[0], []).append(int(entry))
+    return stats, children
+
+
+def descendants(pid):
+    """All child, grandchild, ... pids of `pid`."""
+    if not os.path.isdir("/proc"):
+        return []
+    _, children = _process_table()
+    result = []
+    pending = list(children.get(pid, []))
+    while pending:
+        current = pending.pop()
+        result.append(current)
+        pending.extend(children.get(current, []))
+    return result
+
+
+def process_tree_usage(pid):
+    """
+    Sums RSS and CPU time of `pid` and all its descendants (e.g. a browser worker
+    with chromedriver and every Chromium renderer).
+    Returns {"rss_bytes", "cpu_seconds", "processes"} or None where /proc is unavailable.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+
+    stats, children = _process_table()
+    if pid not in stats:
+        return None
+
+    usage = {"rss_bytes": 0, "cpu_seconds": 0.0, "processes": 0}
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        _, cpu_seconds, rss_bytes = stats[current]
+        usage["rss_bytes"] += rss_bytes
+        usage["cpu_seconds"] += cpu_seconds
+        usage["processes"] += 1
+        pending.extend(children.get(current, []))
+    return usage
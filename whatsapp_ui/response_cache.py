@@ -0,0 +1,102 @@
+"""Write-generation ETags and pre-serialised JSON responses for read endpoints."""
+import json
+import sqlite3
+import threading
+import uuid
+
+import metrics
+
+cache_hits = metrics.counter("response_cache_hits_total", "Responses served from the serialised cache")
+cache_not_modified = metrics.counter("response_cache_not_modified_total", "Conditional requests answered with 304")
+cache_misses = metrics.counter("response_cache_misses_total", "Responses that had to query SQLite")
+cache_hit_rate = metrics.gauge("response_cache_hit_rate", "Share of cached reads answered without SQLite")
+
+
+class ResponseCache:
+    """
+    Every insert or update bumps a generation counter. Responses are cached per
+    key (route and filter) together with the generation they were built at, and
+    the generation doubles as a strong ETag, so a client that already has the
+    current data gets a 304 without any query or serialisation.
+
+    With a `db_file`, every lookup also checks SQLite's data_version, which
+    moves when another connection commits. A commit that wasn't followed by a
+    bump() came from another process (chat_import.py), so the cache is bumped
+    and `on_external_write()` called.
+    """
+
+    def __init__(self, db_file=None, on_external_write=None):
+        # Distinguishes generations of this process from those before a restart
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._db_file = db_file
+        self._on_external_write = on_external_write
+        self._conn = None
+        self._seen_version = None
+
+    @property
+    def etag(self):
+        return f'"{self._boot_id}-{self._generation}"'
+
+    def _data_version(self):
+        # Only ever used under the lock, never written through
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._db_file, check_same_thread=False)
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            if self._db_file:
+                self._seen_version = self._data_version()
+
+    def _external_write(self):
+        """Whether the database changed since the last bump() or lookup without a bump()."""
+        with self._lock:
+            version = self._data_version()
+            changed = self._seen_version is not None and version != self._seen_version
+            self._seen_version = version
+        return changed
+
+    def lookup(self, key, if_none_match, build):
+        """
+        Returns (status, etag, body). status is 304 with an empty body when the
+        client's ETag is current, else 200 with the cached or freshly built JSON.
+        `build` is only called on a cache miss and returns a JSON-serialisable value.
+        """
+        if self._db_file and self._external_write():
+            self.bump()
+            if self._on_external_write:
+                self._on_external_write()
+        with self._lock:
+            generation = self._generation
+            etag = self.etag
+            body = self._entries.get(key)
+
+        if if_none_match and etag in if_none_match:
+            cache_not_modified.inc()
+            self._update_rate()
+            return 304, etag, b""
+
+        if body is not None:
+            cache_hits.inc()
+            self._update_rate()
+            return 200, etag, body
+
+        cache_misses.inc()
+        self._update_rate()
+        body = json.dumps(build()).encode("utf-8")
+        with self._lock:
+            # A write during the query already cleared the cache; don't store stale data
+            if self._generation == generation:
+                self._entries[key] = body
+        return 200, etag, body
+
+    @staticmethod
+    def _update_rate():
+        served = cache_hits.value + cache_not_modified.value
+        total = served + cache_misses.value
+        cache_hit_rate.set(served / total if total else 0)
@@ -0,0 +1,98 @@
+"""Per-chat high-water marks for incremental scraping, stored in whatsapp.db."""
+import hashlib
+import sqlite3
+from datetime import datetime
+
+
+def message_hash(message):
+    """Stable content hash of a scraped "[meta] text" message string."""
+    return hashlib.sha1(message.encode("utf-8")).hexdigest()
+
+
+class ScrapeState:
+    """
+    Remembers, per chat, what the sidebar row looked like on the last run and
+    which message bubble was the newest one already captured. Marks are keyed
+    by the sidebar row key (see WhatsAppWebClient), so chats that share a name
+    keep separate marks; `chat_name` is only stored for display.
+    Connections are opened per call so the object can be shared across threads.
+    """
+
+    def __init__(self, db_file, account):
+        self.db_file = db_file
+        self.account = account
+
+    @staticmethod
+    def init_db(conn):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_marks)").fetchall()]
+        if columns and "chat_key" not in columns:
+            # Marks used to be keyed by chat name, which was also the row key of older versions
+            conn.execute("ALTER TABLE chat_marks RENAME TO chat_marks_by_name")
+        conn.execute('''CREATE TABLE IF NOT EXISTS chat_marks
+                        (account TEXT,
+                         chat_key TEXT,
+                         chat_name TEXT,
+                         preview TEXT,
+                         unread TEXT,
+                         last_timestamp TEXT,
+                         last_hash TEXT,
+                         updated_at TEXT,
+                         PRIMARY KEY (account, chat_key))''')
+        if columns and "chat_key" not in columns:
+            conn.execute('''INSERT INTO chat_marks (account, chat_key, chat_name, preview, unread, last_timestamp, last_hash, updated_at)
+                            SELECT account, chat_name, chat_name, preview, unread, last_timestamp, last_hash, updated_at
+                            FROM chat_marks_by_name''')
+            conn.execute("DROP TABLE chat_marks_by_name")
+        # Where an interrupted full sidebar crawl should resume; last_chat is the row key of the chat
+        conn.execute('''CREATE TABLE IF NOT EXISTS crawl_checkpoints
+                        (account TEXT PRIMARY KEY,
+                         last_chat TEXT,
+                         scroll_top INTEGER,
+                         updated_at TEXT)''')
+
+    def get(self, chat_key):
+        """Returns the mark for one chat as a dict, or None if the chat was never scraped."""
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT preview, unread, last_timestamp, last_hash FROM chat_marks WHERE account = ? AND chat_key = ?",
+                               (self.account, chat_key)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def save(self, chat_key, chat_name, preview, unread, last_timestamp, last_hash):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute("INSERT OR REPLACE INTO chat_marks (account, chat_key, chat_name, preview, unread, last_timestamp, last_hash, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (self.account, chat_key, chat_name, preview, unread, last_timestamp, last_hash, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load_checkpoint(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT last_chat, scroll_top FROM crawl_checkpoints WHERE account = ?",
+                               (self.account,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def save_checkpoint(self, last_chat, scroll_top):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute("INSERT OR REPLACE INTO crawl_checkpoints (account, last_chat, scroll_top, updated_at) VALUES (?, ?, ?, ?)",
+                         (self.account, last_chat, scroll_top, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear_checkpoint(self):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute("DELETE FROM crawl_checkpoints WHERE account = ?", (self.account,))
+            conn.commit()
+        finally:
+            conn.close()
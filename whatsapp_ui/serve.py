@@ -0,0 +1,46 @@
+"""
+Runs the WhatsApp gateway.
+
+    python serve.py                 # threaded server, same as `python app.py`
+    python serve.py --async         # gevent server
+
+In async mode the standard library is monkey-patched by gevent before anything
+else is imported, so every socket (HA calls, SSE streams, the pipes to browser
+workers) is cooperative and thousands of idle connections cost one greenlet each.
+Calls that block in C code (Gemini SDK, browser worker start-up, Selenium sends)
+run in the bounded pools from blocking.py, SQLite queries (request handlers,
+exports, the index, suggester and summary jobs) go through run_native() onto
+gevent's native thread pool, and browser workers are spawned from a fresh
+interpreter. Routes and templates are the same in both modes.
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WhatsApp gateway server")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Serve with gevent (see requirements-optional.txt)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+
+    if args.use_async:
+        from gevent import monkey
+        monkey.patch_all()
+
+        import account_workers
+        account_workers.use_start_method("spawn")
+
+    import app as gateway
+    flask_app = gateway.create_app()
+    gateway.start_background_workers()
+
+    if args.use_async:
+        from gevent.pywsgi import WSGIServer
+        print(f"Serving on http://{args.host}:{args.port} (gevent)")
+        WSGIServer((args.host, args.port), flask_app).serve_forever()
+    else:
+        flask_app.run(host=args.host, port=args.port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Micro-batching of suggestion requests into shared, rate-limited Gemini calls."""
+import json
+import logging
+import re
+import threading
+import time
+
+import metrics
+from blocking import ExecutorBusy
+
+_LOGGER = logging.getLogger(__name__)
+
+batch_size = metrics.histogram("gemini_batch_size", "Conversations per Gemini suggestion request",
+                               buckets=(1, 2, 4, 8, 16))
+queue_wait = metrics.histogram("suggestion_queue_seconds", "Time a suggestion request waited for its batch to be sent",
+                               buckets=metrics.LATENCY_BUCKETS)
+expired_total = metrics.counter("suggestion_deadline_exceeded_total", "Suggestion requests that missed their deadline")
+
+PROMPT_HEADER = (
+    "You are an assistant helping me reply to WhatsApp messages. Below are {count} separate "
+    "conversations, each starting with a line '### Conversation <id>'. Treat them independently.\n"
+    "For each conversation, generate 3 distinct, casual, and relevant short replies that I could send next. "
+    "Mimic the style of the user if possible.\n"
+    "Return ONLY a JSON object mapping every conversation id to a list of its 3 replies, "
+    "for example {{\"1\": [\"reply\", \"reply\", \"reply\"]}}.\n"
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class SuggestionTimeout(Exception):
+    """Raised when a suggestion request was not answered before its deadline."""
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def take(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+
+class _Request:
+    __slots__ = ("text", "queued_at", "deadline", "done", "result", "error")
+
+    def __init__(self, text, deadline):
+        self.text = text
+        self.queued_at = time.monotonic()
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        if not self.done.is_set():
+            self.result = result
+            self.error = error
+            self.done.set()
+
+
+def build_prompt(texts):
+    """One prompt for several conversation blocks, ids counted from 1."""
+    prompt = PROMPT_HEADER.format(count=len(texts))
+    for number, text in enumerate(texts, 1):
+        prompt += f"\n### Conversation {number}\n{text.strip()}\n"
+    return prompt
+
+
+def parse_response(text, count):
+    """
+    Replies per conversation from a model answer, as a list of `count` lists
+    (None where the answer has nothing for a conversation). A single
+    conversation also accepts the old pipe-separated format.
+    """
+    text = _FENCE.sub("", text.strip())
+    try:
+        answer = json.loads(text[text.index("{"):text.rindex("}") + 1])
+    except ValueError:
+        if count == 1:
+            replies = [s.strip() for s in text.split('|')]
+            return [replies if len(replies) >= 2 else text.split('\n')]
+        raise
+    results = []
+    for number in range(1, count + 1):
+        replies = answer.get(str(number))
+        if isinstance(replies, str):
+            replies = [replies]
+        results.append([str(reply).strip() for reply in replies] if replies else None)
+    return results
+
+
+class SuggestionBatcher:
+    """
+    Collects suggestion requests for `suggestion_batch_window` seconds after the
+    first one arrives (or until `suggestion_batch_size` are waiting) and sends
+    them to Gemini as one prompt, so a burst across several chats costs one
+    request instead of one each. Requests are sent at most at
+    `gemini_requests_per_minute`; while the rate limit holds a batch back, new
+    requests join it. Every request has a deadline: a caller gets
+    SuggestionTimeout when it passes, and requests already past theirs are
+    dropped from the queue instead of being sent.
+
+    `send(prompt, timeout)` performs the model call and returns its text.
+    """
+
+    def __init__(self, send, get_config):
+        self._send = send
+        self._get_config = get_config
+        self._pending = []
+        self._cond = threading.Condition()
+        self._bucket = TokenBucket(15 / 60, 1)
+        self._thread = None
+
+    def _setting(self, key, default):
+        return self._get_config().get(key, default)
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="suggestion-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, timeout):
+        """
+        Queues one conversation block and waits for its replies. Raises
+        ExecutorBusy when the queue is full and SuggestionTimeout after `timeout`
+        seconds.
+        """
+        request = _Request(text, time.monotonic() + timeout)
+        with self._cond:
+            if len(self._pending) >= self._setting("suggestion_queue_size", 32):
+                raise ExecutorBusy("suggestion queue is full")
+            self._ensure_started()
+            self._pending.append(request)
+            self._cond.notify()
+        if not request.done.wait(timeout):
+            expired_total.inc()
+            request.finish(error=SuggestionTimeout(f"No suggestions within {timeout}s"))
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _drop_expired(self, now):
+        """Removes finished and expired requests. Call with the condition held."""
+        alive = []
+        for request in self._pending:
+            if request.done.is_set():
+                continue
+            if request.deadline <= now:
+                expired_total.inc()
+                request.finish(error=SuggestionTimeout("Deadline passed while queued"))
+                continue
+            alive.append(request)
+        self._pending = alive
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._drop_expired(time.monotonic())
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+
+                max_batch = max(1, self._setting("suggestion_batch_size", 8))
+                window = self._setting("suggestion_batch_window", 0.25)
+                now = time.monotonic()
+                # Wait out the window unless the batch is already full
+                remaining = self._pending[0].queued_at + window - now
+                if remaining > 0 and len(self._pending) < max_batch:
+                    self._cond.wait(remaining)
+                    continue
+
+                rate = self._setting("gemini_requests_per_minute", 15) / 60
+                self._bucket.rate = rate
+                self._bucket.burst = max(1, self._setting("gemini_burst", 1))
+                delay = self._bucket.wait_time()
+                if delay > 0:
+                    # Wake early for the next deadline so expired requests fail promptly
+                    next_deadline = min(request.deadline for request in self._pending)
+                    self._cond.wait(max(0.01, min(delay, next_deadline - now)))
+                    continue
+
+                self._bucket.take()
+                batch, self._pending = self._pending[:max_batch], self._pending[max_batch:]
+
+            threading.Thread(target=self._send_batch, args=(batch,), name="suggestion-batch", daemon=True).start()
+
+    def _send_batch(self, batch):
+        now = time.monotonic()
+        for request in batch:
+            queue_wait.observe(now - request.queued_at)
+        batch_size.observe(len(batch))
+        timeout = max(request.deadline for request in batch) - now
+        try:
+            text = self._send(build_prompt([request.text for request in batch]), timeout)
+            results = parse_response(text, len(batch))
+        except Exception as e:
+            _LOGGER.error(f"Suggestion batch of {len(batch)} failed: {e}")
+            for request in batch:
+                request.finish(error=e)
+            return
+        for request, replies in zip(batch, results):
+            if replies:
+                request.finish(result=replies)
+            else:
+                request.finish(error=ValueError("No suggestions returned for this conversation"))
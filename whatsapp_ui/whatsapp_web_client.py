@@ -11,12 +11,49 @@ from selenium.webdriver.common.keys import Keys
 import time
 
 import logging
+from scrape_state import message_hash
+from proc_stats import process_tree_usage
+
 _LOGGER = logging.getLogger(__name__)
 
+BROWSER_PROFILES = ("default", "lean")
+
+# Extra Chromium switches of the "lean" profile, for small hosts
+LEAN_ARGUMENTS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--renderer-process-limit=1",
+    "--disk-cache-size=33554432",
+    "--media-cache-size=1048576",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication,BackForwardCache,InterestFeedContentSuggestions",
+    "--js-flags=--max-old-space-size=256",
+]
+
+# Requests the lean profile never lets through: fonts, video/audio and media
+# thumbnails. The QR code is drawn on a canvas, so login keeps working.
+LEAN_BLOCKED_URLS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.ogg", "*.mp3",
+    "*://mmg.whatsapp.net/*",
+    "*://pps.whatsapp.net/*",
+]
+
 class WhatsAppWebClient:
-    def __init__(self, user_data_dir=None):
+    def __init__(self, user_data_dir=None, profile="default", debug=False):
+        if profile not in BROWSER_PROFILES:
+            raise ValueError(f"Unknown browser profile: {profile}")
         self._driver = None
         self._user_data_dir = user_data_dir
+        self._profile = profile
+        self._debug = debug
+        self.peak_usage = {"rss_bytes": 0, "cpu_seconds": 0.0}
+        self.last_crawl_stats = {}
 
     def get_qr_code_or_login(self):
         """
@@ -30,7 +67,12 @@ class WhatsAppWebClient:
         chrome_options.add_argument("--headless")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
-        
+        if self._profile == "lean":
+            for argument in LEAN_ARGUMENTS:
+                chrome_options.add_argument(argument)
+            # Images are not needed for scraping text; 2 = block
+            chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
         # Check for common binary paths (especially for Home Assistant/Docker)
         import os
         possible_binaries = [
@@ -61,6 +103,13 @@ class WhatsAppWebClient:
                 _LOGGER.error(f"Fallback also failed: {e2}")
                 raise Exception("Google Chrome or Chromium is not installed or not found. Please install it on your Home Assistant server.")
         
+        if self._profile == "lean":
+            try:
+                self._driver.execute_cdp_cmd("Network.enable", {})
+                self._driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+            except Exception as e:
+                _LOGGER.warning(f"Could not install request blocking: {e}")
+
         self._driver.get("https://web.whatsapp.com")
         
         # Check if we are already logged in
@@ -81,12 +130,12 @@ class WhatsAppWebClient:
         qr_canvas_selector = "canvas"
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, qr_canvas_selector)))
         
-        self._driver.save_screenshot("debug_screenshot.png")
+        self._debug_screenshot("debug_screenshot.png")
         
         qr_canvas = self._driver.find_element(By.CSS_SELECTOR, qr_canvas_selector)
         
         qr_base64 = self._driver.execute_script(
-            "return arguments[0].toDataURL('image/png').substring(21);", 
+            "return arguments[0].toDataURL('image/png').substring(22);", 
             qr_canvas
         )
 
@@ -134,7 +183,7 @@ class WhatsAppWebClient:
             time.sleep(1)
         except Exception as e:
             _LOGGER.error("Failed to send message: %s", e)
-            self._driver.save_screenshot("send_message_error.png")
+            self._debug_screenshot("send_message_error.png")
             raise
 
     def get_latest_messages(self, chat_name):
@@ -167,76 +216,265 @@ class WhatsAppWebClient:
             return parsed_messages
         except Exception as e:
             _LOGGER.error(f"Failed to get messages from {chat_name}: {e}")
-            self._driver.save_screenshot(f"get_messages_error_{chat_name}.png")
+            self._debug_screenshot(f"get_messages_error_{chat_name}.png")
             return []
 
-    def scrape_all_data(self):
+    # Identifies a sidebar row by the chat's data-id, which survives renames and
+    # tells apart chats with the same name; the title only if there is none
+    _ROW_KEY_JS = """
+        const rowKey = row => {
+            const id = row.querySelector('[data-id]');
+            const title = row.querySelector('span[title]');
+            return id ? id.getAttribute('data-id') : (title ? title.getAttribute('title') : null);
+        };
+    """
+
+    # Collects key, title, full row text and unread badge of every rendered sidebar
+    # row in a single round trip instead of one find_element per row.
+    _SIDEBAR_ROWS_JS = _ROW_KEY_JS + """
+        return Array.from(document.querySelectorAll('#pane-side div[role="listitem"]')).map(row => {
+            const title = row.querySelector('span[title]');
+            const badge = row.querySelector('span[aria-label*="unread"]');
+            return {
+                key: rowKey(row),
+                title: title ? title.getAttribute('title') : null,
+                preview: row.innerText,
+                unread: badge ? badge.innerText : ''
+            };
+        });
+    """
+
+    _CLICK_ROW_JS = _ROW_KEY_JS + """
+        const rows = document.querySelectorAll('#pane-side div[role="listitem"]');
+        for (const row of rows) {
+            const title = row.querySelector('span[title]');
+            if (title && rowKey(row) === arguments[0]) {
+                title.click();
+                return true;
+            }
+        }
+        return false;
+    """
+
+    def _read_new_messages(self, last_hash=None, limit=20):
+        """
+        Reads message bubbles of the open chat from newest to oldest and stops at
+        the bubble matching `last_hash`. Returns messages in chronological order.
+        """
+        message_selector = '.message-in, .message-out'
+        bubbles = self._driver.find_elements(By.CSS_SELECTOR, message_selector)
+
+        new_messages = []
+        for msg in reversed(bubbles[-limit:]):
+            try:
+                text_element = msg.find_element(By.CSS_SELECTOR, '.copyable-text')
+                meta_data = text_element.get_attribute('data-pre-plain-text')
+                text = text_element.text
+            except:
+                continue # Ignore messages that are not simple text
+            message = f"{meta_data} {text}"
+            if last_hash and message_hash(message) == last_hash:
+                break
+            new_messages.append(message)
+
+        new_messages.reverse()
+        return new_messages
+
+    _SCROLL_PANE_JS = """
+        const pane = document.querySelector('#pane-side');
+        if (!pane) return null;
+        if (arguments[0] !== null) pane.scrollTop = arguments[0];
+        return {scrollTop: pane.scrollTop, scrollHeight: pane.scrollHeight, clientHeight: pane.clientHeight};
+    """
+
+    def iter_sidebar_rows(self, start_scroll=0, settle=0.4):
+        """
+        Walks the virtualised chat list top to bottom in viewport-sized scroll steps.
+        Yields (row, scroll_top) for every chat exactly once, by row key.
+        Only the keys of the previous viewport are kept, so memory does not grow
+        with the number of chats.
+        """
+        scroll_top = start_scroll
+        previous_keys = set()
+        while True:
+            pane = self._driver.execute_script(self._SCROLL_PANE_JS, scroll_top)
+            if not pane:
+                return
+            time.sleep(settle) # Let the virtual list render the new window
+
+            current_keys = set()
+            for row in self._driver.execute_script(self._SIDEBAR_ROWS_JS) or []:
+                key = row.get("key")
+                if not key or not row.get("title"):
+                    continue
+                current_keys.add(key)
+                if key not in previous_keys:
+                    yield row, pane["scrollTop"]
+            previous_keys = current_keys
+
+            if pane["scrollTop"] + pane["clientHeight"] >= pane["scrollHeight"]:
+                return
+            # Step one viewport down, keeping a small overlap so no row is skipped
+            scroll_top = pane["scrollTop"] + max(1, int(pane["clientHeight"] * 0.9))
+
+    def _row_rendered_at(self, scroll_top, key, settle=0.4):
+        """Whether the row with `key` is rendered with the chat list scrolled to `scroll_top`."""
+        if not self._driver.execute_script(self._SCROLL_PANE_JS, scroll_top):
+            return False
+        time.sleep(settle)
+        return any(row.get("key") == key for row in self._driver.execute_script(self._SIDEBAR_ROWS_JS) or [])
+
+    def scrape_all_data(self, state=None, max_chats=10, resume=False, on_chat=None):
         """
-        Scrapes data from the top 10 chats.
-        Returns a dictionary: {chat_name: [messages]}
+        Scrapes new messages from the chat list, up to `max_chats` chats (None for all).
+        If a ScrapeState is given, only chats whose sidebar row changed since the
+        last run are opened, and only bubbles newer than the stored mark are read.
+        With `resume`, a crawl interrupted earlier continues from its checkpoint.
+        If `on_chat(chat_name, messages)` is given, messages are handed over per chat
+        instead of being collected, which keeps long crawls at constant memory.
+        Returns a dictionary: {chat_name: [new messages]}
         """
         if not self.is_logged_in():
              return {}
 
+        checkpoint = state.load_checkpoint() if (state and resume) else None
+        if checkpoint and not self._row_rendered_at(checkpoint["scroll_top"], checkpoint["last_chat"]):
+            # The chat moved (new messages reorder the list): skipping up to it would skip
+            # unrelated chats, so walk the whole list again
+            _LOGGER.info("Crawl checkpoint chat not found where it was, scanning from the top")
+            checkpoint = None
+        start_scroll = checkpoint["scroll_top"] if checkpoint else 0
+        skip_until = checkpoint["last_chat"] if checkpoint else None
+
         data = {}
+        visited = 0
+        opened_chats = 0
+        previous = None
+        # Durations of the browser steps per opened chat, for the gateway's metrics
+        step_seconds = {"open_chat": [], "read_messages": [], "save_state": []}
+        started = time.monotonic()
         try:
-            # Get the list of chats in the sidebar
-            # The selector for chat items in the list. This is fragile.
-            # Assuming a generic container for now.
-            # A better approach is to use keyboard navigation or specific aria-labels.
-            # For this prototype, we'll try to find elements with a specific class or structure.
-            # WhatsApp Web uses virtual list, so only visible chats are in DOM.
-            
-            # Let's try to find chat rows.
-            chat_row_selector = 'div[role="listitem"]' # Common for WA Web
-            chat_rows = self._driver.find_elements(By.CSS_SELECTOR, chat_row_selector)
-            
-            # We take only top 10 to be fast
-            for i in range(min(10, len(chat_rows))):
+            for row, scroll_top in self.iter_sidebar_rows(start_scroll):
+                if max_chats is not None and visited >= max_chats:
+                    break
+                chat_title = row["title"]
+                if skip_until and scroll_top == start_scroll:
+                    # Rows up to and including the checkpointed chat were done last time
+                    if row["key"] == skip_until:
+                        skip_until = None
+                    continue
+                visited += 1
+                if resume and state and previous and visited % 10 == 0:
+                    state.save_checkpoint(*previous)
+                previous = (row["key"], scroll_top)
+
+                mark = None
+                if state:
+                    # Marks saved before rows had a data-id key are found by title, once
+                    mark = state.get(row["key"]) or (state.get(chat_title) if row["key"] != chat_title else None)
+                if mark and mark["preview"] == row["preview"] and mark["unread"] == row["unread"]:
+                    continue # Nothing changed in this chat since the last run
+
                 try:
-                    # We need to re-find elements because DOM updates on click
-                    chat_rows = self._driver.find_elements(By.CSS_SELECTOR, chat_row_selector)
-                    row = chat_rows[i]
-                    
-                    # Click to open
-                    row.click()
+                    step_started = time.monotonic()
+                    if not self._driver.execute_script(self._CLICK_ROW_JS, row["key"]):
+                        continue
                     time.sleep(1) # Wait for chat to load
-                    
-                    # Get Chat Title
-                    # This selector is for the header title
-                    header_title_selector = 'header span[title]'
-                    try:
-                        header_element = self._driver.find_element(By.CSS_SELECTOR, header_title_selector)
-                        chat_title = header_element.get_attribute("title")
-                    except:
-                        chat_title = f"Unknown_Chat_{i}"
-
-                    # Scrape messages
-                    message_selector = '.message-in, .message-out'
-                    messages = self._driver.find_elements(By.CSS_SELECTOR, message_selector)
-                    
-                    parsed_messages = []
-                    for msg in messages[-20:]: # Get last 20 messages
-                        try:
-                            text_element = msg.find_element(By.CSS_SELECTOR, '.copyable-text')
-                            meta_data = text_element.get_attribute('data-pre-plain-text')
-                            text = text_element.text
-                            parsed_messages.append(f"{meta_data} {text}")
-                        except:
-                            pass
-                    
-                    data[chat_title] = parsed_messages
-                    _LOGGER.info(f"Scraped {len(parsed_messages)} messages from {chat_title}")
+                    step_seconds["open_chat"].append(time.monotonic() - step_started)
+
+                    step_started = time.monotonic()
+                    parsed_messages = self._read_new_messages(mark["last_hash"] if mark else None)
+                    step_seconds["read_messages"].append(time.monotonic() - step_started)
+                    opened_chats += 1
+                    if parsed_messages:
+                        if on_chat:
+                            on_chat(chat_title, parsed_messages)
+                        else:
+                            data[chat_title] = parsed_messages
+                    _LOGGER.info(f"Scraped {len(parsed_messages)} new messages from {chat_title}")
+
+                    if state:
+                        step_started = time.monotonic()
+                        # Opening the chat clears its unread badge, so remember the row as it looks now
+                        opened = next((r for r in self._driver.execute_script(self._SIDEBAR_ROWS_JS) or []
+                                       if r.get("key") == row["key"]), row)
+                        newest = parsed_messages[-1] if parsed_messages else None
+                        state.save(
+                            row["key"],
+                            chat_title,
+                            opened["preview"],
+                            opened["unread"],
+                            newest.split("]")[0].lstrip("[") if newest else (mark or {}).get("last_timestamp"),
+                            message_hash(newest) if newest else (mark or {}).get("last_hash"),
+                        )
+                        step_seconds["save_state"].append(time.monotonic() - step_started)
 
                 except Exception as inner_e:
-                    _LOGGER.error(f"Error scraping chat index {i}: {inner_e}")
+                    _LOGGER.error(f"Error scraping chat {chat_title}: {inner_e}")
                     continue
+            else:
+                # The whole list was walked, so the next crawl starts from the top
+                if resume and state:
+                    state.clear_checkpoint()
 
         except Exception as e:
             _LOGGER.error(f"Error in scrape_all_data: {e}")
-        
+
+        elapsed = time.monotonic() - started
+        self.last_crawl_stats = {
+            "chats": visited,
+            "opened": opened_chats,
+            "seconds": elapsed,
+            "chats_per_minute": visited * 60 / elapsed if elapsed else 0,
+            "step_seconds": step_seconds,
+        }
+        _LOGGER.info(f"Crawled {visited} chats in {elapsed:.1f}s ({self.last_crawl_stats['chats_per_minute']:.0f} chats/min)")
         return data
 
+    def _debug_screenshot(self, filename):
+        """Screenshots cost a full page render and disk I/O, so only take them in debug mode."""
+        if self._debug and self._driver:
+            try:
+                self._driver.save_screenshot(filename)
+            except Exception as e:
+                _LOGGER.warning(f"Failed to save screenshot {filename}: {e}")
+
+    def resource_usage(self):
+        """
+        RSS and CPU time of chromedriver plus every browser process it started.
+        Also updates `peak_usage`. Returns None if the browser is not running.
+        """
+        if not self._driver:
+            return None
+        try:
+            usage = process_tree_usage(self._driver.service.process.pid)
+        except AttributeError:
+            return None
+        if usage:
+            self.peak_usage["rss_bytes"] = max(self.peak_usage["rss_bytes"], usage["rss_bytes"])
+            self.peak_usage["cpu_seconds"] = max(self.peak_usage["cpu_seconds"], usage["cpu_seconds"])
+        return usage
+
+    _LOGIN_SNAPSHOT_JS = """
+        if (document.querySelector('#side')) return {logged_in: true, qr: null};
+        const canvas = document.querySelector('canvas');
+        return {logged_in: false, qr: canvas ? canvas.toDataURL('image/png').substring(22) : null};
+    """
+
+    def login_snapshot(self):
+        """
+        Login state and the QR code currently on screen, read in one round trip.
+        Returns (status, qr_base64): status is "logged_in", "qr_code" or "loading".
+        """
+        if not self._driver:
+            return "not_started", None
+        snapshot = self._driver.execute_script(self._LOGIN_SNAPSHOT_JS) or {}
+        if snapshot.get("logged_in"):
+            return "logged_in", None
+        if snapshot.get("qr"):
+            return "qr_code", snapshot["qr"]
+        return "loading", None
+
     def is_logged_in(self):
         """
         Checks if the user is logged in.